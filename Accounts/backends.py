@@ -0,0 +1,32 @@
+"""
+Authentication backend for the Accounts app.
+
+Almost every page shows the user's name, profile picture and coins in the
+navbar, so the profile is loaded with the user in one query when the session
+is read, instead of in a second query the first time it is used.
+
+Author:
+    Lewis Farley (lf507@exeter.ac.uk)
+"""
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+UserModel = get_user_model()
+
+
+class ProfileBackend(ModelBackend):
+    """
+    ModelBackend that joins the user's profile when loading the logged in
+    user for a request.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+
+    def get_user(self, user_id):
+        try:
+            user = UserModel._default_manager.select_related("profile").get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
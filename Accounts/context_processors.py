@@ -0,0 +1,17 @@
+"""
+Template context processors for the Accounts app.
+
+Author:
+    Lewis Farley (lf507@exeter.ac.uk)
+"""
+
+
+def userinfo(request):
+    """
+    Adds the logged in user's navbar details to every template as
+    `userinfo`, reusing the copy UserInfoMiddleware keeps on the request.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    return {"userinfo": getattr(request, "userinfo", None)}
@@ -0,0 +1,99 @@
+"""
+Management command to time how long it takes to sign users up.
+
+It signs up the same number of users three ways and reports the time and
+queries each takes per user:
+    - Row by row, as signup used to: saving the user so its signals create
+      the profile and score, then saving each garden square on its own, all
+      in autocommit mode
+    - With provision_users, one user per transaction as the signup view does
+    - With provision_users, the whole cohort in one transaction as an
+      import at the start of term would
+
+Every user gets the same precomputed password hash so the timings are of the
+database work alone; hashing a password costs the same whichever way the user
+is saved. The users created are deleted again at the end.
+
+Usage:
+    python manage.py benchmark_signup [--users N]
+
+Author:
+    Lewis Farley (lf507@exeter.ac.uk)
+"""
+
+import itertools
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from Accounts.utils import provision_users
+from Garden.models import garden, gardenSquare
+
+# Prefix of the usernames the benchmark creates, so they can be cleaned up
+USERNAME_PREFIX = "signup-benchmark-"
+
+
+class Command(BaseCommand):
+    """
+    Signs users up row by row, one per transaction and as one cohort and
+    reports how long each takes.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    help = "Time signing users up row by row against the bulk provisioning pipeline"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100,
+                            help="Number of users to sign up each way")
+
+    def handle(self, *args, **options):
+        n = options["users"]
+        if n < 1:
+            raise CommandError("--users must be positive")
+        if User.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError(f"Users starting {USERNAME_PREFIX} already exist, "
+                               "delete them before benchmarking")
+
+        password = make_password("benchmark")
+        counter = itertools.count(1)
+
+        def new_users():
+            return [User(username=f"{USERNAME_PREFIX}{next(counter)}",
+                         first_name="Signup", last_name="Benchmark", password=password)
+                    for _ in range(n)]
+
+        try:
+            self.report("Row by row", n, lambda: [self.save_row_by_row(u) for u in new_users()])
+            self.report("Pipeline, one user per transaction", n,
+                        lambda: [provision_users([u]) for u in new_users()])
+            self.report("Pipeline, whole cohort in one transaction", n,
+                        lambda: provision_users(new_users()))
+        finally:
+            User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+    @staticmethod
+    def save_row_by_row(user):
+        """
+        Sign a user up the way signup used to, one INSERT per row.
+        """
+        user.save()
+        g = garden.objects.create(userID=user)
+        for i in range(g.size**2):
+            gardenSquare.objects.create(gardenID=g, squareID=i)
+
+    def report(self, label, n, sign_up):
+        """
+        Run one way of signing up and print the time and queries per user.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            sign_up()
+            elapsed = time.perf_counter() - start
+        self.stdout.write(f"{label}: {elapsed * 1000 / n:.2f} ms and "
+                          f"{len(queries) / n:.1f} queries per user "
+                          f"({elapsed:.2f} s for {n})")
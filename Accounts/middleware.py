@@ -0,0 +1,32 @@
+"""
+Middleware for the Accounts app.
+
+UserInfoMiddleware gives every request a `userinfo` attribute holding the
+username, profile picture and coins shown in the navbar. It is only built
+the first time it is used and then kept for the rest of the request, so the
+views, the templates and the navbar all share the one copy.
+
+Author:
+    Lewis Farley (lf507@exeter.ac.uk)
+"""
+
+from django.utils.functional import SimpleLazyObject
+
+from .utils import get_user_info
+
+
+class UserInfoMiddleware:
+    """
+    Sets request.userinfo to the navbar details of the logged in user, or
+    None for anonymous users. Must come after AuthenticationMiddleware.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.userinfo = SimpleLazyObject(lambda: get_user_info(request.user))
+        return self.get_response(request)
@@ -1,7 +1,10 @@
 """
 This module provides the signals for the user to create or update their profile:
+    - `track_user_names` : This function records the user's names when it
+    is loaded
     - `create_or_update_profile` : This function creates or updates the
-    user profile when the user is created or updated
+    user profile when the user is created or updated, and marks the cached
+    leaderboard as stale when the username changes
     - `post_save` : This signal is sent when a model's `save()` method is called.
     - `receiver` : This decorator is used to connect a signal to a
     receiver function.
@@ -13,27 +16,59 @@ author:
     - Ethan Sweeney (es1052@exeter.ac.uk)
 """
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_init, post_save
 from django.dispatch import receiver
 
-from leaderboards.models import UserEarntCoins
+from leaderboards.cache import invalidate_leaderboard
 from .models import Profile
 
 #pylint: disable=too-few-public-methods
 # pylint: disable=no-member
 # pylint: disable=unused-argument
 
+# User fields copied onto the profile
+PROFILE_NAME_FIELDS = ("first_name", "last_name")
+
+
+def _snapshot_names(instance):
+    """
+    Records the user's username and names as last read from or written to
+    the database, leaving out any that were deferred.
+    """
+    instance._saved_names = {field: instance.__dict__[field]
+                             for field in ("username", *PROFILE_NAME_FIELDS)
+                             if field in instance.__dict__}
+
+
+@receiver(post_init, sender=User)
+def track_user_names(sender, instance, **kwargs):
+    """
+    Takes a snapshot of the user's names when it is loaded, so a later save
+    can tell which of them changed.
+    Attributes:
+        instance : User : The instance of the User model
+    author:
+        - Lewis Farley (lf507@exeter.ac.uk)
+    """
+    _snapshot_names(instance)
+
+
 @receiver(post_save, sender=User)
-def create_or_update_profile(sender, instance, created, **kwargs):
+def create_or_update_profile(sender, instance, created, update_fields=None, **kwargs):
     """
 
     This function creates or updates the user profile when the user is created or updated.
     It is connected to the `post_save` signal of the `User` model.
     If the user is created, it creates a new profile for the user.
-    If the user is updated, it updates the existing profile for the user.
+    If the user is updated, only the names that changed since the user was
+    loaded are written to the profile, in one UPDATE without reading the
+    profile first. Saves that cannot have changed a name, like the
+    last_login update made on every login, write nothing. A changed username
+    also marks the cached leaderboard as stale, as it is shown there.
     Attributes:
         instance : User : The instance of the User model
         created : bool : A boolean value indicating if the user is created
+        update_fields : frozenset : The fields saved, or None for every field
     """
     if created:
         Profile.objects.create(
@@ -41,36 +76,23 @@ def create_or_update_profile(sender, instance, created, **kwargs):
             first_name=instance.first_name,
             last_name=instance.last_name
         )
-    else:
-        # Update profile fields if User model is updated
-        instance.profile.first_name = instance.first_name
-        instance.profile.last_name = instance.last_name
-        instance.profile.save()
-
-@receiver(pre_save, sender=Profile)
-def track_coin_addition(sender, instance, **kwargs):
-    """Detects when number_of_coins increases and creates a new instance of 
-    UserEarntCoins for the benefit of the leaderboard.
-    Author: Lewis Farley (lf507@exeter.ac.uk)
-    """
-    if instance.pk:  # Check if it's an update (not a new object)
-        previous = Profile.objects.get(pk=instance.pk)
-        if instance.number_of_coins > previous.number_of_coins:
-            added_amount = instance.number_of_coins - previous.number_of_coins
-            coin_added(instance, added_amount)
-def coin_added(instance, added_amount):
-    """
-        Creates a new instance of UserEarntCoins when coins are added to a user's profile.
-
-        This function is called when the number_of_coins attribute of a Profile instance increases.
-        It creates a new UserEarntCoins object to track the added coins for leaderboard purposes.
-
-        Args:
-            instance (Profile): The Profile instance where coins were added.
-            added_amount (int): The amount of coins added to the profile.
+        _snapshot_names(instance)
+        return
 
-        Author:
-            Lewis Farley (lf507@exeter.ac.uk)
-        """
-    e = UserEarntCoins.objects.create(user=instance.user, score=added_amount)
-    e.save()
+    saved = {field: instance.__dict__[field] for field in ("username", *PROFILE_NAME_FIELDS)
+             if field in instance.__dict__
+             and (update_fields is None or field in update_fields)}
+    previous = getattr(instance, "_saved_names", {})
+    changed = {field: value for field, value in saved.items()
+               if previous.get(field, object()) != value}
+    instance._saved_names = previous | saved
+    if "username" in changed:
+        invalidate_leaderboard()
+    names = {field: value for field, value in changed.items() if field in PROFILE_NAME_FIELDS}
+    if names:
+        # Only the names are written, so a stale profile held by the user
+        # cannot overwrite coins awarded elsewhere
+        Profile.objects.filter(user=instance).update(**names)
+        if User.profile.related.is_cached(instance):
+            for field, value in names.items():
+                setattr(instance.profile, field, value)
@@ -9,17 +9,36 @@ including model tests, form validations, and view behaviors. Tests cover:
     - Friend request system
     - Account deletion
     - Garden creation on signup
+    - Awarding and spending coins
+    - Provisioning and importing users in bulk
+    - The navbar's user info
 """
 
+import os
+import re
+import shutil
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
 from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core import mail
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from EcoWorld.models import card, cardRarity, ownsCard
 from Garden.models import garden, gardenSquare
+from leaderboards.models import UserEarntCoins, UserScore
 from .forms import SignUpForm, ProfileUpdateForm
 from .models import Profile, FriendRequests, Friends
-from .utils import create_owns_db, create_garden
+from .utils import award_coins, get_user_info, provision_users, spend_coins
 #pylint: disable=too-few-public-methods
 # pylint: disable=no-member
 
@@ -136,10 +155,30 @@ class testSignupForm(TestCase):
         user=User.objects.get(username='testuser')
         g = garden.objects.get(userID=user)
         self.assertEqual(g.userID, user)
+
         squares = gardenSquare.objects.filter(gardenID=g)
         self.assertEqual(len(squares), g.size*g.size)
         self.assertEqual(g.size, settings.GARDEN_SIZE)
 
+    def test_signup_creates_no_inventory(self):
+        '''
+        Test that signing up does not create an inventory row for every card,
+        as the inventory only holds cards the user owns
+        '''
+        form_data = {
+            'first_name': 'John',
+            'last_name': 'Doe',
+            'username': 'testuser',
+            'email': 'testuser@gmail.com',
+            'password1':'P@ssword123',
+            'password2':'P@ssword123'
+        }
+        rarity = cardRarity.objects.create(title='common')
+        card.objects.create(title='log', rarity=rarity)
+        self.client.post('/accounts/signup/', form_data)
+        user = User.objects.get(username='testuser')
+        self.assertFalse(ownsCard.objects.filter(user=user).exists())
+
 
 
 class testProfileForm(TestCase):
@@ -226,6 +265,52 @@ class LoginTestCase(TestCase):
         # Login page should re-render with errors
         self.assertFalse(response.wsgi_request.user.is_authenticated)
         # User should not be authenticated
+
+    def test_session_from_model_backend_kept(self):
+        """Test a session logged in before ProfileBackend was added is still signed in"""
+        self.client.force_login(self.user, backend="django.contrib.auth.backends.ModelBackend")
+        response = self.client.get(reverse('user_info'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.user, self.user)
+
+    def test_login_uses_profile_backend(self):
+        """Test new logins are stored under ProfileBackend"""
+        self.client.post(reverse('login'), {
+            'username': self.username,
+            'password': self.password
+        })
+        self.assertEqual(self.client.session[BACKEND_SESSION_KEY],
+                         "Accounts.backends.ProfileBackend")
+
+    def test_login_does_not_touch_profile(self):
+        """Test the last_login update made on login does not read or write the profile"""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('login'), {
+                'username': self.username,
+                'password': self.password
+            })
+        self.assertFalse([q for q in queries if "Accounts_profile" in q["sql"]])
+        # user, session exists check, session insert, last_login update and session
+        # update, with a savepoint around each session write
+        self.assertEqual(len(queries), 9)
+
+    def test_name_change_syncs_profile(self):
+        """Test only the names that changed are written to the profile"""
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = "Changed"
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        profile_writes = [q["sql"] for q in queries if "Accounts_profile" in q["sql"]]
+        self.assertEqual(len(profile_writes), 1)
+        self.assertIn('"first_name"', profile_writes[0])
+        self.assertNotIn('"last_name"', profile_writes[0])
+        self.assertEqual(Profile.objects.get(user=self.user).first_name, "Changed")
+
+        # saving again without changes leaves the profile alone
+        with self.assertNumQueries(1):
+            user.save()
+
+
 class LogoutTestCase(TestCase):
     def setUp(self):
         """Create a test user"""
@@ -244,11 +329,10 @@ class LogoutTestCase(TestCase):
 class ProfileViewTest(TestCase):
     def setUp(self):
         """Set up a test user and profile"""
-        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.user = provision_users([User(username='testuser',
+                                          password=make_password('password123'))])[0]
         self.client.login(username='testuser', password='password123')
         self.profile = Profile.objects.get(user=self.user)
-        create_owns_db(self.user)
-        create_garden(self.user)
 
     def test_redirect_if_not_logged_in(self):
         """Test that an unauthenticated user is redirected to the login page"""
@@ -374,3 +458,303 @@ class DeleteAccountViewTest(TestCase):
         # Should redirect to login
         self.assertEqual(response.status_code, 302)
         self.assertTrue(response.url.startswith("/?next=/accounts/delete-account/"))
+
+
+class CoinLedgerTest(TestCase):
+    """Tests for award_coins and spend_coins"""
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+
+    def test_award_records_source(self):
+        """Awarding coins updates the balance and writes one ledger row"""
+        award_coins(self.user, 30, UserEarntCoins.DRINK)
+        self.assertEqual(Profile.objects.get(user=self.user).number_of_coins, 30)
+        entry = UserEarntCoins.objects.get(user=self.user)
+        self.assertEqual((entry.score, entry.source), (30, UserEarntCoins.DRINK))
+
+    def test_award_updates_loaded_profile(self):
+        """A profile already loaded sees the award and saving it keeps the coins"""
+        profile = self.user.profile
+        award_coins(self.user, 30)
+        self.assertEqual(profile.number_of_coins, 30)
+        other = User.objects.get(pk=self.user.pk)
+        award_coins(other, 5)
+        # saving a stale copy of the user does not overwrite the balance
+        self.user.first_name = "Test"
+        self.user.save()
+        self.assertEqual(Profile.objects.get(user=self.user).number_of_coins, 35)
+
+    def test_profile_save_has_no_extra_query(self):
+        """Saving a profile no longer reads it back first"""
+        profile = self.user.profile
+        profile.bio = "hello"
+        with self.assertNumQueries(1):
+            profile.save()
+
+    def test_spend(self):
+        """Coins are only spent when the user has enough"""
+        award_coins(self.user, 50)
+        self.assertFalse(spend_coins(self.user, 60))
+        self.assertTrue(spend_coins(self.user, 50))
+        self.assertFalse(spend_coins(self.user, 1))
+        self.assertEqual(Profile.objects.get(user=self.user).number_of_coins, 0)
+        self.assertEqual(UserEarntCoins.objects.filter(user=self.user).count(), 1)
+
+
+class ProvisionUsersTest(TestCase):
+    """
+    Tests the signup pipeline creates everything a new user needs in a fixed
+    number of queries
+    Author: Lewis Farley (lf507@exeter.ac.uk)
+    """
+    def setUp(self):
+        rarity = cardRarity.objects.create(title="common")
+        self.log = card.objects.create(title="log", rarity=rarity)
+
+    def new_users(self, n, start=0):
+        return [User(username=f"student{i}", first_name="First", last_name=f"Last{i}")
+                for i in range(start, start + n)]
+
+    def test_creates_everything(self):
+        """Each user gets a profile, score and a full garden"""
+        user = provision_users(self.new_users(1))[0]
+        self.assertIsNotNone(user.pk)
+        profile = Profile.objects.get(user=user)
+        self.assertEqual((profile.first_name, profile.last_name), ("First", "Last0"))
+        self.assertEqual(profile.number_of_coins, 0)
+        self.assertEqual(UserScore.objects.get(user=user).score, 0)
+        g = garden.objects.get(userID=user)
+        self.assertEqual(sorted(gardenSquare.objects.filter(gardenID=g)
+                                .values_list("squareID", flat=True)),
+                         list(range(settings.GARDEN_SIZE**2)))
+        self.assertFalse(ownsCard.objects.filter(user=user).exists())
+
+    @override_settings(STARTER_CARDS={"log": 2})
+    def test_starter_cards(self):
+        """Every new user gets the starter cards"""
+        users = provision_users(self.new_users(3))
+        for user in users:
+            self.assertEqual(ownsCard.objects.get(user=user, card=self.log).quantity, 2)
+
+    @override_settings(STARTER_CARDS={"log": 2})
+    def test_query_count_does_not_depend_on_users(self):
+        """A cohort that fits in one batch costs the same queries as one user"""
+        # savepoint, users, profiles, scores, gardens, squares, starter cards,
+        # starter inventory, leaderboard version, release savepoint
+        with self.assertNumQueries(10):
+            provision_users(self.new_users(1))
+        with self.assertNumQueries(10):
+            provision_users(self.new_users(10, start=1))
+        self.assertEqual(Profile.objects.count(), 11)
+
+    def test_signup_view(self):
+        """Signing up through the view provisions the user and logs them in"""
+        response = self.client.post(reverse("signup"), {
+            'first_name': 'John', 'last_name': 'Doe', 'username': 'newuser',
+            'email': 'newuser@gmail.com', 'password1': 'P@ssword123', 'password2': 'P@ssword123'
+        })
+        self.assertRedirects(response, '/ecoworld/', fetch_redirect_response=False)
+        user = User.objects.get(username='newuser')
+        self.assertTrue(user.check_password('P@ssword123'))
+        self.assertEqual(user.email, 'newuser@gmail.com')
+        self.assertEqual(Profile.objects.get(user=user).first_name, 'John')
+        self.assertTrue(UserScore.objects.filter(user=user).exists())
+        self.assertEqual(int(self.client.session['_auth_user_id']), user.pk)
+
+    def test_benchmark_command(self):
+        """The benchmark reports each way of signing up and cleans up after itself"""
+        out = StringIO()
+        call_command("benchmark_signup", "--users", "2", stdout=out)
+        self.assertEqual(out.getvalue().count("per user"), 3)
+        self.assertFalse(User.objects.filter(username__startswith="signup-benchmark-").exists())
+
+
+class UserInfoTest(TestCase):
+    """Tests for the user info shared by the navbar, the views and the API"""
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        award_coins(self.user, 25)
+        self.client.login(username="testuser", password="testpassword")
+
+    def test_user_info_api_reuses_request_user(self):
+        """The API reads the profile loaded with the user, not in a query of its own"""
+        # session and user with profile
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("user_info"))
+        self.assertEqual(response.json(), {"username": "testuser",
+                                           "pfp_url": "/media/pfps/" + self.user.profile.profile_picture,
+                                           "coins": 25})
+
+    def test_navbar_rendered_from_userinfo(self):
+        """Pages render the navbar's username and coins without fetching them"""
+        response = self.client.get(reverse("EcoWorld:dashboard"))
+        self.assertEqual(response.context["userinfo"]["coins"], 25)
+        self.assertContains(response, '<span id="username" class="navbar-username">testuser</span>',
+                            html=True)
+        self.assertContains(response, '<span id="coins">25</span>', html=True)
+
+    def test_anonymous_has_no_userinfo(self):
+        """Logged out users get no user info rather than an error"""
+        self.client.logout()
+        response = self.client.get(reverse("user_info"))
+        self.assertEqual(response.status_code, 302)
+        self.assertIsNone(get_user_info(response.wsgi_request.user))
+
+    def test_user_info_etag(self):
+        """A matching If-None-Match gets a 304 until the user's coins change"""
+        response = self.client.get(reverse("user_info"))
+        etag = response.headers["ETag"]
+        self.assertIn("no-cache", response.headers["Cache-Control"])
+        self.assertIn("private", response.headers["Cache-Control"])
+        response = self.client.get(reverse("user_info"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        spend_coins(self.user, 5)
+        response = self.client.get(reverse("user_info"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["coins"], 20)
+
+    def test_summary_follows_database(self):
+        """The summary reflects coins earned and profiles saved on the next request"""
+        self.assertEqual(get_user_info(self.user)["coins"], 25)
+        award_coins(self.user, 10)
+        self.assertEqual(get_user_info(User.objects.get(pk=self.user.pk))["coins"], 35)
+        self.client.post(reverse("profile"), {"bio": "", "profile_picture": "pfp2.png"})
+        self.assertEqual(get_user_info(User.objects.get(pk=self.user.pk))["pfp_url"],
+                         "/media/pfps/pfp2.png")
+
+    def test_summary_not_shared_with_reused_id(self):
+        """A deleted account's summary is not served to a new one with its id"""
+        get_user_info(self.user)
+        user_id = self.user.pk
+        self.user.delete()
+        new_user = User.objects.create_user(username="newuser", password="testpassword", id=user_id)
+        self.assertEqual(get_user_info(new_user)["username"], "newuser")
+
+
+    def test_change_from_another_process_shown(self):
+        """Coins changed without this process's signals show on the next request"""
+        etag = self.client.get(reverse("user_info")).headers["ETag"]
+        Profile.objects.filter(user=self.user).update(number_of_coins=99)
+        response = self.client.get(reverse("user_info"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["coins"], 99)
+        response = self.client.get(reverse("EcoWorld:dashboard"))
+        self.assertContains(response, '<span id="coins">99</span>', html=True)
+
+class ImportStudentsTest(TestCase):
+    """
+    Tests importing students from a CSV in batches
+    Author: Lewis Farley (lf507@exeter.ac.uk)
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def write_csv(self, rows, header="username,email,first_name,last_name,password"):
+        path = os.path.join(self.dir, "students.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join([header] + rows) + "\n")
+        return path
+
+    def students(self, n):
+        return [f"student{i},student{i}@exeter.ac.uk,First,Last{i}," for i in range(n)]
+
+    def run_import(self, path, *args):
+        out = StringIO()
+        call_command("import_students", path, *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_imports_students(self):
+        """Every student is created with a profile and garden, reporting each batch"""
+        path = self.write_csv(self.students(5) + ["teacher,t@exeter.ac.uk,Ann,Smith,P@ssword123"])
+        out = self.run_import(path, "--batch-size", "4")
+        self.assertIn("Batch 1:", out)
+        self.assertIn("Batch 2:", out)
+        self.assertIn("rows/s", out)
+        self.assertEqual(User.objects.count(), 6)
+        self.assertEqual(Profile.objects.get(user__username="student3").last_name, "Last3")
+        self.assertEqual(garden.objects.count(), 6)
+        self.assertTrue(User.objects.get(username="student0").has_usable_password())
+        self.assertTrue(User.objects.get(username="teacher").check_password("P@ssword123"))
+
+    def test_skips_existing_repeated_and_invalid(self):
+        """Taken, repeated, blank and invalid usernames are skipped"""
+        User.objects.create_user(username="student1")
+        path = self.write_csv(self.students(3) + ["student2,,,,", ",,,,", "bad name!,,,,"])
+        out = self.run_import(path)
+        self.assertIn("2 created, 4 skipped", out)
+        self.assertEqual(User.objects.count(), 3)
+
+    def test_random_password_hashed_once_per_batch(self):
+        """Students without a password share one random password per batch"""
+        path = self.write_csv(self.students(5) + ["teacher,t@exeter.ac.uk,Ann,Smith,P@ssword123"])
+        with patch("Accounts.management.commands.import_students.make_password",
+                   wraps=make_password) as hasher:
+            self.run_import(path, "--batch-size", "3")
+        # one random password for each of the two batches and the teacher's own
+        self.assertEqual(hasher.call_count, 3)
+        self.assertFalse(User.objects.get(username="student0").check_password(""))
+
+    def test_skips_students_who_could_not_log_in(self):
+        """A row with neither a password nor an email is skipped"""
+        path = self.write_csv(["nomail,,Ann,Smith,", "haspass,,Bob,Jones,P@ssword123"])
+        out = self.run_import(path)
+        self.assertIn("1 created, 1 skipped", out)
+        self.assertFalse(User.objects.filter(username="nomail").exists())
+
+    def test_imported_student_can_reset_password(self):
+        """A student imported without a password can set one with the reset page"""
+        self.run_import(self.write_csv(self.students(1)))
+        response = self.client.post(reverse("password_reset"), {"email": "student0@exeter.ac.uk"})
+        self.assertRedirects(response, reverse("password_reset_done"))
+        self.assertEqual(len(mail.outbox), 1)
+
+        link = re.search(r"https?://[^/]+(/\S+)", mail.outbox[0].body).group(1)
+        response = self.client.get(link)
+        self.assertEqual(response.status_code, 302)
+        response = self.client.post(response.url, {"new_password1": "N3wP@ssword!",
+                                                   "new_password2": "N3wP@ssword!"})
+        self.assertRedirects(response, reverse("password_reset_complete"))
+        self.assertTrue(self.client.login(username="student0", password="N3wP@ssword!"))
+
+    def test_invites_students_without_password(self):
+        """--invite-domain emails a set password link to each student without a password"""
+        path = self.write_csv(self.students(3) + ["teacher,t@exeter.ac.uk,Ann,Smith,P@ssword123"])
+        out = self.run_import(path, "--batch-size", "2", "--invite-domain", "ecoworld.example")
+        self.assertIn("Emailed 3 students", out)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox),
+                         [f"student{i}@exeter.ac.uk" for i in range(3)])
+
+        link = re.search(r"https://ecoworld\.example(/\S+)", mail.outbox[0].body).group(1)
+        response = self.client.get(link)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.endswith("/set-password/"))
+
+    def test_restart_after_failure(self):
+        """A failed batch is rolled back and running again finishes the import"""
+        path = self.write_csv(self.students(6))
+        real_provision = provision_users
+        calls = []
+
+        def fail_second_batch(users):
+            calls.append(len(users))
+            if len(calls) == 2:
+                raise RuntimeError("database went away")
+            return real_provision(users)
+
+        with patch("Accounts.management.commands.import_students.provision_users",
+                   side_effect=fail_second_batch):
+            with self.assertRaises(RuntimeError):
+                self.run_import(path, "--batch-size", "3")
+        self.assertEqual(User.objects.count(), 3)
+
+        out = self.run_import(path, "--batch-size", "3")
+        self.assertIn("3 created, 3 skipped", out)
+        self.assertEqual(User.objects.count(), 6)
+        self.assertEqual(garden.objects.count(), 6)
+
+    def test_requires_username_column(self):
+        """A CSV without a username column is rejected"""
+        path = self.write_csv(["a@exeter.ac.uk"], header="email")
+        with self.assertRaises(CommandError):
+            self.run_import(path)
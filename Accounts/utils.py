@@ -1,51 +1,169 @@
 """
 This file contains utility functions for the Accounts app.
 Functions:
-    - createGarden(user): Creates a garden for the user.
+    - provision_users(users): Creates users with their profile, garden and
+        starter inventory in one transaction.
+    - award_coins(user, amount, source): Adds coins to a user and records them
+        for the leaderboard.
+    - spend_coins(user, amount): Takes coins from a user if they have enough.
+    - get_user_summary(user): The navbar details of a user with a hash of
+        them for use as an ETag.
+    - get_user_info(user): The username, profile picture and coins shown in
+        the navbar.
 author:
     - Lewis Farley (lf507@exeter.ac.uk)
 
 """
 
+import hashlib
+import json
+
 from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
 
 from EcoWorld.models import card, ownsCard
 from Garden.models import garden, gardenSquare
+from leaderboards.cache import invalidate_leaderboard
+from leaderboards.models import UserEarntCoins, UserScore
+from .models import Profile
 
 #pylint: disable=too-few-public-methods
 # pylint: disable=no-member
 
-def create_garden(user):
+def provision_users(users, batch_size=500):
     """
-    This function creates a garden for the user.
-    It creates a garden object and garden squares for the user.
+    Creates new users along with everything a user needs to play: their
+    profile, leaderboard score, garden and its squares, and the starter cards
+    in settings.STARTER_CARDS.
+    Every table is filled with one bulk insert per batch, all in a single
+    transaction, so signing up a user takes a fixed handful of queries and
+    a whole cohort holds the database's write lock once rather than once
+    per row.
+    The users are inserted with bulk_create, so their post_save signals are
+    not sent; everything those signals would create is created here instead.
     Attributes:
-        user : User : The user for whom the garden is created.
+        users : list : Unsaved User objects, with their passwords already set.
+        batch_size : int : The most rows to insert in one query.
     Returns:
-        g : Garden : The garden created for the user.
+        list : The saved users, in the order given.
     author:
         - Lewis Farley (lf507@exeter.ac.uk)
     """
-    # Create a garden for the user
-    g = garden(userID=user)
-    g.save()
-    for i in range(settings.GARDEN_SIZE**2):
-        g_s = gardenSquare(gardenID=g, squareID=i)
-        g_s.save()
+    with transaction.atomic():
+        users = User.objects.bulk_create(users, batch_size=batch_size)
+        Profile.objects.bulk_create(
+            [Profile(user=user, first_name=user.first_name, last_name=user.last_name)
+             for user in users], batch_size=batch_size)
+        UserScore.objects.bulk_create([UserScore(user=user) for user in users],
+                                      batch_size=batch_size)
+
+        gardens = garden.objects.bulk_create([garden(userID=user) for user in users],
+                                             batch_size=batch_size)
+        gardenSquare.objects.bulk_create(
+            [gardenSquare(gardenID=g, squareID=i) for g in gardens for i in range(g.size**2)],
+            batch_size=batch_size)
+
+        if settings.STARTER_CARDS:
+            starter = card.objects.filter(title__in=settings.STARTER_CARDS)\
+                .values_list("id", "title")
+            ownsCard.objects.bulk_create(
+                [ownsCard(user=user, card_id=card_id, quantity=settings.STARTER_CARDS[title])
+                 for user in users for card_id, title in starter], batch_size=batch_size)
+
+        invalidate_leaderboard()
+    return users
 
-    return g
 
+def _sync_cached_profile(user, change):
+    """
+    Applies a change in coins to the user's profile if it is already loaded,
+    so the caller sees the new balance without reading it back and a later
+    save of that profile does not write the old balance over the update.
+    """
+    if User.profile.related.is_cached(user):
+        user.profile.number_of_coins += change
 
-def create_owns_db(user):
+
+def award_coins(user, amount, source=UserEarntCoins.OTHER):
+    """
+    Adds coins to a user's balance and records them in UserEarntCoins for the
+    leaderboard, both in one transaction.
+    The balance is incremented in the database with F() so awards made at the
+    same time by different requests are never lost. Awards of no coins are
+    ignored.
+    Args:
+        user (User): The user earning the coins.
+        amount (int): The number of coins earned.
+        source (str): Where the coins came from, one of UserEarntCoins.SOURCES.
+    author:
+        - Lewis Farley (lf507@exeter.ac.uk)
     """
-    Creates ownership records for all cards for a given user.
+    if amount <= 0:
+        return
+    with transaction.atomic():
+        Profile.objects.filter(user=user).update(number_of_coins=F("number_of_coins") + amount)
+        UserEarntCoins.objects.create(user=user, score=amount, source=source)
+    _sync_cached_profile(user, amount)
 
-    This function iterates over all card objects and creates an ownsCard
-    record for each card, associating it with the provided user.
 
+def spend_coins(user, amount):
+    """
+    Takes coins from a user's balance if they have enough.
+    The check and the deduction are a single conditional UPDATE, so two
+    purchases at once can never spend the same coins twice. Spending is not
+    recorded in UserEarntCoins, so it does not affect the leaderboard.
     Args:
-        user (User): The user for whom the ownership records are created.
+        user (User): The user spending the coins.
+        amount (int): The number of coins to spend.
+    Returns:
+        bool: True if the coins were taken, False if the user had too few.
+    author:
+        - Lewis Farley (lf507@exeter.ac.uk)
+    """
+    spent = Profile.objects.filter(user=user, number_of_coins__gte=amount).update(
+        number_of_coins=F("number_of_coins") - amount)
+    if spent:
+        _sync_cached_profile(user, -amount)
+    return bool(spent)
+
+
+def get_user_summary(user):
+    """
+    Gets the details of a user shown in the navbar along with a hash of them
+    for use as an ETag.
+    They are built from the profile ProfileBackend loads with the logged in
+    user, which is read afresh on every request, so this makes no queries
+    and is never out of date, whichever process changed the profile.
+    Args:
+        user (User): The logged in user.
+    Returns:
+        dict: The user's navbar details (info) and their hash (etag).
+    author:
+        - Lewis Farley (lf507@exeter.ac.uk)
+    """
+    profile = user.profile
+    info = {
+        "username": user.username,
+        "pfp_url": "/media/pfps/" + profile.profile_picture if profile.profile_picture else "",
+        "coins": profile.number_of_coins,
+    }
+    etag = hashlib.md5(json.dumps(info).encode(), usedforsecurity=False).hexdigest()
+    return {"info": info, "etag": etag}
+
+
+def get_user_info(user):
+    """
+    Gets the details of a user shown in the navbar, see get_user_summary.
+    Args:
+        user (User): The user to describe, may be anonymous.
+    Returns:
+        dict: The username, profile picture url and coins of the user, or None
+            if they are not logged in.
+    author:
+        - Lewis Farley (lf507@exeter.ac.uk)
     """
-    for cards in card.objects.all():
-        o_card = ownsCard(card_id=cards.id, user_id=user.id)
-        o_card.save()
+    if not user.is_authenticated:
+        return None
+    return get_user_summary(user)["info"]
@@ -15,12 +15,15 @@ from django.contrib.auth.models import User
 from django.core import serializers
 from django.http import JsonResponse
 from django.shortcuts import render, redirect
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 
 from EcoWorld.models import ownsCard
 from Garden.models import garden
+from Garden.utils import get_garden_grid, get_garden_thumbnail
 from .forms import SignUpForm
 from .models import Profile
-from .utils import create_garden, create_owns_db
+from .utils import get_user_summary, provision_users
 
 #pylint: disable=too-few-public-methods
 # pylint: disable=no-member
@@ -56,12 +59,9 @@ def signup(request):
     if request.method == 'POST':
         form = SignUpForm(request.POST)
         if form.is_valid():
-            user=form.save()
-            # create garden for user
-            create_garden(user)
-            #creates cards owned by user set default as 0.
-            create_owns_db(user)
-            login(request, user)
+            # create the user with their profile and garden in one transaction
+            user = provision_users([form.save(commit=False)])[0]
+            login(request, user, backend="Accounts.backends.ProfileBackend")
             return redirect('/ecoworld/')
             # Redirect to the login page after successful registration
     else:
@@ -84,7 +84,8 @@ def profile(request):
         - Ethan Sweeney (es1052@exeter.ac.uk)
 
     """
-    profile = Profile.objects.get(user=request.user)
+    # loaded with the user by ProfileBackend
+    profile = request.user.profile
 
     # Handle the profile picture update
     if request.method == 'POST':
@@ -98,19 +99,18 @@ def profile(request):
         if profile_picture:
             profile.profile_picture = profile_picture
             # Set the selected profile picture file name
-        profile.save()
+        profile.save(update_fields=['bio', 'profile_picture'])
 
         # Redirect to the profile page after saving
         return redirect('profile')
 
     g = garden.objects.get(userID=request.user)
-    squares = g.gardensquare_set.all()
-    processed_squares = [[squares[i*g.size+j] for j in range (g.size)] for i in range (g.size)]
+    processed_squares = get_garden_grid(g)
+    placed_cards = {square.cardID_id for row in processed_squares for square in row}
 
-
-    player_inventory = ownsCard.objects.filter(user=request.user)
-    available_cards = [ card.card for card in player_inventory if card.card not in
-                       [square.cardID for square in squares]]
+    player_inventory = ownsCard.objects.filter(user=request.user).select_related('card')
+    available_cards = [ card.card for card in player_inventory if card.card_id not in
+                       placed_cards]
     serialized=json.loads(serializers.serialize('json', available_cards))
     final = [obj["fields"]|{'id':obj['pk']} for obj in serialized]
 
@@ -123,6 +123,9 @@ def profile(request):
 def user_info(request):
     """
     This view returns the user information in JSON format.
+    Pages render the navbar from the same summary, this is kept for
+    scripts that need to refresh it without reloading the page. Responses
+    carry an ETag and a matching If-None-Match gets a 304 Not Modified.
     Attributes:
         request : HttpRequest : The HTTP request object
     Returns:
@@ -130,13 +133,14 @@ def user_info(request):
     Author:
         - Lewis Farley (lf507@exeter.ac.uk)
     """
-    user_info = {
-        'username': request.user.username,
-        'pfp_url': "/media/pfps/" + request.user.profile.profile_picture
-        if request.user.profile.profile_picture else '',
-        'coins': request.user.profile.number_of_coins,
-    }
-    return JsonResponse(user_info)
+    summary = get_user_summary(request.user)
+    etag = quote_etag(summary["etag"])
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(summary["info"])
+    response.headers['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 def read_only_profile(request):
@@ -155,11 +159,10 @@ def read_only_profile(request):
     user = User.objects.get(username=username)
     user_profile = Profile.objects.get(user=user)
     g = garden.objects.get(userID=user)
-    squares = g.gardensquare_set.all()
-    processed_squares = [[squares[i * g.size + j] for j in range(g.size)]
-                        for i in range(g.size)]
+    processed_squares = get_garden_grid(g)
     return render(request, 'Accounts/profile.html',
                   {'user_profile': user_profile, 'squares': processed_squares,
+                   'thumbnail_url': get_garden_thumbnail(processed_squares),
                    'MEDIA_URL': settings.MEDIA_URL, 'size': g.size,'is_read_only':
                        True,'username':username})
 
@@ -71,6 +71,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "Accounts.middleware.UserInfoMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -89,6 +90,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "Accounts.context_processors.userinfo",
             ],
         },
     },
@@ -158,6 +160,14 @@ STATICFILES_DIRS = [
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 LOGIN_URL = '/'
+# Loads the profile with the logged in user, see Accounts.backends.
+# ModelBackend stays after it so sessions made before ProfileBackend, which
+# store ModelBackend as their backend, are not signed out. It can be removed
+# once those sessions have expired (SESSION_COOKIE_AGE, two weeks by default)
+AUTHENTICATION_BACKENDS = [
+    "Accounts.backends.ProfileBackend",
+    "django.contrib.auth.backends.ModelBackend",
+]
 LOGIN_REDIRECT_URL = "/ecoworld/"
 
 
@@ -184,3 +194,14 @@ CHALLENGE_RESET_INTERVAL = timedelta(minutes=1)
 
 
 VALUE_OF_DRINK = 100
+
+LEADERBOARD_PAGE_SIZE = 25  # The number of users in each page of the leaderboard
+LEADERBOARD_MAX_PAGE_SIZE = 100  # The most users a client can request in one page
+LEADERBOARD_AROUND_WINDOW = 5  # The number of users shown either side of the current user
+LEADERBOARD_CACHE_LOCK_TIMEOUT = timedelta(seconds=10)  # The longest one request may spend rebuilding the cached leaderboard
+LEADERBOARD_PAGE_CACHE_TIMEOUT = timedelta(minutes=10)  # How long a cached page or rank of the leaderboard is kept
+GARDEN_TOOLTIP_CACHE_TIMEOUT = timedelta(days=1)  # How long a rendered garden tooltip is kept in the cache
+GARDEN_THUMBNAIL_TILE_SIZE = 64  # The width and height in pixels of each square in a garden thumbnail
+MAX_PACKS_PER_PURCHASE = 50  # The most packs a user can buy and open at once
+STARTER_CARDS = {}  # Card title to the number of copies every new user starts with
+CATALOG_VERSION_CHECK_INTERVAL = timedelta(seconds=5)  # How often each process checks whether the cached catalogue changed
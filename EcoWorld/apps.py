@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class EcoWorldConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "EcoWorld"
+
+    def ready(self):
+        import EcoWorld.signals
@@ -0,0 +1,145 @@
+"""
+Process-local cache of the catalogue.
+
+The cards, rarities, packs, challenges and guides only hold tens of rows and
+only change when a gamekeeper edits them, yet the store, opening packs,
+merging, rotating challenges and the guides menu all read them. This module
+keeps one snapshot of them per process so those pages do not query them:
+    - `get_catalog` : The current snapshot, reloaded when the version in the
+      CatalogVersion row has changed
+    - `bump_catalog_version` : Sets a new version token, called by the
+      signals in EcoWorld/signals.py whenever a catalogue row is saved or
+      deleted
+    - `Catalog.memo` : Keeps things built from the catalogue, like the pack
+      and challenge samplers, for as long as the snapshot they came from
+
+Each process checks the version at most once every
+CATALOG_VERSION_CHECK_INTERVAL, so changes made by another process are seen
+within that time without a restart, and changes made by this process
+straight away.
+
+The cached objects are shared between requests and must not be changed.
+
+Author:
+    Lewis Farley (lf507@exeter.ac.uk)
+"""
+
+import time
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+
+from guides.models import ContentQuizPair
+from .models import CatalogVersion, card, cardRarity, challenge, pack
+
+_state = {"catalog": None, "checked": 0.0}
+
+
+class Catalog:
+    """
+    A snapshot of every catalogue table, loaded in one go.
+
+    Attributes:
+        version (str): The catalogue version token the snapshot was loaded at.
+        rarities (dict): Rarity id to rarity.
+        cards (dict): Card id to card, each with its rarity already set.
+        cards_by_rarity (dict): Rarity id to the list of its cards.
+        packs (dict): Pack id to pack, in id order.
+        challenges (dict): Challenge id to challenge.
+        guides (list): Every content-quiz pair, in id order.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    def __init__(self, version):
+        self.version = version
+        self.rarities = {r.id: r for r in cardRarity.objects.order_by("id")}
+        self.cards = {}
+        self.cards_by_rarity = {}
+        for c in card.objects.order_by("id"):
+            c.rarity = self.rarities[c.rarity_id]
+            self.cards[c.id] = c
+            self.cards_by_rarity.setdefault(c.rarity_id, []).append(c)
+        self.packs = {p.id: p for p in pack.objects.order_by("id")}
+        self.challenges = {c.id: c for c in challenge.objects.order_by("id")}
+        self.guides = list(ContentQuizPair.objects.order_by("id"))
+        self._memo = {}
+
+    def memo(self, key, build):
+        """
+        Get something built from this snapshot, building it on first use.
+
+        Args:
+            key: Anything hashable naming what is built.
+            build: Called with no arguments to build it.
+
+        Returns:
+            What build returned for this snapshot.
+        """
+        if key not in self._memo:
+            self._memo[key] = build()
+        return self._memo[key]
+
+
+def _read_version():
+    return CatalogVersion.objects.filter(pk=1).values_list("version", flat=True).first() or ""
+
+
+def get_catalog():
+    """
+    Get this process's snapshot of the catalogue, reloading it if the
+    catalogue has changed since it was loaded.
+
+    Returns:
+        Catalog: The current snapshot.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    catalog = _state["catalog"]
+    now = time.monotonic()
+    if (catalog is not None and
+            now - _state["checked"] < settings.CATALOG_VERSION_CHECK_INTERVAL.total_seconds()):
+        return catalog
+
+    # the version is read before the rows, so rows changed while loading are
+    # only ever newer than the version they are stored under
+    version = _read_version()
+    if catalog is None or catalog.version != version:
+        catalog = Catalog(version)
+        _state["catalog"] = catalog
+    _state["checked"] = now
+    return catalog
+
+
+def clear_catalog():
+    """
+    Drop this process's snapshot so the next use reloads it.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    _state["catalog"] = None
+
+
+def bump_catalog_version():
+    """
+    Mark every process's snapshot of the catalogue as stale.
+
+    Call this after changing catalogue rows without saving each one, such as
+    with a queryset update(). This process's snapshot is dropped straight
+    away and again once the surrounding transaction commits, so one reloaded
+    from uncommitted rows in the meantime is not kept. The version is a new
+    random token rather than a count, so if the transaction is rolled back
+    the next bump can never reuse the version of a snapshot loaded from the
+    rolled back rows.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    version = uuid.uuid4().hex
+    if not CatalogVersion.objects.filter(pk=1).update(version=version):
+        CatalogVersion.objects.get_or_create(pk=1, defaults={"version": version})
+    clear_catalog()
+    transaction.on_commit(clear_catalog)
@@ -6,6 +6,7 @@ It includes functionality for:
     - Challenge creation with name, description, and goals
     - Automatic handling of creation timestamps
     - Challenge worth/point assignment
+    - Challenge weighting, to give some challenges out more often
 """
 
 from django import forms
@@ -24,7 +25,12 @@ class ChallengeForm(forms.ModelForm):
         description (TextField): Detailed description of the challenge
         worth (IntegerField): Point value for completing the challenge
         goal (IntegerField): Target number for challenge completion
+        weight (IntegerField): How often the challenge is given out relative to others
     """
+    weight = forms.IntegerField(min_value=0, required=False, initial=1,
+                                help_text="How often it is given out compared with other "
+                                          "challenges, 0 to stop giving it out")
+
     class Meta:
         """
         Metadata for the ChallengeForm.
@@ -39,7 +45,18 @@ class ChallengeForm(forms.ModelForm):
         fields = ['name', 
                   'description', 
                   'worth', 
-                  'goal']  # We'll set created_by and created_on automatically
+                  'goal',
+                  'weight']  # We'll set created_by and created_on automatically
+
+    def clean_weight(self):
+        """
+        Fall back to the default weight when none is given.
+
+        Returns:
+            int: The weight to save
+        """
+        weight = self.cleaned_data["weight"]
+        return challenge._meta.get_field("weight").default if weight is None else weight
 
     # Optionally, override save to assign created_by and created_on
     def save(self, commit=True, created_by=None):
@@ -0,0 +1,54 @@
+"""
+Management command to replace every user's expired challenges.
+
+Challenges older than CHALLENGE_EXPIRY are deleted and each user is given
+new random ones in their place, a batch of users per transaction. Pages only
+read challenges, so this has to be run on a schedule, either from cron or
+left running with --loop, which rotates again every CHALLENGE_RESET_INTERVAL.
+
+Usage:
+    python manage.py rotate_challenges [--loop] [--batch-size N]
+
+Author:
+    Lewis Farley (lf507@exeter.ac.uk)
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from EcoWorld.utils import rotate_challenges
+
+
+class Command(BaseCommand):
+    """
+    Rotates expired challenges for all users, once or every
+    CHALLENGE_RESET_INTERVAL.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    help = "Replace every user's expired challenges with new ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true",
+                            help="Keep rotating every CHALLENGE_RESET_INTERVAL until stopped")
+        parser.add_argument("--batch-size", type=int, default=500,
+                            help="Number of users to rotate in each transaction")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive")
+
+        interval = settings.CHALLENGE_RESET_INTERVAL.total_seconds()
+        while True:
+            start = time.perf_counter()
+            users, replaced = rotate_challenges(batch_size)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"Replaced {replaced} challenges for {users} users "
+                              f"in {elapsed:.2f} s")
+            if not options["loop"]:
+                break
+            time.sleep(max(interval - elapsed, 0))
@@ -0,0 +1,185 @@
+"""
+Management command to check pack odds offline with a Monte Carlo simulation.
+
+For each pack it:
+    - Checks the configured rarity probabilities sum to 1
+    - Simulates millions of openings with NumPy from the pack's alias table,
+      the same sampler openPack uses
+    - Compares the rate each rarity and each card was drawn at with the
+      configured probabilities, each rarity's share split evenly across its
+      cards, and flags any card further off than --tolerance standard errors
+    - Merges every simulated card upwards, 5 of a rarity for 1 of the next as
+      mergecards does, to give the coins spent per legendary with and
+      without merging
+    - Times the production sampler used by openPack
+
+The expected rates are worked out from the pack's fields here rather than
+read back from the sampler, so a sampler that drifts from the configured
+odds is caught. Only the packs and cards are read from the database, so it
+can be run against a copy of the live data without adding load.
+
+Usage:
+    python manage.py simulate_pack_odds [--openings N] [--pack ID] [--seed S]
+                                        [--tolerance Z]
+
+Author:
+    Lewis Farley (lf507@exeter.ac.uk)
+"""
+
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from EcoWorld.models import cardRarity, pack
+from EcoWorld.sampling import PACK_RARITIES, get_pack_sampler
+from EcoWorld.utils import MERGE_SIZE
+
+
+class Command(BaseCommand):
+    """
+    Simulates pack openings and merges and reports how they compare with the
+    configured odds.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    help = "Simulate pack openings and merges to check the configured drop rates"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--openings", type=int, default=1_000_000,
+                            help="Number of openings to simulate per pack")
+        parser.add_argument("--benchmark", type=int, default=100_000,
+                            help="Number of openings to time the production sampler over")
+        parser.add_argument("--pack", type=int, help="Only simulate the pack with this id")
+        parser.add_argument("--seed", type=int, help="Seed for reproducible results")
+        parser.add_argument("--tolerance", type=float, default=4.0,
+                            help="Standard errors a card's rate may be off by before it is flagged")
+
+    def handle(self, *args, **options):
+        if options["openings"] < 1 or options["benchmark"] < 0:
+            raise CommandError("--openings must be positive and --benchmark not negative")
+        if options["tolerance"] <= 0:
+            raise CommandError("--tolerance must be positive")
+
+        packs = pack.objects.order_by("id")
+        if options["pack"] is not None:
+            packs = packs.filter(id=options["pack"])
+        packs = list(packs)
+        if not packs:
+            raise CommandError("No packs to simulate")
+
+        rng = np.random.default_rng(options["seed"])
+        # rarities in merge order, common first, as mergecards merges into id + 1
+        rarities = list(cardRarity.objects.order_by("id").values_list("title", flat=True))
+
+        for selected_pack in packs:
+            self.simulate(rng, selected_pack, rarities, options)
+
+    def simulate(self, rng, selected_pack, rarities, options):
+        """
+        Simulate and report on one pack.
+        """
+        n = options["openings"]
+        titles = [title for title, _ in PACK_RARITIES]
+        configured = np.array([getattr(selected_pack, field) for _, field in PACK_RARITIES])
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{selected_pack.title} (id {selected_pack.id}, cost {selected_pack.cost})"))
+        total = configured.sum()
+        if np.isclose(total, 1.0):
+            self.stdout.write(f"  Probabilities sum to {total:.6f}")
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"  Probabilities sum to {total:.6f}, not 1; legendary gets what the others leave"))
+
+        try:
+            sampler = get_pack_sampler(selected_pack)
+        except ValueError:
+            self.stdout.write(self.style.WARNING(
+                "  None of this pack's rarities have cards, skipping it"))
+            return
+        prob = np.array(sampler.prob)
+        alias = np.array(sampler.alias)
+        columns = rng.integers(len(prob), size=n)
+        drawn = np.where(rng.random(n) < prob[columns], columns, alias[columns])
+
+        # the rarity of every card the sampler can draw, in PACK_RARITIES order
+        rarity_index = {title: i for i, title in enumerate(titles)}
+        card_rarity = np.array([rarity_index[c.rarity.title] for c in sampler.outcomes])
+        cards_per_rarity = np.bincount(card_rarity, minlength=len(titles))
+
+        expected_rarity = self.configured_rarity_rates(configured)
+        empty = (cards_per_rarity == 0) & (expected_rarity > 0)
+        for title in np.array(titles)[empty]:
+            self.stdout.write(self.style.WARNING(
+                f"  No {title} cards, its share goes to the other rarities"))
+        expected_rarity = np.where(cards_per_rarity > 0, expected_rarity, 0)
+        expected_rarity /= expected_rarity.sum()
+        observed_rarity = np.bincount(card_rarity[drawn], minlength=len(titles)) / n
+        self.stdout.write("  Rarity       configured   expected   observed")
+        for title, raw, want, got in zip(titles, configured, expected_rarity, observed_rarity):
+            self.stdout.write(f"  {title:<12} {raw:>10.4f} {want:>10.4f} {got:>10.4f}")
+
+        expected = expected_rarity[card_rarity] / cards_per_rarity[card_rarity]
+        observed = np.bincount(drawn, minlength=len(prob)) / n
+        # how many standard errors of a rate over n openings each card is off by
+        error = np.sqrt(expected * (1 - expected) / n)
+        gaps = np.abs(observed - expected) / np.where(error > 0, error, 1)
+        gaps = np.where((error == 0) & (observed != expected), np.inf, gaps)
+        self.stdout.write(f"  Cards: {len(prob)}, largest gap from expected rate "
+                          f"{np.abs(observed - expected).max():.5f} ({gaps.max():.1f} standard errors)")
+        flagged = np.flatnonzero(gaps > options["tolerance"])
+        for i in flagged:
+            self.stdout.write(self.style.WARNING(
+                f"  Off by more than {options['tolerance']:g} standard errors: "
+                f"{sampler.outcomes[i].title} expected {expected[i]:.5f}, observed {observed[i]:.5f}"))
+        if not len(flagged):
+            self.stdout.write(f"  Every card within {options['tolerance']:g} standard errors")
+
+        self.report_merges(selected_pack, rarities, sampler, drawn, n)
+
+        if options["benchmark"]:
+            py_rng = random.Random(options["seed"])
+            start = time.perf_counter()
+            for _ in range(options["benchmark"]):
+                selected_pack.openPack(py_rng)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"  openPack throughput: {options['benchmark'] / elapsed:,.0f} "
+                              "openings/s")
+
+    @staticmethod
+    def configured_rarity_rates(configured):
+        """
+        The chance of each rarity under openPack's cumulative checks: each
+        rarity gets its probability until the running total reaches 1, and
+        legendary gets whatever is left.
+        """
+        thresholds = np.maximum.accumulate(np.clip(np.cumsum(configured[:-1]), 0, 1))
+        return np.diff(np.concatenate([[0.0], thresholds, [1.0]]))
+
+    def report_merges(self, selected_pack, rarities, sampler, drawn, n):
+        """
+        Merge the simulated cards upwards and report the coins per legendary.
+        """
+        index = {title: i for i, title in enumerate(rarities)}
+        card_rarity = np.array([index[c.rarity.title] for c in sampler.outcomes])
+        counts = np.bincount(card_rarity[drawn], minlength=len(rarities)).astype(np.int64)
+
+        legendary = index.get("legendary")
+        if legendary is None:
+            self.stdout.write("  No legendary rarity to report merges for")
+            return
+        direct = counts[legendary]
+        # every full set of MERGE_SIZE cards becomes one of the next rarity
+        merged = counts.copy()
+        for i in range(legendary):
+            merged[i + 1] += merged[i] // MERGE_SIZE
+            merged[i] %= MERGE_SIZE
+
+        spent = selected_pack.cost * n
+        per_direct = f"{spent / direct:,.1f}" if direct else "n/a"
+        per_merged = f"{spent / merged[legendary]:,.1f}" if merged[legendary] else "n/a"
+        self.stdout.write(f"  Coins per legendary: {per_direct} from packs alone, "
+                          f"{per_merged} merging everything up")
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.5 on 2026-10-18 20:05
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_and_prune_owned_cards(apps, schema_editor):
+    """Fold duplicate (user, card) rows into one and delete rows owning no copies."""
+    ownsCard = apps.get_model("EcoWorld", "ownsCard")
+    duplicates = (ownsCard.objects.values("user_id", "card_id")
+                  .annotate(rows=Count("id"), keep=Min("id"), total=Sum("quantity"))
+                  .filter(rows__gt=1))
+    for row in list(duplicates):
+        ownsCard.objects.filter(id=row["keep"]).update(quantity=row["total"])
+        ownsCard.objects.filter(user_id=row["user_id"], card_id=row["card_id"])\
+            .exclude(id=row["keep"]).delete()
+    ownsCard.objects.filter(quantity__lte=0).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('EcoWorld', '0004_packopening'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_and_prune_owned_cards, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ownscard',
+            constraint=models.UniqueConstraint(fields=('user', 'card'), name='unique_owned_card'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 20:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('EcoWorld', '0005_sparse_ownscard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challenge',
+            name='weight',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.5 on 2026-10-18 21:06
+
+from django.db import migrations, models
+
+
+def create_version_row(apps, schema_editor):
+    """Create the single row the catalogue cache reads its version from."""
+    apps.get_model("EcoWorld", "CatalogVersion").objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('EcoWorld', '0006_challenge_weight'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_version_row, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.5 on 2026-10-18 23:06
+
+import uuid
+
+from django.db import migrations, models
+
+
+def set_version_token(apps, schema_editor):
+    """Replace the old count with a random token, so every process reloads."""
+    CatalogVersion = apps.get_model("EcoWorld", "CatalogVersion")
+    if not CatalogVersion.objects.filter(pk=1).update(version=uuid.uuid4().hex):
+        CatalogVersion.objects.create(pk=1, version=uuid.uuid4().hex)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('EcoWorld', '0007_catalogversion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='catalogversion',
+            name='version',
+            field=models.CharField(default='', max_length=32),
+        ),
+        migrations.RunPython(set_version_token, migrations.RunPython.noop),
+    ]
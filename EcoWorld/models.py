@@ -7,6 +7,9 @@ This module defines the database models for the EcoWorld app:
     - `cardRarity` : Model for storing card rarity information
     - `card` : Model for storing card information
     - `ownsCard` : Model for storing card ownership information
+    - `pack` : Model for storing packs sold in the store
+    - `PackOpening` : Model for storing the card a bought pack opened into
+    - `CatalogVersion` : Model for storing the version of the cached catalogue
 usage:
     - to modify or access the database, import the models from this module
 author:
@@ -32,6 +35,8 @@ class challenge(models.Model):
         goal (IntegerField): The required number of completions to finish the challenge.
         redirect_url (CharField): An optional URL users may be directed to upon starting 
                                   the challenge.
+        weight (PositiveIntegerField): How likely the challenge is to be given out
+                                       compared with the others, 0 to stop giving it out.
 
     Methods:
         __str__(): Returns the name of the challenge.
@@ -46,6 +51,7 @@ class challenge(models.Model):
     worth = models.IntegerField(default=settings.CHALLENGE_WORTH)
     goal = models.IntegerField(default=1)
     redirect_url = models.CharField(max_length=255, blank=True, null=True)
+    weight = models.PositiveIntegerField(default=1)
 
     def __str__(self):
         return self.name
@@ -122,6 +128,9 @@ class card(models.Model):
 class ownsCard(models.Model):
     """
     Model for storing what cards the user owns and how many.
+    The table is sparse: a user only has a row for a card while they own at
+    least one copy, and never more than one row per card. Change quantities
+    through update_inventory, give_card and take_card in EcoWorld/utils.py.
     Attributes:
         -user: ForeignKey : The user who owns the card.
         -card: ForeignKey : The card being owned.
@@ -135,6 +144,12 @@ class ownsCard(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     card = models.ForeignKey(card, on_delete=models.CASCADE)
     quantity = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "card"], name="unique_owned_card"),
+        ]
+
     def __str__(self):
         return self.user.username + " owns " + self.card.title
 
@@ -172,20 +187,16 @@ class pack(models.Model):
 
     def __str__(self):
         return self.title
-    def openPack(self):
-        #Open the pack and return
-        r=random.random()
-        if r<self.commonProb:
-            rarity = cardRarity.objects.get(title="common")
-        elif r<self.commonProb+self.rareProb:
-            rarity = cardRarity.objects.get(title="rare")
-        elif r<self.commonProb+self.rareProb+self.epicProb:
-            rarity = cardRarity.objects.get(title="epic")
-        else:
-            rarity = cardRarity.objects.get(title="legendary")
-        cards = card.objects.filter(rarity=rarity)
-        cardToReturn = random.choice(cards)
-        return cardToReturn
+    def openPack(self, rng=None):
+        """
+        Open the pack and return the card received.
+        Cards are drawn from the pack's cached alias table in
+        EcoWorld/sampling.py, so opening does not read the database once
+        the table is built. Pass a seeded random.Random as rng for
+        reproducible results.
+        """
+        from .sampling import get_pack_sampler
+        return get_pack_sampler(self).sample(rng or random)
 
 
 
@@ -221,3 +232,50 @@ class Merge(models.Model):
 
     def __str__(self):
         return f"Merge operation for {self.userID.username}"
+
+
+class PackOpening(models.Model):
+    """
+    Records the card a user received from a pack they bought, so the pack
+    opening page can reveal the result of a purchase rather than opening a
+    new pack itself.
+
+    Attributes:
+        user = Foreign key, the user who bought the pack
+        pack = Foreign key, the pack that was bought
+        card = Foreign key, the card the pack opened into
+        token = Charfield, the random token the opening page is given
+        created_on = DateTimeField, when the pack was bought
+
+    Method:
+        __str__: Returns the user and card received
+    Author:
+    Lewis Farley (lf507@exeter.ac.uk)
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    pack = models.ForeignKey(pack, on_delete=models.CASCADE)
+    card = models.ForeignKey(card, on_delete=models.CASCADE)
+    token = models.CharField(max_length=32, db_index=True)
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user.username} opened {self.card.title}"
+
+
+class CatalogVersion(models.Model):
+    """
+    A single row holding a token that changes with the catalogue: the cards,
+    rarities, packs, challenges and guides. Every process caches the
+    catalogue and reloads it when this token changes, see EcoWorld/catalog.py.
+    A random token is used rather than a counter, so a snapshot loaded from a
+    transaction that was rolled back can never match a later version.
+
+    Attributes:
+        version = CharField, set to a new token on every catalogue change
+    Author:
+    Lewis Farley (lf507@exeter.ac.uk)
+    """
+    version = models.CharField(max_length=32, default="")
+
+    def __str__(self):
+        return f"Catalogue version {self.version}"
@@ -0,0 +1,215 @@
+"""
+Card sampling for opening packs.
+
+Opening a pack used to look up the rarity and every card of that rarity on
+each open. This module builds, once per pack, an alias table over every card
+the pack can open into so each open is O(1) with no database reads:
+    - `AliasTable` : Walker's alias method (Vose's construction) for drawing
+      from a fixed discrete distribution in constant time
+    - `sample_distinct` : Weighted sampling of k distinct outcomes without
+      replacement from an alias table, used to hand out challenges
+    - `get_pack_sampler` : The cached sampler for a pack, built on first use
+
+Samplers are built from the cached catalogue in EcoWorld/catalog.py and kept
+with it, so they are rebuilt whenever any process changes the packs, cards
+or rarities.
+
+Author:
+    Lewis Farley (lf507@exeter.ac.uk)
+"""
+
+import heapq
+import random
+
+from .catalog import get_catalog
+
+# The rarity each of a pack's probabilities applies to, in the order openPack
+# has always checked them
+PACK_RARITIES = [
+    ("common", "commonProb"),
+    ("rare", "rareProb"),
+    ("epic", "epicProb"),
+    ("legendary", "legendaryProb"),
+]
+
+
+class AliasTable:
+    """
+    Draws outcomes from a fixed discrete distribution in O(1) time per draw
+    after O(n) set up, using Walker's alias method.
+
+    Each of the n columns holds the probability of keeping its own outcome
+    and the outcome it otherwise aliases to. A draw picks a column uniformly
+    and then flips one biased coin.
+
+    Attributes:
+        outcomes (list): The possible outcomes.
+        weights (list): The weight of each outcome.
+        prob (list): For each column, the chance of keeping its own outcome.
+        alias (list): For each column, the index of its alias outcome.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    def __init__(self, outcomes, weights):
+        total = sum(weights)
+        if not outcomes or total <= 0:
+            raise ValueError("An alias table needs at least one outcome with positive weight")
+        n = len(outcomes)
+        self.outcomes = list(outcomes)
+        self.weights = list(weights)
+        self.prob = [0.0] * n
+        self.alias = list(range(n))
+
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            # the large column gives up what the small one was missing
+            scaled[l] -= 1 - scaled[s]
+            (small if scaled[l] < 1 else large).append(l)
+        # anything left over is 1 up to rounding error
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def sample(self, rng=random):
+        """
+        Draw one outcome.
+
+        Args:
+            rng: The random number generator to use, anything with the
+                random.Random interface. Pass a seeded random.Random for
+                reproducible draws.
+
+        Returns:
+            The drawn outcome.
+        """
+        i = rng.randrange(len(self.outcomes))
+        return self.outcomes[i] if rng.random() < self.prob[i] else self.outcomes[self.alias[i]]
+
+
+def sample_distinct(table, k, exclude=(), rng=random):
+    """
+    Draw k distinct outcomes from an alias table, each chosen with chance in
+    proportion to its weight among those not yet chosen.
+
+    Outcomes are drawn from the table and any already chosen or excluded are
+    drawn again, so while k and the excluded outcomes make up a small share
+    of the weight, as they do when handing out a few challenges from a
+    catalogue, this takes O(k) draws. If the redraws pile up, the rest are
+    picked in one O(n log k) pass with Efraimidis and Spirakis' weighted
+    random keys instead, so a small catalogue can never leave it spinning.
+
+    Args:
+        table (AliasTable): The table to draw from.
+        k (int): How many outcomes to draw.
+        exclude: Outcomes that must not be drawn.
+        rng: The random number generator to use, anything with the
+            random.Random interface.
+
+    Returns:
+        list: Up to k distinct outcomes, fewer only if there are not k
+            outcomes with positive weight left to choose from.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    chosen = []
+    seen = set(exclude)
+    misses = 0
+    while len(chosen) < k and misses <= 2 * k + 8:
+        outcome = table.sample(rng)
+        if outcome in seen:
+            misses += 1
+            continue
+        seen.add(outcome)
+        chosen.append(outcome)
+    if len(chosen) < k:
+        rest = [(rng.random() ** (1 / w), i) for i, (o, w)
+                in enumerate(zip(table.outcomes, table.weights)) if w > 0 and o not in seen]
+        chosen.extend(table.outcomes[i] for _, i in heapq.nlargest(k - len(chosen), rest))
+    return chosen
+
+
+def rarity_weights(selected_pack):
+    """
+    Get the chance of a pack opening into each rarity.
+
+    The chances follow openPack's original cumulative checks: each rarity
+    gets its probability until the running total reaches 1, and legendary
+    gets whatever is left, whatever legendaryProb is set to.
+
+    Args:
+        selected_pack (pack): The pack being opened.
+
+    Returns:
+        dict: Rarity title to the chance of opening into it.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    weights = {}
+    threshold = 0.0
+    covered = 0.0
+    for title, field in PACK_RARITIES[:-1]:
+        threshold += getattr(selected_pack, field)
+        reached = max(min(threshold, 1.0), covered)
+        weights[title] = reached - covered
+        covered = reached
+    weights[PACK_RARITIES[-1][0]] = 1.0 - covered
+    return weights
+
+
+def build_pack_sampler(selected_pack, catalog):
+    """
+    Build an alias table over every card a pack can open into.
+
+    Each card's weight is its rarity's chance shared equally between the
+    cards of that rarity. Rarities with no cards are left out and the rest
+    scaled up to fill their share.
+
+    Args:
+        selected_pack (pack): The pack to build the sampler for.
+        catalog (Catalog): The catalogue to take the cards from.
+
+    Returns:
+        AliasTable: A table whose outcomes are card objects.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    weights = rarity_weights(selected_pack)
+    by_rarity = {}
+    for c in catalog.cards.values():
+        if c.rarity.title in weights:
+            by_rarity.setdefault(c.rarity.title, []).append(c)
+
+    outcomes, card_weights = [], []
+    for title, cards in by_rarity.items():
+        outcomes.extend(cards)
+        card_weights.extend([weights[title] / len(cards)] * len(cards))
+    return AliasTable(outcomes, card_weights)
+
+
+def get_pack_sampler(selected_pack):
+    """
+    Get the cached sampler for a pack, building it on first use.
+
+    Samplers are keyed on the pack and its probabilities, so an edited but
+    unsaved pack never uses another version's table.
+
+    Args:
+        selected_pack (pack): The pack being opened.
+
+    Returns:
+        AliasTable: The sampler for the pack.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    catalog = get_catalog()
+    key = ("pack", selected_pack.pk) + tuple(getattr(selected_pack, f) for _, f in PACK_RARITIES)
+    return catalog.memo(key, lambda: build_pack_sampler(selected_pack, catalog))
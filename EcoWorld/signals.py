@@ -0,0 +1,29 @@
+"""
+This module provides the signals for the EcoWorld app:
+    - `bump_catalog` : Moves the catalogue version on whenever a card, card
+    rarity, pack, challenge or guide is saved or deleted, so every process
+    reloads its cached catalogue and the pack samplers built from it
+author:
+    - Lewis Farley (lf507@exeter.ac.uk)
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from guides.models import ContentQuizPair
+from .catalog import bump_catalog_version
+from .models import card, cardRarity, challenge, pack
+
+# pylint: disable=unused-argument
+
+
+@receiver([post_save, post_delete], sender=pack)
+@receiver([post_save, post_delete], sender=card)
+@receiver([post_save, post_delete], sender=cardRarity)
+@receiver([post_save, post_delete], sender=challenge)
+@receiver([post_save, post_delete], sender=ContentQuizPair)
+def bump_catalog(sender, **kwargs):
+    """
+    Marks every cached catalogue stale after a catalogue row changes.
+    Author: Lewis Farley (lf507@exeter.ac.uk)
+    """
+    bump_catalog_version()
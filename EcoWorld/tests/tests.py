@@ -1,12 +1,19 @@
 import json
 import os
+import random
+from io import StringIO
 from unittest.mock import patch
 from django.http import QueryDict
-from django.test import TestCase, Client, RequestFactory
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
 from Accounts import models
 from Accounts.models import Profile, FriendRequests, Friends
-from EcoWorld.models import Merge, ownsCard, pack, card, cardRarity, User,ongoingChallenge, Merge
+from EcoWorld.models import Merge, ownsCard, pack, card, cardRarity, User,ongoingChallenge, Merge, PackOpening
+from EcoWorld.models import CatalogVersion
+from guides.models import ContentQuizPair
 from django.urls import reverse
 from django.conf import settings
 from datetime import timedelta
@@ -17,6 +24,12 @@ from EcoWorld.models import challenge, ongoingChallenge
 from datetime import date 
 from django.utils import timezone
 
+from EcoWorld.catalog import bump_catalog_version, get_catalog
+from EcoWorld.sampling import (PACK_RARITIES, AliasTable, get_pack_sampler, rarity_weights,
+                               sample_distinct)
+from EcoWorld.utils import (assign_challenges, auto_merge, get_challenge_summary, give_card,
+                            increment_objective, rotate_challenges, take_card, update_inventory)
+from leaderboards.models import UserEarntCoins
 from EcoWorld.views import mergecards
 
 """
@@ -206,6 +219,12 @@ class TestStore(TestCase):
             color_class="blue",
         )
 
+        #A card of each rarity the packs can open into
+        for title in ["common", "rare", "epic", "legendary"]:
+            card.objects.create(title=title + " card", description="",
+                                image="cards/bush.png",
+                                rarity=cardRarity.objects.create(title=title))
+
     #Tests that when the user is logged in they can view the page correctly and if not they cant and checks if the template receives the info given to it
     def testStoreLoadsProperly(self):
         self.client.login(username="testuser1", password="1234")
@@ -248,9 +267,138 @@ class TestStore(TestCase):
 
         #Checks that given the user logged in and pack bought the correct number of coins has been deducted and pack worked
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.json(), {"success": True})
+        self.assertEqual(response.json()["success"], True)
         self.assertEqual(self.profile2.number_of_coins, 9999979)
 
+        #Checks the card was added to the inventory and the opening recorded against the token
+        opening = PackOpening.objects.get(token=response.json()["token"])
+        self.assertEqual((opening.user, opening.pack), (self.user2, self.pack1))
+        self.assertEqual(ownsCard.objects.get(user=self.user2, card=opening.card).quantity, 1)
+
+    #Tests the opening page reveals the card from the purchase with that token
+    def testPackOpeningRevealsPurchase(self):
+        self.client.login(username="testuser2", password="1234")
+        token = self.client.post(
+            reverse('EcoWorld:buyPack'),
+            json.dumps({'pack_id': self.pack1.id}),
+            content_type='application/json'
+        ).json()["token"]
+        opening = PackOpening.objects.get(token=token)
+
+        response = self.client.get(reverse('EcoWorld:packopening'), {"token": token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["image"], opening.card.image.url)
+        self.assertEqual(response.context["pack_id"], self.pack1.id)
+
+        #Opening the page again does not open another pack
+        self.client.get(reverse('EcoWorld:packopening'), {"token": token})
+        self.assertEqual(ownsCard.objects.get(user=self.user2, card=opening.card).quantity, 1)
+
+        #Other users cannot see the opening and made up tokens are rejected
+        self.client.login(username="testuser1", password="1234")
+        response = self.client.get(reverse('EcoWorld:packopening'), {"token": token})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('EcoWorld:packopening'), {"token": "nothing"})
+        self.assertEqual(response.status_code, 404)
+
+    #Tests buying a pack takes the same small number of queries each time
+    def testBuyPackQueryCount(self):
+        self.client.login(username="testuser2", password="1234")
+        for card_ in card.objects.all():
+            ownsCard.objects.create(user=self.user2, card=card_)
+        #the catalogue and the pack's sampler are loaded on the first open and then reused
+        self.pack1.openPack()
+        #session, user, two savepoint queries, spend, owned cards,
+        #inventory, post and opening
+        for _ in range(3):
+            with self.assertNumQueries(9):
+                self.client.post(
+                    reverse('EcoWorld:buyPack'),
+                    json.dumps({'pack_id': self.pack1.id}),
+                    content_type='application/json'
+                )
+
+    #Tests opening many packs at once takes a handful of queries
+    def testBuyManyPacks(self):
+        self.client.login(username="testuser2", password="1234")
+        ownsCard.objects.create(user=self.user2, card=card.objects.first(), quantity=2)
+        self.pack1.openPack()
+        #session, user, two savepoint queries, spend, owned cards,
+        #inventory update and insert (in its own savepoint), posts and openings
+        with self.assertNumQueries(12):
+            response = self.client.post(
+                reverse('EcoWorld:buyPack'),
+                json.dumps({'pack_id': self.pack1.id, 'count': 50}),
+                content_type='application/json'
+            )
+        data = response.json()
+        self.assertEqual(len(data["cards"]), 50)
+        self.assertEqual(Profile.objects.get(user=self.user2).number_of_coins,
+                         9999999 - 50 * self.pack1.cost)
+
+        #Every card opened is in the inventory and recorded under the one token
+        opened = [c["id"] for c in data["cards"]]
+        for card_ in card.objects.all():
+            expected = opened.count(card_.id) + (2 if card_ == card.objects.first() else 0)
+            owned = ownsCard.objects.filter(user=self.user2, card=card_).first()
+            self.assertEqual(owned.quantity if owned else 0, expected)
+        self.assertEqual(PackOpening.objects.filter(token=data["token"]).count(), 50)
+
+        response = self.client.get(reverse('EcoWorld:packopening'), {"token": data["token"]})
+        self.assertEqual(len(response.context["images"]), 50)
+
+    #Tests the number of packs is checked
+    def testBuyPacksInvalidCount(self):
+        self.client.login(username="testuser2", password="1234")
+        for count in [0, settings.MAX_PACKS_PER_PURCHASE + 1, "lots"]:
+            response = self.client.post(
+                reverse('EcoWorld:buyPack'),
+                json.dumps({'pack_id': self.pack1.id, 'count': count}),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Profile.objects.get(user=self.user2).number_of_coins, 9999999)
+
+    #Tests the user can only buy as many packs as they can afford
+    def testBuyPackNoDoubleSpend(self):
+        self.profile1.number_of_coins = self.pack1.cost
+        self.profile1.save()
+        self.client.login(username="testuser1", password="1234")
+        responses = [self.client.post(
+            reverse('EcoWorld:buyPack'),
+            json.dumps({'pack_id': self.pack1.id}),
+            content_type='application/json'
+        ) for _ in range(2)]
+
+        self.assertEqual([r.status_code for r in responses], [200, 400])
+        self.assertEqual(Profile.objects.get(user=self.user1).number_of_coins, 0)
+        self.assertEqual(PackOpening.objects.filter(user=self.user1).count(), 1)
+
+    #Tests a failed roll gives the coins back
+    def testBuyPackRollsBack(self):
+        self.client.login(username="testuser2", password="1234")
+        with patch.object(pack, "openPack", side_effect=IndexError("No cards")):
+            response = self.client.post(
+                reverse('EcoWorld:buyPack'),
+                json.dumps({'pack_id': self.pack1.id}),
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(Profile.objects.get(user=self.user2).number_of_coins, 9999999)
+
+    #Test that a pack whose rarities have no cards is refused without taking coins
+    def testBuyPackWithoutCards(self):
+        self.client.login(username="testuser2", password="1234")
+        card.objects.all().delete()
+        response = self.client.post(
+            reverse('EcoWorld:buyPack'),
+            json.dumps({'pack_id': self.pack1.id}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "This pack has no cards to open"})
+        self.assertEqual(Profile.objects.get(user=self.user2).number_of_coins, 9999999)
+
     #Test to check if user has insufficient coins they cant buy a pack
     def testBuyPackFail(self):
         self.client.login(username="testuser1", password="1234")
@@ -269,6 +417,221 @@ class TestStore(TestCase):
         self.assertEqual(self.profile1.number_of_coins, 0)
 
 
+class TestPackSampler(TestCase):
+    """
+    Tests for the cached alias table packs are opened with
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    def setUp(self):
+        self.pack = pack.objects.create(title="Basic Pack", cost=20, packimage="packs/basicpack.png",
+                                        commonProb=0.5, rareProb=0.3, epicProb=0.15,
+                                        legendaryProb=0.05)
+        self.cards = {}
+        for title in ["common", "rare", "epic", "legendary"]:
+            rarity = cardRarity.objects.create(title=title)
+            self.cards[title] = [card.objects.create(title=f"{title} {i}", description="",
+                                                     image="cards/bush.png", rarity=rarity)
+                                 for i in range(2)]
+
+    def testAliasTableDistribution(self):
+        """The alias table draws each outcome at its weight"""
+        table = AliasTable(["a", "b", "c"], [0.6, 0.3, 0.1])
+        rng = random.Random(1)
+        draws = [table.sample(rng) for _ in range(20000)]
+        for outcome, weight in [("a", 0.6), ("b", 0.3), ("c", 0.1)]:
+            self.assertAlmostEqual(draws.count(outcome) / len(draws), weight, delta=0.015)
+
+    def testRarityWeightsFollowOpenPack(self):
+        """Legendary gets whatever the other rarities leave, as openPack always did"""
+        self.pack.legendaryProb = 0.5
+        weights = rarity_weights(self.pack)
+        self.assertAlmostEqual(weights["legendary"], 0.05)
+        self.pack.commonProb = 0.9
+        weights = rarity_weights(self.pack)
+        self.assertAlmostEqual(weights["rare"], 0.1)
+        self.assertEqual((weights["epic"], weights["legendary"]), (0.0, 0.0))
+
+    def testOpenPackNoQueries(self):
+        """Only the first open after the catalogue changes reads the database"""
+        # the catalogue version, rarities, cards, packs, challenges and guides
+        with self.assertNumQueries(6):
+            self.pack.openPack()
+        with self.assertNumQueries(0):
+            for _ in range(50):
+                self.pack.openPack()
+
+    def testOpenPackSeeded(self):
+        """Opening with the same seed gives the same cards"""
+        first = [self.pack.openPack(random.Random(7)) for _ in range(5)]
+        second = [self.pack.openPack(random.Random(7)) for _ in range(5)]
+        self.assertEqual(first, second)
+
+    def testOpenPackRates(self):
+        """Cards are opened at their rarity's rate shared between its cards"""
+        rng = random.Random(3)
+        opened = [self.pack.openPack(rng).rarity.title for _ in range(20000)]
+        for title, rate in [("common", 0.5), ("rare", 0.3), ("epic", 0.15), ("legendary", 0.05)]:
+            self.assertAlmostEqual(opened.count(title) / len(opened), rate, delta=0.015)
+
+    def testSamplerRebuiltOnChange(self):
+        """Adding a card or editing the pack rebuilds the sampler"""
+        sampler = get_pack_sampler(self.pack)
+        new_card = card.objects.create(title="new", description="", image="cards/bush.png",
+                                       rarity=self.cards["rare"][0].rarity)
+        self.assertIsNot(get_pack_sampler(self.pack), sampler)
+        self.assertIn(new_card, get_pack_sampler(self.pack).outcomes)
+
+        sampler = get_pack_sampler(self.pack)
+        self.pack.commonProb = 1
+        self.pack.save()
+        self.assertIsNot(get_pack_sampler(self.pack), sampler)
+        self.assertEqual(self.pack.openPack().rarity.title, "common")
+
+
+class TestCatalog(TestCase):
+    """
+    Tests for the process-local catalogue cache
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    CATALOG_TABLES = ("EcoWorld_pack", "EcoWorld_card", "EcoWorld_cardrarity", "EcoWorld_challenge",
+                      "guides_contentquizpair", "EcoWorld_catalogversion")
+
+    def setUp(self):
+        self.rarity = cardRarity.objects.create(title="common")
+        self.card = card.objects.create(title="Bush", description="", image="cards/bush.png",
+                                        rarity=self.rarity)
+        self.pack = pack.objects.create(title="Basic Pack", cost=20, packimage="packs/basicpack.png")
+        ContentQuizPair.objects.create(title="Recycling", content="", quiz_questions=[])
+        self.user = User.objects.create_user(username="shopper", password="1234")
+        self.client.login(username="shopper", password="1234")
+
+    def catalog_queries(self, queries):
+        return [q["sql"] for q in queries
+                if any(f'"{table}"' in q["sql"] for table in self.CATALOG_TABLES)]
+
+    def testHotViewsDoNoCatalogQueries(self):
+        """Once loaded, the store and the guides menu read the catalogue from memory"""
+        get_catalog()
+        for url in (reverse("EcoWorld:store"), reverse("menu")):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.catalog_queries(queries), [], url)
+        self.assertContains(self.client.get(reverse("EcoWorld:store")), "Basic Pack")
+
+    def testSaveBumpsVersion(self):
+        """Saving or deleting a catalogue row reloads the catalogue straight away"""
+        catalog = get_catalog()
+        self.card.title = "Tree"
+        self.card.save()
+        self.assertIsNot(get_catalog(), catalog)
+        self.assertEqual(get_catalog().cards[self.card.id].title, "Tree")
+        self.pack.delete()
+        self.assertEqual(get_catalog().packs, {})
+
+    def testOtherProcessChangesSeen(self):
+        """A version bumped by another process is picked up at the next check"""
+        catalog = get_catalog()
+        # another process changes a card and bumps the version without this one knowing
+        card.objects.filter(id=self.card.id).update(title="Tree")
+        CatalogVersion.objects.filter(pk=1).update(version="bumped-elsewhere")
+        with override_settings(CATALOG_VERSION_CHECK_INTERVAL=timedelta(hours=1)):
+            self.assertIs(get_catalog(), catalog)
+        with override_settings(CATALOG_VERSION_CHECK_INTERVAL=timedelta(0)):
+            self.assertEqual(get_catalog().cards[self.card.id].title, "Tree")
+            # an unchanged version costs one query and keeps the snapshot
+            catalog = get_catalog()
+            with self.assertNumQueries(1):
+                self.assertIs(get_catalog(), catalog)
+
+    def testRolledBackVersionNotReused(self):
+        """A snapshot loaded from a rolled back change never matches a later version"""
+        get_catalog()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            card.objects.filter(id=self.card.id).update(title="Tree")
+            bump_catalog_version()
+            rolled_back = get_catalog()
+            raise RuntimeError("rolled back")
+        bump_catalog_version()
+        self.assertNotEqual(get_catalog().version, rolled_back.version)
+        self.assertEqual(get_catalog().cards[self.card.id].title, "Bush")
+
+    def testBumpAfterUpdate(self):
+        """Changes made without saving each row are seen once the version is bumped"""
+        get_catalog()
+        card.objects.filter(id=self.card.id).update(title="Tree")
+        bump_catalog_version()
+        self.assertEqual(get_catalog().cards[self.card.id].title, "Tree")
+
+
+class TestSimulatePackOdds(TestCase):
+    """
+    Tests for the simulate_pack_odds management command
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    def setUp(self):
+        fixture_path = os.path.join(os.path.dirname(__file__), 'initialDb.json')
+        call_command("loaddata", fixture_path, verbosity=0)
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command("simulate_pack_odds", "--openings", "20000", "--benchmark", "100",
+                     "--seed", "1", *args, stdout=out)
+        return out.getvalue()
+
+    def testReportsEveryPack(self):
+        """Every pack is reported with its rates, merges and throughput"""
+        output = self.run_command()
+        for pack_ in pack.objects.all():
+            self.assertIn(pack_.title, output)
+        self.assertIn("Coins per legendary", output)
+        self.assertIn("openPack throughput", output)
+
+    def testObservedMatchesConfigured(self):
+        """The simulated rarity rates are close to the configured ones"""
+        pack_ = pack.objects.order_by("id").first()
+        output = self.run_command("--pack", str(pack_.id))
+        common = next(line for line in output.splitlines() if line.strip().startswith("common"))
+        configured, expected, observed = map(float, common.split()[1:])
+        self.assertAlmostEqual(configured, pack_.commonProb)
+        self.assertAlmostEqual(observed, expected, delta=0.02)
+        self.assertIn("Every card within", output)
+
+    def testFlagsSamplerThatDriftsFromConfiguredOdds(self):
+        """A sampler that does not follow the pack's probabilities is caught"""
+        pack_ = pack.objects.order_by("id").first()
+        rarities = {title for title, _ in PACK_RARITIES}
+        cards = [c for c in get_catalog().cards.values() if c.rarity.title in rarities]
+        uniform = AliasTable(cards, [1] * len(cards))
+        with patch("EcoWorld.management.commands.simulate_pack_odds.get_pack_sampler",
+                   return_value=uniform):
+            output = self.run_command("--pack", str(pack_.id))
+        self.assertIn("Off by more than", output)
+
+    def testWarnsWhenProbabilitiesDoNotSumToOne(self):
+        """Packs whose probabilities do not sum to 1 are flagged"""
+        pack_ = pack.objects.order_by("id").first()
+        pack_.legendaryProb += 0.2
+        pack_.save()
+        self.assertIn("not 1", self.run_command("--pack", str(pack_.id)))
+
+    def testSkipsPackWithoutCards(self):
+        """A pack none of whose rarities have cards is skipped with a warning"""
+        card.objects.filter(rarity__title__in=[title for title, _ in PACK_RARITIES]).delete()
+        output = self.run_command()
+        self.assertIn("skipping it", output)
+        for pack_ in pack.objects.all():
+            self.assertIn(pack_.title, output)
+
+    def testUnknownPack(self):
+        """Asking for a pack that does not exist is an error"""
+        with self.assertRaises(CommandError):
+            self.run_command("--pack", "999")
+
+
 class TestChallenge(TestCase):
     '''
     test the functionality to do with challenges
@@ -354,12 +717,12 @@ class TestChallenge(TestCase):
             json.dumps({'id': i}),  # The data you want to send, serialized as JSON
             content_type='application/json'  # The content type must be set to application/json
         )
-        # wait for them to reset
+        # wait for them to expire
         import time
         time.sleep(settings.CHALLENGE_EXPIRY.total_seconds())
 
-        # check that the challenges have been reset
-        self.client.get(reverse('EcoWorld:challenge'))
+        # check that the challenges have been reset by the rotation
+        call_command("rotate_challenges", stdout=StringIO())
         ongoingChallenges = ongoingChallenge.objects.filter(user=User.objects.get(username='testuser'))
         self.assertEqual(ongoingChallenges[0].submitted_on,None)
     def test_coin_reward(self):
@@ -382,6 +745,144 @@ class TestChallenge(TestCase):
 
 
 
+class TestRotateChallenges(TestCase):
+    """
+    Tests for replacing expired challenges in the background
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    def setUp(self):
+        self.challenges = [challenge.objects.create(name=f"Challenge {i}", description="")
+                           for i in range(settings.NUM_CHALLENGES * 2)]
+        self.users = [User.objects.create_user(username=f"rotator{i}", password="1234")
+                      for i in range(4)]
+        for user in self.users:
+            ongoingChallenge.objects.bulk_create(
+                ongoingChallenge(user=user, challenge=c)
+                for c in self.challenges[:settings.NUM_CHALLENGES])
+
+    def expire(self, **filters):
+        """Backdate challenges so they have expired"""
+        ongoingChallenge.objects.filter(**filters).update(
+            created_on=timezone.now() - settings.CHALLENGE_EXPIRY - timedelta(seconds=1))
+
+    def testReplacesOnlyExpired(self):
+        """Expired challenges are replaced with ones the user does not have and the rest are kept"""
+        kept = ongoingChallenge.objects.filter(user=self.users[0]).first()
+        self.expire(user=self.users[0])
+        ongoingChallenge.objects.filter(id=kept.id).update(created_on=timezone.now())
+        self.assertEqual(rotate_challenges(rng=random.Random(1)), (1, settings.NUM_CHALLENGES - 1))
+
+        challenges = ongoingChallenge.objects.filter(user=self.users[0])
+        self.assertEqual(challenges.count(), settings.NUM_CHALLENGES)
+        self.assertEqual(len({c.challenge_id for c in challenges}), settings.NUM_CHALLENGES)
+        self.assertTrue(challenges.filter(id=kept.id).exists())
+        self.assertFalse(challenges.filter(created_on__lte=timezone.now()
+                                           - settings.CHALLENGE_EXPIRY).exists())
+        # users without expired challenges are left alone
+        for user in self.users[1:]:
+            self.assertEqual(ongoingChallenge.objects.filter(user=user).count(),
+                             settings.NUM_CHALLENGES)
+
+    def testQueriesPerBatch(self):
+        """Users are rotated a batch at a time with a fixed number of queries per batch"""
+        self.expire()
+        get_catalog()
+        # users, then per batch: savepoint, delete, kept, insert, release
+        with self.assertNumQueries(1 + 5 * 2):
+            users, replaced = rotate_challenges(batch_size=2)
+        self.assertEqual((users, replaced), (4, 4 * settings.NUM_CHALLENGES))
+
+    def testNothingExpired(self):
+        """Nothing is read beyond the expired check when no challenge has expired"""
+        with self.assertNumQueries(1):
+            self.assertEqual(rotate_challenges(), (0, 0))
+
+    def testPageDoesNotRotate(self):
+        """The challenge page shows expired challenges as they are until the rotation runs"""
+        self.expire(user=self.users[0])
+        before = set(ongoingChallenge.objects.filter(user=self.users[0]).values_list("id", flat=True))
+        self.client.login(username="rotator0", password="1234")
+        self.client.get(reverse("EcoWorld:challenge"))
+        after = set(ongoingChallenge.objects.filter(user=self.users[0]).values_list("id", flat=True))
+        self.assertEqual(before, after)
+
+    def testCommand(self):
+        """The command reports what it rotated"""
+        self.expire()
+        out = StringIO()
+        call_command("rotate_challenges", "--batch-size", "3", stdout=out)
+        self.assertIn(f"Replaced {4 * settings.NUM_CHALLENGES} challenges for 4 users", out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command("rotate_challenges", "--batch-size", "0", stdout=StringIO())
+
+
+class TestChallengeAssignment(TestCase):
+    """
+    Tests for handing out challenges by weight without replacement
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    def setUp(self):
+        self.challenges = [challenge.objects.create(name=f"Challenge {i}", description="")
+                           for i in range(6)]
+        self.users = [User.objects.create_user(username=f"assignee{i}", password="1234")
+                      for i in range(5)]
+
+    def testSampleDistinct(self):
+        """Draws are distinct, skip excluded outcomes and never pick zero weights"""
+        table = AliasTable(["a", "b", "c", "d", "e"], [5, 1, 1, 1, 0])
+        rng = random.Random(3)
+        for _ in range(200):
+            drawn = sample_distinct(table, 3, exclude={"b"}, rng=rng)
+            self.assertEqual(len(set(drawn)), 3)
+            self.assertNotIn("b", drawn)
+            self.assertNotIn("e", drawn)
+        # asking for more than there are returns every outcome left, once
+        self.assertCountEqual(sample_distinct(table, 10, rng=rng), ["a", "b", "c", "d"])
+
+    def testSampleDistinctFollowsWeights(self):
+        """The first draw follows the weights and later draws the weights of what is left"""
+        table = AliasTable(["heavy", "x", "y", "z"], [6, 1, 1, 1])
+        rng = random.Random(7)
+        draws = [sample_distinct(table, 2, rng=rng) for _ in range(20000)]
+        first = sum(d[0] == "heavy" for d in draws) / len(draws)
+        self.assertAlmostEqual(first, 6 / 9, delta=0.02)
+        # when heavy is not drawn first it is drawn second with chance 6/8
+        second = [d[1] == "heavy" for d in draws if d[0] != "heavy"]
+        self.assertAlmostEqual(sum(second) / len(second), 6 / 8, delta=0.03)
+
+    def testAssignCohort(self):
+        """A whole cohort is topped up with one read and one insert"""
+        held = self.challenges[0].id
+        kept = {user.id: set() for user in self.users}
+        kept[self.users[0].id] = {held}
+        ongoingChallenge.objects.create(user=self.users[0], challenge_id=held)
+        get_catalog()
+        # the insert, the weights come from the cached catalogue
+        with self.assertNumQueries(1):
+            created = assign_challenges(kept, rng=random.Random(1))
+        self.assertEqual(len(created), len(self.users) * settings.NUM_CHALLENGES - 1)
+        for user in self.users:
+            ids = list(ongoingChallenge.objects.filter(user=user).values_list("challenge_id", flat=True))
+            self.assertEqual(len(ids), settings.NUM_CHALLENGES)
+            self.assertEqual(len(set(ids)), settings.NUM_CHALLENGES)
+
+    def testZeroWeightNotAssigned(self):
+        """Challenges with no weight are never handed out"""
+        challenge.objects.filter(id__in=[c.id for c in self.challenges[:3]]).update(weight=0)
+        assign_challenges({user.id: set() for user in self.users}, rng=random.Random(2))
+        self.assertFalse(ongoingChallenge.objects.filter(
+            challenge_id__in=[c.id for c in self.challenges[:3]]).exists())
+
+    def testSmallCatalogue(self):
+        """A catalogue too small to fill every slot gives out what it has"""
+        challenge.objects.filter(id__in=[c.id for c in self.challenges[1:]]).update(weight=0)
+        with patch("builtins.print"):
+            assign_challenges({self.users[0].id: set()})
+        self.assertEqual(ongoingChallenge.objects.filter(user=self.users[0]).count(), 1)
+
+
 """
 Test class for the friends page to make sure all things load properly from the GET method and all POST options are dealt
 with correctly
@@ -527,21 +1028,21 @@ class TestMergeCards(TestCase):
 
     #Tests when selecting a rarity the table works correctly
     def testRarityPost(self):
-        """Tests the post request for rarity works"""
-        response = self.client.post(reverse("EcoWorld:mergecards"), {"rarity": self.rarity_common.id})
+        """Tests selecting a rarity lists the inventory of that rarity"""
+        response = self.client.get(reverse("EcoWorld:mergecards"), {"rarity": self.rarity_common.id})
         self.assertEqual(response.status_code, 200)
         self.assertIn("playerItems", response.context)
         self.assertIn("rarity", response.context)
         self.assertIn("merge", response.context)
+        self.assertEqual([item["card__id"] for item in response.context["playerItems"]],
+                         [self.card1.id])
 
     #Tests when adding a card to the merge slot it works correctly
     def testAddCard(self):
         """Tests the add card method works"""
         #Add card to merge slot 1
-        response = self.client.post(reverse("EcoWorld:mergecards"), {
-            "addCard": self.card1.id,
-            "rarityforbutton": self.rarity_common.id,
-        })
+        response = self.client.post(reverse("EcoWorld:merge_add_card"), {"card_id": self.card1.id},
+                                    content_type="application/json")
         self.assertEqual(response.status_code, 200)
         #Checks that the card actually went into a slot
         merge_instance = Merge.objects.get(userID=self.user)
@@ -570,10 +1071,8 @@ class TestMergeCards(TestCase):
         own.save()
 
         #Send POST request to remove that card from the slot
-        response = self.client.post(reverse("EcoWorld:mergecards"), {
-            "removeCard": self.card1.id,
-            "rarityforbutton": self.rarity_common.id,
-        })
+        response = self.client.post(reverse("EcoWorld:merge_remove_card"), {"card_id": self.card1.id},
+                                    content_type="application/json")
         self.assertEqual(response.status_code, 200)
         #Checks that the card was removed from the slot
         merge_instance.refresh_from_db()
@@ -601,17 +1100,11 @@ class TestMergeCards(TestCase):
         own.save()
 
         #Attempt to add the same card again
-        response = self.client.post(reverse("EcoWorld:mergecards"), {
-            "addCard": self.card1.id,
-            "rarityforbutton": self.rarity_common.id,
-        })
-        self.assertEqual(response.status_code, 200)
+        response = self.client.post(reverse("EcoWorld:merge_add_card"), {"card_id": self.card1.id},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 400)
         #Check that the error message is in the response context
-        self.assertIn("error", response.context)
-        self.assertEqual(
-            response.context["error"],
-            "There are already 5 cards in the merge slots remove one first!"
-        )
+        self.assertEqual(response.json()["error"], "There are already 5 cards in the merge slots remove one first!")
 
     def testAddCardDifferentRarityError(self):
         """Tests that adding a card of a different rarity than the first card returns an error"""
@@ -625,17 +1118,11 @@ class TestMergeCards(TestCase):
         merge_instance.save()
 
         #Attempt to add the uncommon card while merge already has a common card
-        response = self.client.post(reverse("EcoWorld:mergecards"), {
-            "addCard": card_uncommon.id,
-            "rarityforbutton": self.rarity_common.id,
-        })
-        self.assertEqual(response.status_code, 200)
+        response = self.client.post(reverse("EcoWorld:merge_add_card"), {"card_id": card_uncommon.id},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 400)
         #Verify that the error message is returned
-        self.assertIn("error", response.context)
-        self.assertEqual(
-            response.context["error"],
-            "The card you tried to add was not of the same rarity as the first card in the merge."
-        )
+        self.assertEqual(response.json()["error"], "The card you tried to add was not of the same rarity as the first card in the merge.")
 
     def testAddCardFillsSlot2(self):
         """Tests that if slot1 is already filled, the new card is added to slot2"""
@@ -648,10 +1135,8 @@ class TestMergeCards(TestCase):
         ownsCard.objects.create(user=self.user, card=self.card2, quantity=5)
 
         #Post request to add card2
-        response = self.client.post(reverse("EcoWorld:mergecards"), {
-            "addCard": self.card2.id,
-            "rarityforbutton": self.rarity_common.id,
-        })
+        response = self.client.post(reverse("EcoWorld:merge_add_card"), {"card_id": self.card2.id},
+                                    content_type="application/json")
         self.assertEqual(response.status_code, 200)
         merge_instance.refresh_from_db()
         #Since slot1 is taken, card2 should be added to slot2
@@ -674,10 +1159,8 @@ class TestMergeCards(TestCase):
         ownsCard.objects.create(user=self.user, card=card3, quantity=5)
 
         #Post request to add card3
-        response = self.client.post(reverse("EcoWorld:mergecards"), {
-            "addCard": card3.id,
-            "rarityforbutton": self.rarity_common.id,
-        })
+        response = self.client.post(reverse("EcoWorld:merge_add_card"), {"card_id": card3.id},
+                                    content_type="application/json")
         self.assertEqual(response.status_code, 200)
         merge_instance.refresh_from_db()
         #Since slots 1 and 2 are taken, card3 should be added to slot3
@@ -706,10 +1189,8 @@ class TestMergeCards(TestCase):
         ownsCard.objects.create(user=self.user, card=card4, quantity=5)
 
         #Post request to add card4
-        response = self.client.post(reverse("EcoWorld:mergecards"), {
-            "addCard": card4.id,
-            "rarityforbutton": self.rarity_common.id,
-        })
+        response = self.client.post(reverse("EcoWorld:merge_add_card"), {"card_id": card4.id},
+                                    content_type="application/json")
         self.assertEqual(response.status_code, 200)
         merge_instance.refresh_from_db()
         #Since slots 1-3 are taken, card4 should be added to slot4
@@ -741,10 +1222,8 @@ class TestMergeCards(TestCase):
         ownsCard.objects.create(user=self.user, card=card5, quantity=5)
 
         #Post request to add card5
-        response = self.client.post(reverse("EcoWorld:mergecards"), {
-            "addCard": card5.id,
-            "rarityforbutton": self.rarity_common.id,
-        })
+        response = self.client.post(reverse("EcoWorld:merge_add_card"), {"card_id": card5.id},
+                                    content_type="application/json")
         self.assertEqual(response.status_code, 200)
         merge_instance.refresh_from_db()
         #Since slots 1-4 are taken, card5 should be added to slot5
@@ -762,17 +1241,11 @@ class TestMergeCards(TestCase):
         own.save()
         
         #Attempt to add the card
-        response = self.client.post(reverse("EcoWorld:mergecards"), {
-            "addCard": self.card1.id,
-            "rarityforbutton": self.rarity_common.id,
-        })
-        self.assertEqual(response.status_code, 200)
+        response = self.client.post(reverse("EcoWorld:merge_add_card"), {"card_id": self.card1.id},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 400)
         #Verify that the error message is returned
-        self.assertIn("error", response.context)
-        self.assertEqual(
-            response.context["error"],
-            "You need to get more of this card to add it to the merge or take one out of the merge box"
-        )
+        self.assertEqual(response.json()["error"], "You need to get more of this card to add it to the merge or take one out of the merge box")
 
     def testRemoveCardSlot2(self):
         """Tests that a card is correctly removed from merge slot 2"""
@@ -788,10 +1261,8 @@ class TestMergeCards(TestCase):
         own.save()
         
         #Send POST request to remove the card
-        response = self.client.post(reverse("EcoWorld:mergecards"), {
-            "removeCard": self.card1.id,
-            "rarityforbutton": self.rarity_common.id,
-        })
+        response = self.client.post(reverse("EcoWorld:merge_remove_card"), {"card_id": self.card1.id},
+                                    content_type="application/json")
         self.assertEqual(response.status_code, 200)
         
         merge_instance.refresh_from_db()
@@ -817,10 +1288,8 @@ class TestMergeCards(TestCase):
         own.save()
         
         #Remove the card from the merge slot
-        response = self.client.post(reverse("EcoWorld:mergecards"), {
-            "removeCard": self.card1.id,
-            "rarityforbutton": self.rarity_common.id,
-        })
+        response = self.client.post(reverse("EcoWorld:merge_remove_card"), {"card_id": self.card1.id},
+                                    content_type="application/json")
         self.assertEqual(response.status_code, 200)
         
         merge_instance.refresh_from_db()
@@ -846,10 +1315,8 @@ class TestMergeCards(TestCase):
         own.save()
         
         #Remove the card via POST
-        response = self.client.post(reverse("EcoWorld:mergecards"), {
-            "removeCard": self.card1.id,
-            "rarityforbutton": self.rarity_common.id,
-        })
+        response = self.client.post(reverse("EcoWorld:merge_remove_card"), {"card_id": self.card1.id},
+                                    content_type="application/json")
         self.assertEqual(response.status_code, 200)
         
         merge_instance.refresh_from_db()
@@ -875,10 +1342,8 @@ class TestMergeCards(TestCase):
         own.save()
         
         #POST request to remove card from slot5
-        response = self.client.post(reverse("EcoWorld:mergecards"), {
-            "removeCard": self.card1.id,
-            "rarityforbutton": self.rarity_common.id,
-        })
+        response = self.client.post(reverse("EcoWorld:merge_remove_card"), {"card_id": self.card1.id},
+                                    content_type="application/json")
         self.assertEqual(response.status_code, 200)
         
         merge_instance.refresh_from_db()
@@ -925,54 +1390,41 @@ class TestMergeCards(TestCase):
         merge_instance.save()
         
         #Post a request to remove self.card1, which is not in any merge slot
-        response = self.client.post(reverse("EcoWorld:mergecards"), {
-            "removeCard": self.card1.id,
-            "rarityforbutton": self.rarity_common.id,
-        })
-        self.assertEqual(response.status_code, 200)
+        response = self.client.post(reverse("EcoWorld:merge_remove_card"), {"card_id": self.card1.id},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 400)
         #Verify that the error message is returned
-        self.assertIn("error", response.context)
-        self.assertEqual(response.context["error"], "This card is not in a merge slot")
-        
-        #Also verify that the context contains the expected keys
-        self.assertIn("playerItems", response.context)
-        self.assertIn("rarity", response.context)
-        self.assertIn("merge", response.context)
-        
-        #Check that the merge context (cardImages) is built correctly (5 slots, each empty)
-        merge_context = response.context["merge"]
-        self.assertEqual(len(merge_context), 5)
-        for item in merge_context:
-            self.assertEqual(item, {'id': None, 'image': None})
+        self.assertEqual(response.json()["error"], "This card is not in a merge slot")
+
+        #Check that the inventory was not touched
+        self.assertEqual(ownsCard.objects.get(user=self.user, card=self.card1).quantity, 5)
 
 
     def testMergeCardsFuncError(self):
-        """Tests that submitting mergebutton equal to '5' returns the appropriate error."""
-        # Create an owned card for common rarity (id=1)
-        # (Already created in setUp: self.card1 with rarity common)
-        # Ensure there is at least one card in the inventory for the rarity filter.
-        # In this branch, the view filters on card__rarity_id=rarity (where rarity is passed via POST)
-        # and then adjusts the image path.
-        response = self.client.post(reverse("EcoWorld:mergecards"), {
-            "mergebutton": "5",  # This should trigger the error condition.
-            "rarity": self.rarity_common.id,  # This is used to fetch the inventory.
-        })
-        self.assertEqual(response.status_code, 200)
-        # Check that the error message is as expected.
-        self.assertIn("error", response.context)
-        self.assertEqual(
-            response.context["error"],
-            "This card rarity cannot be merged!"
-        )
-        # Verify that the context contains playerItems and merge keys.
-        self.assertIn("playerItems", response.context)
-        self.assertIn("merge", response.context)
-        # The merge list should have 5 items (even if empty).
-        self.assertEqual(len(response.context["merge"]), 5)
+        """Tests merging cards with no rarity above them returns the appropriate error."""
+        #Fill the slots with uncommon cards, the highest rarity in this test
+        card_uncommon = card.objects.create(title="Card Uncommon", rarity_id=self.rarity_uncommon.id,
+                                            image="cards/card_uncommon.jpg")
+        Merge.objects.create(userID=self.user, cardID1=card_uncommon, cardID2=card_uncommon,
+                             cardID3=card_uncommon, cardID4=card_uncommon, cardID5=card_uncommon)
+
+        response = self.client.post(reverse("EcoWorld:merge_cards"), content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "This card rarity cannot be merged!")
+        #The cards stay in the slots
+        self.assertEqual(Merge.objects.get(userID=self.user).cardID1, card_uncommon)
+
+    def testMergeCardsNotFull(self):
+        """Tests merging with empty slots returns an error and changes nothing."""
+        Merge.objects.create(userID=self.user, cardID1=self.card1)
 
+        response = self.client.post(reverse("EcoWorld:merge_cards"), content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "You need 5 cards in the merge slots to merge")
+        self.assertEqual(Merge.objects.get(userID=self.user).cardID1, self.card1)
 
     def testMergeCardsProcessing(self):
-        """Tests that when mergebutton is submitted and merge slots are full, the merge is processed."""
+        """Tests that when the merge slots are full, the merge is processed."""
         # Create a card for uncommon rarity (rarity id=2) which will be the result of merging.
         card_uncommon = card.objects.create(
             title="Card Uncommon", 
@@ -991,13 +1443,8 @@ class TestMergeCards(TestCase):
         merge_instance.cardID5 = self.card1
         merge_instance.save()
 
-        # Simulate a merge action.
-        # Here, we pass mergebutton with a value that is not "5". In the view, the code converts the value 
-        # to an int and increments it. For example, if we send "1", then mergeCardsFunc becomes 1 and after increment, 2.
-        response = self.client.post(reverse("EcoWorld:mergecards"), {
-            "mergebutton": "1",  # a valid merge action
-            "rarity": self.rarity_common.id,  # initial rarity used to fetch inventory
-        })
+        response = self.client.post(reverse("EcoWorld:merge_cards"), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
 
         # The merge should have been processed, meaning:
         # - The merge slots are cleared.
@@ -1007,18 +1454,145 @@ class TestMergeCards(TestCase):
         self.assertIsNone(merge_instance.cardID3)
         self.assertIsNone(merge_instance.cardID4)
         self.assertIsNone(merge_instance.cardID5)
-        # - The user should receive a card of the next rarity (i.e. rarity 2, uncommon in our test setup).
-        # Since the template returned is "EcoWorld/merge_opening_page.html", we can check for that.
-        self.assertTemplateUsed(response, "EcoWorld/merge_opening_page.html")
+        # - The user receives a card of the next rarity, reported with its new quantity
+        data = response.json()
+        self.assertEqual(data["card"]["id"], card_uncommon.id)
+        self.assertEqual(data["inventory"], [{"card_id": card_uncommon.id, "quantity": 1}])
+        self.assertEqual([slot["card_id"] for slot in data["slots"]], [None] * 5)
         # - Also, the user's ownership for the uncommon card should be incremented.
         user_own_uncommon = ownsCard.objects.get(user=self.user, card=card_uncommon)
         self.assertEqual(user_own_uncommon.quantity, 1)
 
+    def testMergeCardsCreatesOwnership(self):
+        """Tests merging into a card the user has never owned adds it to their inventory"""
+        card_uncommon = card.objects.create(title="Card Uncommon", rarity_id=self.rarity_uncommon.id,
+                                            image="cards/card_uncommon.jpg")
+        Merge.objects.create(userID=self.user, cardID1=self.card1, cardID2=self.card1,
+                             cardID3=self.card1, cardID4=self.card1, cardID5=self.card1)
 
+        response = self.client.post(reverse("EcoWorld:merge_cards"), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ownsCard.objects.get(user=self.user, card=card_uncommon).quantity, 1)
+
+    def testAddCardResponse(self):
+        """Tests adding only returns the changed slot and quantity"""
+        response = self.client.post(reverse("EcoWorld:merge_add_card"), {"card_id": self.card1.id},
+                                    content_type="application/json")
+        self.assertEqual(response.json(), {
+            "success": True,
+            "slot": {"slot": 1, "card_id": self.card1.id, "image_url": self.card1.image.url},
+            "inventory": [{"card_id": self.card1.id, "quantity": 4}],
+        })
 
+    def testAddCardNotOwned(self):
+        """Tests adding a card the user does not own is rejected"""
+        response = self.client.post(reverse("EcoWorld:merge_add_card"), {"card_id": self.card2.id},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Merge.objects.filter(userID=self.user, cardID1__isnull=False).exists())
 
+    def testAddCardInvalidBody(self):
+        """Tests a request without a valid card id is rejected"""
+        response = self.client.post(reverse("EcoWorld:merge_add_card"), {"card_id": "abc"},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse("EcoWorld:merge_add_card"))
+        self.assertEqual(response.status_code, 405)
+
+    def testAddCardQueryCount(self):
+        """Tests adding a card costs a fixed handful of queries and renders nothing"""
+        Merge.objects.create(userID=self.user, cardID1=self.card1, cardID2=self.card1)
+        get_catalog()
+        # session, user, savepoint, merge with its slots, inventory row,
+        # quantity update, slot update, release savepoint
+        with self.assertNumQueries(8):
+            response = self.client.post(reverse("EcoWorld:merge_add_card"), {"card_id": self.card1.id},
+                                        content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["slot"]["slot"], 3)
 
 
+class TestAutoMerge(TestCase):
+    """
+    Tests merging every full set of a rarity at once
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        self.client.login(username="testuser", password="testpass")
+        self.common = cardRarity.objects.create(id=1, title="common")
+        self.rare = cardRarity.objects.create(id=2, title="rare")
+        self.card1 = card.objects.create(title="Card 1", rarity=self.common, image="cards/card1.jpg")
+        self.card2 = card.objects.create(title="Card 2", rarity=self.common, image="cards/card2.jpg")
+        self.rare_card = card.objects.create(title="Rare", rarity=self.rare, image="cards/rare.jpg")
+
+    def merge(self, rarity):
+        return self.client.post(reverse("EcoWorld:auto_merge_cards"), {"rarity": rarity},
+                                content_type="application/json")
+
+    def testMergesEverySet(self):
+        """Every full set is merged, taking from the largest stacks first"""
+        ownsCard.objects.create(user=self.user, card=self.card1, quantity=7)
+        ownsCard.objects.create(user=self.user, card=self.card2, quantity=4)
+
+        response = self.merge(self.common.id)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([c["id"] for c in data["cards"]], [self.rare_card.id] * 2)
+        self.assertCountEqual(data["inventory"], [
+            {"card_id": self.card1.id, "quantity": 0},
+            {"card_id": self.card2.id, "quantity": 1},
+            {"card_id": self.rare_card.id, "quantity": 2},
+        ])
+        #Stacks with no copies left are removed from the inventory
+        self.assertFalse(ownsCard.objects.filter(user=self.user, card=self.card1).exists())
+        self.assertEqual(ownsCard.objects.get(user=self.user, card=self.card2).quantity, 1)
+        self.assertEqual(ownsCard.objects.get(user=self.user, card=self.rare_card).quantity, 2)
+
+    def testAddsToOwnedUpgrades(self):
+        """Upgrades the user already owns are added to"""
+        ownsCard.objects.create(user=self.user, card=self.card1, quantity=5)
+        ownsCard.objects.create(user=self.user, card=self.rare_card, quantity=3)
+
+        self.assertEqual(self.merge(self.common.id).status_code, 200)
+        self.assertEqual(ownsCard.objects.get(user=self.user, card=self.rare_card).quantity, 4)
+
+    def testNotEnoughCards(self):
+        """Fewer than 5 cards of the rarity is an error and changes nothing"""
+        ownsCard.objects.create(user=self.user, card=self.card1, quantity=4)
+
+        response = self.merge(self.common.id)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "You need at least 5 cards of this rarity to merge")
+        self.assertEqual(ownsCard.objects.get(user=self.user, card=self.card1).quantity, 4)
+
+    def testTopRarity(self):
+        """The highest rarity cannot be merged"""
+        ownsCard.objects.create(user=self.user, card=self.rare_card, quantity=5)
+
+        response = self.merge(self.rare.id)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "This card rarity cannot be merged!")
+        self.assertEqual(self.merge("abc").status_code, 400)
+
+    def testQueryCountDoesNotDependOnSets(self):
+        """Clearing a large inventory costs no more queries than one set"""
+        ownsCard.objects.create(user=self.user, card=self.card1, quantity=5)
+        get_catalog()
+        # savepoint, stacks, inventory lock, savepoint, insert, release,
+        # delete emptied stack, release
+        with self.assertNumQueries(8):
+            auto_merge(self.user, self.common.id, random.Random(0))
+
+        ownsCard.objects.create(user=self.user, card=self.card1, quantity=5000)
+        # savepoint, stacks, inventory lock, delete, update, release
+        with self.assertNumQueries(6):
+            cards, quantities = auto_merge(self.user, self.common.id, random.Random(0))
+        self.assertEqual(len(cards), 1000)
+        self.assertEqual(quantities[self.rare_card.id], 1001)
+
 
 class TestMergeOpeningPage(TestCase):
     def setUp(self):
@@ -1030,6 +1604,13 @@ class TestMergeOpeningPage(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "EcoWorld/merge_opening_page.html")
 
+    def test_merge_opening_page_card(self):
+        """Tests the merged card is revealed"""
+        rarity = cardRarity.objects.create(title="Common")
+        merged = card.objects.create(title="Merged", rarity=rarity, image="cards/merged.jpg")
+        response = self.client.get(reverse("EcoWorld:mergereveal"), {"card": merged.id})
+        self.assertEqual(response.context["image"], merged.image.url)
+
 
 
 
@@ -1083,6 +1664,52 @@ class TestOwnsCard(TestCase):
         self.assertEqual(str(self.owns_card), expected_string)
 
 
+class TestInventory(TestCase):
+    """
+    Tests the inventory only holds cards the user owns, one row per card
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpass")
+        rarity = cardRarity.objects.create(title="common")
+        self.card1 = card.objects.create(title="log", rarity=rarity)
+        self.card2 = card.objects.create(title="bush", rarity=rarity)
+
+    def testGiveCard(self):
+        """Giving creates the row once then increments it"""
+        self.assertEqual(give_card(self.user, self.card1.id), 1)
+        self.assertEqual(give_card(self.user, self.card1.id, 3), 4)
+        self.assertEqual(ownsCard.objects.get(user=self.user, card=self.card1).quantity, 4)
+
+    def testTakeCard(self):
+        """Taking the last copy deletes the row and taking too many takes nothing"""
+        give_card(self.user, self.card1.id, 2)
+        self.assertIsNone(take_card(self.user, self.card1.id, 3))
+        self.assertEqual(take_card(self.user, self.card1.id), 1)
+        self.assertEqual(take_card(self.user, self.card1.id), 0)
+        self.assertFalse(ownsCard.objects.filter(user=self.user).exists())
+        self.assertIsNone(take_card(self.user, self.card1.id))
+
+    def testUpdateInventory(self):
+        """Many cards are added and taken together and emptied rows deleted"""
+        give_card(self.user, self.card1.id, 2)
+        quantities = update_inventory(self.user, {self.card1.id: -2, self.card2.id: 5})
+        self.assertEqual(quantities, {self.card1.id: 0, self.card2.id: 5})
+        self.assertEqual(list(ownsCard.objects.filter(user=self.user)
+                              .values_list("card_id", "quantity")), [(self.card2.id, 5)])
+        with self.assertRaises(ValueError), transaction.atomic():
+            update_inventory(self.user, {self.card2.id: -6})
+        self.assertEqual(ownsCard.objects.get(user=self.user, card=self.card2).quantity, 5)
+
+    def testOneRowPerCard(self):
+        """A user cannot have two rows for the same card"""
+        give_card(self.user, self.card1.id)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ownsCard.objects.create(user=self.user, card=self.card1, quantity=1)
+
+
 class TestMergeModel(TestCase):
     def setUp(self):
         #Create a test user
@@ -1238,3 +1865,84 @@ class ChallengesTest(TestCase):
         self.ongoing.refresh_from_db()
         self.assertIsNotNone(self.ongoing.submitted_on)
         self.assertTrue(timezone.is_aware(self.ongoing.submitted_on))
+
+    def test_challenge_summary_totals(self):
+        """
+        The summary's totals are worked out in one aggregate query, after the
+        objectives are loaded with their challenges.
+        """
+        ch2 = challenge.objects.create(name="Second", description="2", worth=5, goal=2)
+        ongoingChallenge.objects.create(user=self.user, challenge=ch2, progress=1,
+                                        submission="done")
+        ongoingChallenge.objects.filter(pk=self.ongoing.pk).update(progress=2)
+
+        with self.assertNumQueries(2):
+            summary = get_challenge_summary(self.user)
+            goals = [obj.challenge.goal for obj in summary["objectives"]]
+        self.assertEqual(sorted(goals), [2, 3])
+        self.assertEqual((summary["total"], summary["completed"], summary["goal"],
+                          summary["progress"]), (2, 1, 5, 3))
+
+        response = self.client.get(reverse("EcoWorld:challenge"))
+        self.assertEqual(response.context["completed_challenges"], 1)
+        self.assertEqual(response.context["total_objectives"], 5)
+        self.assertEqual(response.context["completed_objectives"], 3)
+
+    def test_increment_awards_coins_once(self):
+        """
+        Reaching the goal awards the challenge's coins once, however many
+        more times the objective is incremented.
+        """
+        url = reverse("EcoWorld:increment_objective")
+        for _ in range(self.challenge.goal + 2):
+            response = self.client.post(url, json.dumps({"objective_id": self.ongoing.id}),
+                                        content_type="application/json")
+        self.assertEqual(response.json(), {"success": False, "message": "Goal already reached"})
+
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.number_of_coins, self.challenge.worth)
+        self.assertEqual(UserEarntCoins.objects.filter(user=self.user).count(), 1)
+
+    def test_increment_is_bounded_in_database(self):
+        """
+        The goal is checked by the UPDATE itself, so an increment made from a
+        stale read of the progress cannot go past it.
+        """
+        stale = ongoingChallenge.objects.get(pk=self.ongoing.pk)
+        ongoingChallenge.objects.filter(pk=self.ongoing.pk).update(progress=self.challenge.goal)
+        self.assertLess(stale.progress, self.challenge.goal)
+
+        objective, incremented = increment_objective(self.user, stale.pk)
+        self.assertFalse(incremented)
+        self.assertEqual(objective.progress, self.challenge.goal)
+        self.assertFalse(UserEarntCoins.objects.filter(user=self.user).exists())
+
+    def test_increment_response_totals(self):
+        """
+        Incrementing returns the new progress and totals without reading
+        the objectives row by row.
+        """
+        url = reverse("EcoWorld:increment_objective")
+        body = json.dumps({"objective_id": self.ongoing.id})
+        self.client.get(reverse("EcoWorld:dashboard"))
+        # session, user and profile, savepoint, update, read back, release, totals
+        with self.assertNumQueries(7):
+            response = self.client.post(url, body, content_type="application/json")
+        self.assertEqual(response.json(), {
+            "success": True, "progress": 1, "goal": 3, "reward": 10,
+            "completed_objectives": 0, "total_objective_worth": 3,
+            "completed_objective_worth": 1,
+        })
+
+    def test_increment_other_users_objective(self):
+        """
+        Users cannot increment objectives that are not theirs.
+        """
+        other = User.objects.create_user(username="other", password="testpass")
+        theirs = ongoingChallenge.objects.create(user=other, challenge=self.challenge)
+        response = self.client.post(reverse("EcoWorld:increment_objective"),
+                                    json.dumps({"objective_id": theirs.id}),
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 404)
+        theirs.refresh_from_db()
+        self.assertEqual(theirs.progress, 0)
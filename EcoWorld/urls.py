@@ -7,7 +7,7 @@ including dashboard, store, pack management, challenges, and friend features.
 URL Patterns:
     - /: Main dashboard view
     - /store/: Game store interface
-    - /buyPack/: Pack purchase endpoint
+    - /buyPack/: Pack purchase endpoint, for one or several of a pack at once
     - /packopening/: Pack opening interface
     - /dashboard/: Alternative dashboard access
     - /challenge/: Challenge view and management
@@ -17,6 +17,10 @@ URL Patterns:
     - /add-challenge/: Challenge creation interface
     - /friends/: Friend management dashboard
     - /mergecards/: Card merging interface
+    - /mergecards/add/: Move a card into a merge slot (JSON)
+    - /mergecards/remove/: Take a card out of a merge slot (JSON)
+    - /mergecards/merge/: Merge the cards in the merge slots (JSON)
+    - /mergecards/auto/: Merge every full set of a rarity at once (JSON)
     - /mergereveal/: Merge result reveal page
     - /increment_objective/: Progress tracker update
     - /save_objective_note/: Objective note management
@@ -44,6 +48,10 @@ urlpatterns = [
     path("add-challenge/", views.add_challenge, name="add_challenge"),  # URL for adding challenges
     path("friends/", friends, name="friends"), #URL for friend dashboard
     path("mergecards/", mergecards, name="mergecards"), #URL for merging cards page
+    path("mergecards/add/", views.merge_add_card, name="merge_add_card"),
+    path("mergecards/remove/", views.merge_remove_card, name="merge_remove_card"),
+    path("mergecards/merge/", views.merge_cards_api, name="merge_cards"),
+    path("mergecards/auto/", views.auto_merge_cards, name="auto_merge_cards"),
     path("mergereveal/", merge_opening_page, name="mergereveal"),
     #Url for completing a challenge
     path('complete_challenge/', views.completeChallenge, name='complete_challenge'),
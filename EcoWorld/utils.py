@@ -3,71 +3,140 @@ Utility functions for EcoWorld challenge management.
 
 This module provides utility functions for managing game challenges,
 including challenge creation, assignment, and expiry handling. Features:
-    - Challenge generation and assignment
-    - Automatic challenge expiry management
-    - Challenge rotation and replacement
-    - User challenge state management
+    - Challenge generation and weighted assignment to whole cohorts
+    - Replacing every user's expired challenges in batches
+    - User challenge state management, with totals worked out in SQL and
+      progress incremented atomically
+    - Buying and opening packs
+    - Adding and taking cards from a user's inventory
+    - Locking a user's merge slots
+    - Merging every full set of five cards of a rarity at once
 """
 
 import random
+import uuid
+from collections import Counter
 
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
-from .models import ongoingChallenge, challenge
+from Accounts.utils import award_coins, spend_coins
+from forum.models import Post
+from leaderboards.models import UserEarntCoins
+from .catalog import get_catalog
+from .models import ongoingChallenge, ownsCard, PackOpening, Merge
+from .sampling import AliasTable, sample_distinct
+
+# The Merge fields holding each of the five merge slots, in order
+MERGE_SLOTS = [f"cardID{i}" for i in range(1, 6)]
+# Cards of one rarity needed to merge into one card of the next
+MERGE_SIZE = len(MERGE_SLOTS)
 
 
 def getUsersChallenges(user):
     """
-    Retrieve and manage current challenges for a user.
+    Retrieve the current challenges for a user.
 
-    This function handles the complete lifecycle of user challenges:
-    - Creates new challenges if none exist
-    - Manages challenge expiry and replacement
-    - Ensures challenge uniqueness per user
-    - Maintains the required number of active challenges
+    Expired challenges are replaced for every user at once by the
+    rotate_challenges management command, so this only reads, apart from
+    giving a user their first set of challenges the first time they have
+    none.
 
     Args:
-        user (User): The user whose challenges are being managed
+        user (User): The user whose challenges are being retrieved
 
     Returns:
-        QuerySet: Active ongoingChallenge instances for the user
+        QuerySet: The user's ongoingChallenge instances, with their challenge
 
     Note:
-        Challenge expiry is controlled by settings.CHALLENGE_EXPIRY
         Number of challenges is controlled by settings.NUM_CHALLENGES
     Author:
         Lewis Farley (lf507@exeter.ac.uk), Theodore Armes (tesa201@exeter.ac.uk)
     """
-    challenges = list(ongoingChallenge.objects.filter(user=user))
-    if len(challenges) == 0:
-        ## there are no challenges for the user, create them
-        createChallenges(user)
-    else:
-        expired = [
-            x for x in challenges
-            if timezone.now() - x.created_on > settings.CHALLENGE_EXPIRY
-        ]
-        possible_challenges = list(challenge.objects.all())
-
-        for e in expired:
-            e.delete()
-            challenges.remove(e)
-        for _ in range(len(expired)):
-            # create new challenges to replace the removed ones
-            c = random.choice(possible_challenges)
-            # make sure the challenge isn't already in the users challenges
-            while c in [ch.challenge for ch in
-                        challenges]:
-                c = random.choice(possible_challenges)
-
-            ongoingChallenge.objects.create(challenge=c,
-                                            user=user,
-                                            submission=None,
-                                            submitted_on=None)
-            possible_challenges.remove(c)
-            
-    return ongoingChallenge.objects.filter(user=user)
+    challenges = ongoingChallenge.objects.filter(user=user).select_related("challenge")
+    if challenges:
+        return challenges
+    ## there are no challenges for the user, create them
+    createChallenges(user)
+    return challenges.all()
+
+
+def get_challenge_totals(user):
+    """
+    Total up a user's challenges in one aggregate query.
+
+    Args:
+        user (User): The user whose challenges are totalled
+
+    Returns:
+        dict: The number of challenges (total) and of submitted ones
+            (completed), and the sum of their goals (goal) and of the progress
+            made towards them (progress)
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    return ongoingChallenge.objects.filter(user=user).aggregate(
+        total=Count("id"),
+        completed=Count("id", filter=Q(submission__isnull=False)),
+        goal=Coalesce(Sum("challenge__goal"), 0),
+        progress=Coalesce(Sum("progress"), 0),
+    )
+
+
+def get_challenge_summary(user):
+    """
+    Get a user's current challenges along with their totals, for the
+    challenges page.
+
+    Args:
+        user (User): The user whose challenges are summarised
+
+    Returns:
+        dict: The user's ongoingChallenge instances with their challenge
+            (objectives) and the totals from get_challenge_totals
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    objectives = list(getUsersChallenges(user))
+    return {"objectives": objectives, **get_challenge_totals(user)}
+
+
+def increment_objective(user, objective_id):
+    """
+    Add one to the progress of one of a user's challenges, awarding its coins
+    when this takes it to its goal.
+
+    The increment is a single UPDATE that only matches while progress is
+    below the goal, so requests made at the same time can neither take
+    progress past the goal nor both be the one that reaches it, and the coins
+    are awarded exactly once.
+
+    Args:
+        user (User): The user making progress
+        objective_id (int): The id of the user's ongoingChallenge
+
+    Returns:
+        tuple: The ongoingChallenge after the increment, with its challenge,
+            or None if the user has no such challenge, and whether progress
+            was added
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk), Theodore Armes (tesa201@exeter.ac.uk)
+    """
+    objectives = ongoingChallenge.objects.filter(id=objective_id, user=user)
+    with transaction.atomic():
+        incremented = objectives.filter(progress__lt=F("challenge__goal")).update(
+            progress=F("progress") + 1)
+        # the UPDATE holds the row until commit, so this reads our own increment
+        objective = objectives.select_related("challenge").first()
+        if incremented and objective.progress == objective.challenge.goal:
+            award_coins(user, objective.challenge.worth, UserEarntCoins.DAILY_OBJECTIVE)
+    return objective, bool(incremented)
 
 
 def createChallenges(user):
@@ -84,25 +153,342 @@ def createChallenges(user):
     Returns:
         None
 
-    Raises:
-        IndexError: If there aren't enough challenges in the database
-            to meet the NUM_CHALLENGES requirement
-
     Note:
         The number of challenges created is controlled by settings.NUM_CHALLENGES
   
     Author:
         Lewis Farley (lf507@exeter.ac.uk), Theodore Armes (tesa201@exeter.ac.uk)
     """
-    challenges = list(challenge.objects.all())
-    try:
-        for _ in range(settings.NUM_CHALLENGES):
-            c = random.choice(challenges)
-            challenges.remove(c)
-            ongoingChallenge.objects.create(challenge=c,
-                                            user=user,
-                                            submission=None,
-                                            submitted_on=None)
-    except IndexError:
-        print("not enough challenges")
-        print("it is possible that the database hasn't been populated with enough challenges")
+    assign_challenges({user.id: set()})
+
+
+def build_challenge_sampler():
+    """
+    Get an alias table over every challenge that can be given out,
+    weighted by each challenge's weight.
+
+    The table is built from the cached catalogue and kept with it, so it is
+    only rebuilt when the challenges change.
+
+    Returns:
+        AliasTable: A table whose outcomes are challenge ids, or None if no
+            challenge can be given out
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    def build():
+        rows = [(c.id, c.weight) for c in catalog.challenges.values() if c.weight > 0]
+        if not rows:
+            return None
+        ids, weights = zip(*rows)
+        return AliasTable(ids, weights)
+
+    catalog = get_catalog()
+    return catalog.memo("challenges", build)
+
+
+def assign_challenges(kept, sampler=None, rng=None):
+    """
+    Top every user in a cohort up to NUM_CHALLENGES challenges in one insert.
+
+    Each user's new challenges are drawn by weight without replacement,
+    never repeating one they already have, in O(NUM_CHALLENGES) draws from
+    one alias table shared by the whole cohort.
+
+    Args:
+        kept (dict): User id to the set of challenge ids they still have
+        sampler (AliasTable): Optional table from build_challenge_sampler,
+            to share between batches
+        rng: Optional seeded random.Random for reproducible assignments
+
+    Returns:
+        list: The ongoingChallenge rows created
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    rng = rng or random
+    sampler = sampler or build_challenge_sampler()
+    new = []
+    for user_id, have in kept.items():
+        need = settings.NUM_CHALLENGES - len(have)
+        if need <= 0:
+            continue
+        drawn = sample_distinct(sampler, need, have, rng) if sampler else []
+        if len(drawn) < need:
+            print("not enough challenges")
+            print("it is possible that the database hasn't been populated with enough challenges")
+        new.extend(ongoingChallenge(challenge_id=c, user_id=user_id) for c in drawn)
+    return ongoingChallenge.objects.bulk_create(new)
+
+
+def rotate_challenges(batch_size=500, rng=None):
+    """
+    Replace every expired challenge, for all users, in batches.
+
+    Users with an expired challenge are found in one query and handled
+    batch_size at a time. Each batch is one transaction: the expired rows are
+    deleted in one query, what the users have left is read in another and
+    the replacements are drawn by assign_challenges and made in one insert,
+    so the number of queries grows with the number of batches rather than
+    the number of users.
+
+    Args:
+        batch_size (int): The number of users to rotate in each transaction
+        rng: Optional seeded random.Random for reproducible rotations
+
+    Returns:
+        tuple: The number of users rotated and the number of challenges
+            replaced
+
+    Note:
+        Challenge expiry is controlled by settings.CHALLENGE_EXPIRY
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    rng = rng or random
+    cutoff = timezone.now() - settings.CHALLENGE_EXPIRY
+    user_ids = list(ongoingChallenge.objects.filter(created_on__lte=cutoff)
+                    .order_by("user_id").values_list("user_id", flat=True).distinct())
+    if not user_ids:
+        return 0, 0
+    sampler = build_challenge_sampler()
+
+    replaced = 0
+    for i in range(0, len(user_ids), batch_size):
+        batch = user_ids[i:i + batch_size]
+        with transaction.atomic():
+            ongoingChallenge.objects.filter(user_id__in=batch, created_on__lte=cutoff).delete()
+            kept = {user_id: set() for user_id in batch}
+            for user_id, challenge_id in (ongoingChallenge.objects.filter(user_id__in=batch)
+                                          .values_list("user_id", "challenge_id")):
+                kept[user_id].add(challenge_id)
+            replaced += len(assign_challenges(kept, sampler, rng))
+    return len(user_ids), replaced
+
+
+def open_packs(user, selected_pack, count=1, rng=None):
+    """
+    Buy and open a number of the same pack for a user in one transaction.
+
+    The total cost is taken with a single conditional update, every card is
+    drawn from the pack's cached sampler, and the user's inventory is
+    updated in one go by update_inventory rather than one save per pack. A
+    forum post is made for each distinct card opened and every opening is
+    recorded under one shared token. The number of queries does
+    not depend on count.
+
+    Args:
+        user (User): The user buying the packs
+        selected_pack (pack): The pack being bought
+        count (int): How many packs to open
+        rng: Optional seeded random.Random for reproducible openings
+
+    Returns:
+        tuple: The opening token and the list of cards opened, or None if
+            the user cannot afford the packs
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    with transaction.atomic():
+        if not spend_coins(user, selected_pack.cost * count):
+            return None
+
+        cards = [selected_pack.openPack(rng) for _ in range(count)]
+        counts = Counter(c.id for c in cards)
+        update_inventory(user, counts)
+
+        Post.objects.bulk_create([Post(user=user, post_type='card', card_achievement_id=card_id)
+                                  for card_id in counts])
+
+        token = uuid.uuid4().hex
+        PackOpening.objects.bulk_create([PackOpening(user=user, pack=selected_pack,
+                                                     card=c, token=token) for c in cards])
+    return token, cards
+
+
+def update_inventory(user, changes):
+    """
+    Apply a set of quantity changes to a user's inventory in one update.
+
+    The inventory is sparse: a user only has a row for a card while they own
+    at least one copy. Rows the user already has are locked and changed with
+    a single conditional increment, rows that fall to zero are deleted, and
+    rows for cards they did not own are created in one insert, so the number
+    of queries does not depend on how many cards change.
+
+    If another request creates one of the new rows first, the unique
+    (user, card) constraint rejects the insert and the changes are retried
+    against the rows that now exist, so copies are never lost or duplicated.
+
+    Args:
+        user (User): The user whose inventory to change
+        changes (dict): Card id to the number of copies to add, negative to
+            take copies away.
+
+    Returns:
+        dict: Card id to its new quantity, for every card that changed
+
+    Raises:
+        ValueError: If more copies of a card would be taken than the user owns
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    changes = {card_id: n for card_id, n in changes.items() if n}
+    with transaction.atomic(savepoint=False):
+        owned = dict(ownsCard.objects.select_for_update()
+                     .filter(user=user, card_id__in=changes)
+                     .values_list("card_id", "quantity"))
+        quantities = {card_id: owned.get(card_id, 0) + n for card_id, n in changes.items()}
+        if any(quantity < 0 for quantity in quantities.values()):
+            raise ValueError("Cannot take more copies of a card than the user owns")
+
+        new = [ownsCard(user=user, card_id=card_id, quantity=n)
+               for card_id, n in changes.items() if card_id not in owned]
+        if new:
+            try:
+                with transaction.atomic():
+                    ownsCard.objects.bulk_create(new)
+            except IntegrityError:
+                # another request gave the user one of these cards first
+                return update_inventory(user, changes)
+
+        emptied = [card_id for card_id in owned if quantities[card_id] == 0]
+        changed = [card_id for card_id in owned if quantities[card_id] > 0]
+        if emptied:
+            ownsCard.objects.filter(user=user, card_id__in=emptied).delete()
+        if changed:
+            ownsCard.objects.filter(user=user, card_id__in=changed).update(
+                quantity=F("quantity") + Case(*[When(card_id=card_id, then=Value(changes[card_id]))
+                                                for card_id in changed]))
+    return quantities
+
+
+def auto_merge(user, rarity_id, rng=None):
+    """
+    Merge every full set of MERGE_SIZE cards a user owns of one rarity into
+    random cards of the next rarity, in one transaction.
+
+    The sets are made up from the user's largest stacks first, so cards
+    they only have a few copies of are the last to go. Every upgraded card
+    is drawn in one pass and the inventory changed with one update, however
+    many sets there are. Cards already in the merge slots are left alone.
+
+    Args:
+        user (User): The user merging their cards
+        rarity_id (int): The id of the rarity to merge
+        rng: Optional seeded random.Random for reproducible merges
+
+    Returns:
+        tuple: The list of cards received and a dict of card id to new
+            quantity for every card that changed, both empty if the user
+            does not have a full set, or None if the rarity cannot be merged
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    rng = rng or random
+    upgrades = get_catalog().cards_by_rarity.get(rarity_id + 1)
+    if not upgrades:
+        return None
+
+    with transaction.atomic():
+        stacks = list(ownsCard.objects.select_for_update()
+                      .filter(user=user, card__rarity_id=rarity_id)
+                      .order_by("-quantity", "card_id")
+                      .values_list("card_id", "quantity"))
+        sets = sum(quantity for _, quantity in stacks) // MERGE_SIZE
+        if not sets:
+            return [], {}
+
+        changes = Counter()
+        remaining = sets * MERGE_SIZE
+        for card_id, quantity in stacks:
+            taken = min(quantity, remaining)
+            changes[card_id] -= taken
+            remaining -= taken
+            if not remaining:
+                break
+
+        received = rng.choices(upgrades, k=sets)
+        for c in received:
+            changes[c.id] += 1
+        return received, update_inventory(user, changes)
+
+
+def get_locked_merge(user):
+    """
+    Get a user's merge slots, creating them if needed, locked until the end
+    of the current transaction.
+
+    The cards in every slot are loaded in the same query so reading their
+    rarity or image costs nothing more. Only the merge row itself is locked,
+    as the slots may be empty.
+
+    Args:
+        user (User): The user whose merge slots to get
+
+    Returns:
+        Merge: The user's merge row
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    merge, _ = (Merge.objects.select_for_update(of=("self",))
+                .select_related(*MERGE_SLOTS)
+                .get_or_create(userID=user))
+    return merge
+
+
+def give_card(user, card_id, amount=1):
+    """
+    Add copies of a card to a user's inventory, creating the row if they do
+    not own it yet.
+
+    Args:
+        user (User): The user receiving the card
+        card_id (int): The id of the card
+        amount (int): How many copies to add
+
+    Returns:
+        int: The number of copies the user now owns
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    return update_inventory(user, {card_id: amount})[card_id]
+
+
+def take_card(user, card_id, amount=1):
+    """
+    Take copies of a card out of a user's inventory if they have enough,
+    deleting the row when the last copy is taken.
+
+    Args:
+        user (User): The user giving up the card
+        card_id (int): The id of the card
+        amount (int): How many copies to take
+
+    Returns:
+        int: The number of copies the user has left, or None if they did not
+            have enough and nothing was taken
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    with transaction.atomic(savepoint=False):
+        try:
+            owned = ownsCard.objects.select_for_update().get(user=user, card_id=card_id)
+        except ownsCard.DoesNotExist:
+            return None
+        if owned.quantity < amount:
+            return None
+        owned.quantity -= amount
+        if owned.quantity:
+            owned.save(update_fields=["quantity"])
+        else:
+            owned.delete()
+    return owned.quantity
@@ -14,6 +14,7 @@ from datetime import datetime
 from django.conf import settings
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.models import Permission
+from django.db import transaction
 from django.db.models import Q
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, render, redirect
@@ -21,52 +22,30 @@ from django.utils.timezone import now
 from django.views.decorators.csrf import csrf_exempt
 
 from Accounts.models import Friends, FriendRequests
+from Accounts.utils import award_coins
 from forum.models import Post, PostInteraction
+from leaderboards.models import UserEarntCoins
 from qrCodes.models import drinkEvent
+from .catalog import get_catalog
 from .forms import ChallengeForm
-from .models import User, pack, ownsCard, ongoingChallenge, card, Merge
-from .utils import getUsersChallenges
+from .models import User, ownsCard, ongoingChallenge, Merge, PackOpening
+from .utils import (get_challenge_summary, get_challenge_totals, increment_objective,
+                    open_packs, get_locked_merge, give_card, take_card, auto_merge, MERGE_SLOTS)
 
 
 # Create your views here.
-def getUserInfo(request):
-    """
-    This function gets the user info for the navbar
-    Returns: user info to be displayed on the navbar
-
-    Author:
-        Ethan Sweeney (es1052@exeter.ac.uk)
-    """
-    user = request.user
-    user = User.objects.get(id=user.id)
-    pfp_url = user.profile.profile_picture
-    pfp_url = "/media/pfps/" + pfp_url
-
-    userinfo = []
-    userinfo.append({
-        "username": user.username,
-        "pfp_url": pfp_url,
-        "coins": user.profile.number_of_coins
-    })
-    return userinfo
-
-
 @login_required
 def dashboard(request):
     """
-    Dashboard on request takes user info to send to dashboard
-    Returns: render request and userinfo to be displayed
+    Renders the dashboard, the user info in its navbar is added by
+    Accounts.context_processors.userinfo
+    Returns: render request
 
     Author:
         Chris Lynch (cl1037@exeter.ac.uk)
     """
-
-    #Upon loading the page the dashboard needs its username and pfp along with coins,
-    # this function here gives it to the dashboard html file
     if request.method == "GET":
-        userinfo = getUserInfo(request)
-
-        return render(request, "EcoWorld/dashboard.html", {"userinfo":userinfo[0]})
+        return render(request, "EcoWorld/dashboard.html")
 
 @login_required
 def store(request):
@@ -83,7 +62,7 @@ def store(request):
 
     """
     if request.method == "GET":
-        packs = pack.objects.all()
+        packs = get_catalog().packs.values()
         pack_list = []
         #Gets all info from each of the 3 packs
         for pack_ in packs:
@@ -103,11 +82,9 @@ def store(request):
 
             })
 
-        #Function to get the user data and then adds it to the user dictionary
-        userinfo = getUserInfo(request)
-
         #Sends the info to the page
-        return render(request, "EcoWorld/store.html",{ "packs": pack_list, "userinfo": userinfo[0]})
+        return render(request, "EcoWorld/store.html",{ "packs": pack_list,
+                                                       "max_packs": settings.MAX_PACKS_PER_PURCHASE})
 
     return HttpResponse("Invalid request")
 
@@ -115,11 +92,17 @@ def store(request):
 @login_required
 def buy_pack(request):
     """
-    Function to handle purchasing a pack and making sure the user can
+    Function to handle purchasing packs and making sure the user can
+    Up to MAX_PACKS_PER_PURCHASE of the same pack can be bought at once by
+    sending a count. The coins are taken with a conditional update, the
+    cards are rolled and added to the user's inventory and the openings are
+    recorded, all in one transaction, so clicking buy several times at once
+    can never spend the same coins twice.
     Returns:
     Appropriate error if error
     No coins if the user doesnt have enough
-    Success if it can be bought
+    Success if it can be bought, with the token of the opening to reveal
+    and the cards received
 
     Author:
         Chris Lynch (cl1037@exeter.ac.uk)
@@ -131,19 +114,32 @@ def buy_pack(request):
             user = request.user
             pack_id = data.get("pack_id")
             try:
-                selected_pack = pack.objects.get(id=pack_id)
-            except pack.DoesNotExist:
+                selected_pack = get_catalog().packs.get(int(pack_id))
+            except (TypeError, ValueError):
+                selected_pack = None
+            if selected_pack is None:
                 return JsonResponse({"error": "Invalid pack selected"}, status=400)
 
-            #Checks if user can buy the pack
-            if selected_pack.cost > user.profile.number_of_coins:
-                return JsonResponse({"error": "Insufficient coins"}, status=400)
+            try:
+                count = int(data.get("count", 1))
+            except (TypeError, ValueError):
+                count = 0
+            if not 1 <= count <= settings.MAX_PACKS_PER_PURCHASE:
+                return JsonResponse({"error": "Invalid number of packs"}, status=400)
 
-            #If pack found it takes the coins out and gives success
-            user.profile.number_of_coins -= selected_pack.cost
-            user.profile.save()
+            #Takes the coins out only if the user can afford the packs
+            try:
+                opened = open_packs(user, selected_pack, count)
+            except ValueError:
+                #None of the pack's rarities have cards, the coins are given back
+                return JsonResponse({"error": "This pack has no cards to open"}, status=400)
+            if opened is None:
+                return JsonResponse({"error": "Insufficient coins"}, status=400)
 
-            return JsonResponse({"success": True})
+            token, cards = opened
+            return JsonResponse({"success": True, "token": token,
+                                 "cards": [{"id": c.id, "title": c.title,
+                                            "image_url": c.image.url} for c in cards]})
 
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=500)
@@ -154,9 +150,8 @@ def buy_pack(request):
 def pack_opening_page(request):
     """
     Webpage to render the pack opening animation. When a pack is bought it
-    redirects to here where it will send the correct info
-    to the page so the right pack gets opened
-    It has a function to buy pack from the packs model in models.py
+    redirects to here with the token of the opening so the card the user
+    received is revealed
     Returns:
     Bought pack card won
 
@@ -164,25 +159,19 @@ def pack_opening_page(request):
     Chris Lynch (cl1037@exeter.ac.uk)
 
     """
-    #Gets pack id
-    pack_id = request.GET.get("pack_id")
+    #Gets the openings for the token, one per pack bought together
+    token = request.GET.get("token")
+    openings = list(PackOpening.objects.select_related("card")
+                    .filter(token=token, user=request.user).order_by("id"))
     #Error checks if it works
-    try:
-        selected_pack = pack.objects.get(id=pack_id)
-    except pack.DoesNotExist:
-        return JsonResponse({"error": "Invalid pack ID"}, status=400)
+    if not openings:
+        return JsonResponse({"error": "Invalid pack opening"}, status=404)
 
-    #Card received variable when opening a pack, adds to inventory and saves
-    card_received = selected_pack.openPack()
-    inventory, _ = ownsCard.objects.get_or_create(user=request.user, card=card_received)
-    inventory.quantity += 1
-    inventory.save()
-    Post.create_from_card(card_received, request.user)
-
-
-    #Image of the card won to return to the page
-    image_url = card_received.image.url
-    return render(request, "EcoWorld/pack_opening_page.html", {"image": image_url})
+    #Images of the cards won and the pack for the animation to return to the page
+    images = [opening.card.image.url for opening in openings]
+    return render(request, "EcoWorld/pack_opening_page.html", {"image": images[0],
+                                                               "images": images,
+                                                               "pack_id": openings[0].pack_id})
 
 @login_required
 def challenge(request):
@@ -201,8 +190,9 @@ def challenge(request):
     Author:
         Lewis Farley (lf507@exeter.ac.uk), Theodore Armes (tesa201@exeter.ac.uk)
     """
-    daily_objectives = getUsersChallenges(request.user)
-    user = User.objects.get(id=request.user.id)
+    summary = get_challenge_summary(request.user)
+    # the profile is loaded with request.user, see Accounts.backends
+    user = request.user
 
     # Get the user's last drink event
     last_drink = drinkEvent.objects.filter(user=user).order_by('-drank_on').first()
@@ -215,21 +205,16 @@ def challenge(request):
         is_drink_available = time_difference >= settings.DRINKING_COOLDOWN
 
     today = date.today()
-    total_daily_objectives = len(daily_objectives)
-    completed_daily_objectives = sum(1 for c in daily_objectives if c.is_complete())
-    # Total worth of all objectives
-    total_objective_worth = sum(obj.challenge.goal for obj in daily_objectives)
-    # Sum of completed progress
-    completed_objective_worth = sum(obj.progress for obj in daily_objectives)
     context = {
-        "daily_objectives": daily_objectives,
+        "daily_objectives": summary["objectives"],
         "username": user.username,
         "coins": user.profile.number_of_coins,
         "today_date": today,
-        "total_challenges": total_daily_objectives,
-        "completed_challenges": completed_daily_objectives,
-        "total_objectives": total_objective_worth,
-        "completed_objectives": completed_objective_worth,
+        "total_challenges": summary["total"],
+        "completed_challenges": summary["completed"],
+        # Total worth of all objectives and the progress made towards it
+        "total_objectives": summary["goal"],
+        "completed_objectives": summary["progress"],
         "last_drink_time": last_drink_time,
         "is_drink_available": is_drink_available,
         "settings": {
@@ -245,8 +230,9 @@ def increment_daily_objective(request):
     Increments the progress of a daily objective by 1 and rewards coins when completed.
 
     - Retrieves the objective ID from the POST request.
-    - Increases the progress counter if it hasn't reached the goal.
-    - Marks the objective as completed and rewards the user with coins if fully completed.
+    - Increases the progress counter if it hasn't reached the goal, see
+      utils.increment_objective.
+    - Rewards the user with coins if this completes the objective.
     - Returns updated progress and total completion data.
 
     Returns:
@@ -259,44 +245,22 @@ def increment_daily_objective(request):
         data = json.loads(request.body)
         objective_id = data.get("objective_id")
 
-
-        objective = ongoingChallenge.objects.get(id=objective_id, user=request.user)
-        if objective.progress < objective.challenge.goal:  # Ensure it does not exceed goal
-            objective.progress += 1
-            objective.save()
-
-            # If the objective is now complete, mark as completed and give coins
-            if objective.progress == objective.challenge.goal:
-                objective.completed = True
-                request.user.profile.number_of_coins += objective.challenge.worth  # Add coins
-                request.user.profile.save()
-                objective.save()
-
-
-            users_ongoing_challenges = ongoingChallenge.objects.filter(user=request.user)
-            completed_objectives_count =0
-            for challenge in users_ongoing_challenges:
-                if challenge.is_complete():
-                    completed_objectives_count +=1
-
-            daily_objectives = getUsersChallenges(request.user)
-            # Total worth of all objectives
-            total_objective_worth = sum(obj.challenge.goal for obj in daily_objectives)
-
-            # Sum of completed progress
-            completed_objective_worth = sum(obj.progress for obj in daily_objectives)
-            return JsonResponse({
-                "success": True,
-                "progress": objective.progress,
-                "goal": objective.challenge.goal,
-                "reward": objective.challenge.worth,
-                "completed_objectives": completed_objectives_count,
-                "total_objective_worth":total_objective_worth,
-                "completed_objective_worth":completed_objective_worth
-            })
-
-        else:
+        objective, incremented = increment_objective(request.user, objective_id)
+        if objective is None:
+            return JsonResponse({"success": False, "message": "Objective not found"}, status=404)
+        if not incremented:
             return JsonResponse({"success": False, "message": "Goal already reached"})
+
+        totals = get_challenge_totals(request.user)
+        return JsonResponse({
+            "success": True,
+            "progress": objective.progress,
+            "goal": objective.challenge.goal,
+            "reward": objective.challenge.worth,
+            "completed_objectives": totals["completed"],
+            "total_objective_worth": totals["goal"],
+            "completed_objective_worth": totals["progress"]
+        })
     return JsonResponse({"success": False, "message": "Invalid request"}, status=400)
 
 @login_required
@@ -317,15 +281,14 @@ def completeChallenge(request):
     """
     if request.method == "POST":
         data = json.loads(request.body)
-        user = User.objects.get(id=request.user.id)
+        user = request.user
         on_going_challenge = data["id"]
 
         chal = ongoingChallenge.objects.get(id=on_going_challenge)
         worth = chal.challenge.worth
         chal.submitted_on = datetime.now()
 
-        user.profile.number_of_coins += worth
-        user.save()
+        award_coins(user, worth, UserEarntCoins.CHALLENGE)
         chal.save()
         return HttpResponse("Challenge completed")
     return HttpResponse("Invalid request type")
@@ -340,9 +303,6 @@ def gamekeeper_page(request):
     Author:
         Ethan Sweeney (es1052@exeter.ac.uk)
     """
-    if request.method == "GET":
-        userinfo = getUserInfo(request)
-
     users = User.objects.exclude(user_permissions__codename="can_view_gamekeeper_button")
     missing_rows = range(max(0, 3 - users.count()))
 
@@ -363,7 +323,6 @@ def gamekeeper_page(request):
     return render(request, "EcoWorld/gamekeeper_page.html", {
         "users": users, 
         "missing_rows": missing_rows, 
-        "userinfo": userinfo[0],
         "posts": posts_data
     })
 
@@ -432,8 +391,6 @@ def friends(request):
     """
     if request.method == "GET":
         user=request.user
-        userinfo = getUserInfo(request)
-
         #Gets pending requests
         friendreqs = FriendRequests.objects.filter(receiverID=user)
 
@@ -442,12 +399,10 @@ def friends(request):
 
 
         return render(request, "EcoWorld/friends.html",
-                      {"userinfo" : userinfo[0],
-                       "friendreqs": friendreqs,
+                      {"friendreqs": friendreqs,
                        "friends" : user_friends})
 
     elif request.method == "POST":
-        userinfo = getUserInfo(request)
         user = request.user
         user_id= user.id
         #Gets pending requests
@@ -480,8 +435,7 @@ def friends(request):
             if not requested_user:
                 error = "User Not Found!"
                 return render(request, "EcoWorld/friends.html",
-                              {"userinfo": userinfo[0],
-                               "error" : error,
+                              {"error" : error,
                                "friendreqs" : friendreqs,
                                "friends" : user_friends})
 
@@ -489,8 +443,7 @@ def friends(request):
             if username == user.username:
                 error = "You cant request yourself"
                 return render(request, "EcoWorld/friends.html",
-                              {"userinfo": userinfo[0],
-                               "error" : error,
+                              {"error" : error,
                                "friendreqs" : friendreqs,
                                "friends" : user_friends})
 
@@ -505,8 +458,7 @@ def friends(request):
             if existing_request:
                 error = "Friend request already pending"
                 return render(request, "EcoWorld/friends.html",
-                              {"userinfo": userinfo[0],
-                               "error" : error,
+                              {"error" : error,
                                "friendreqs" : friendreqs,
                                "friends" : user_friends})
 
@@ -518,8 +470,7 @@ def friends(request):
             if existing_friends:
                 error = "You are already friends with this user!"
                 return render(request, "EcoWorld/friends.html",
-                              {"userinfo": userinfo[0],
-                               "error" : error,
+                              {"error" : error,
                                "friendreqs" : friendreqs,
                                "friends" : user_friends})
 
@@ -528,8 +479,7 @@ def friends(request):
             FriendRequests.objects.create(senderID=request.user, receiverID=requested_user)
             add_message = "Friend request sent!"
             return render(request, "EcoWorld/friends.html",
-                          {"userinfo":userinfo[0],
-                           "friendreqs" : friendreqs,
+                          {"friendreqs" : friendreqs,
                            "addmessage": add_message,
                            "friends" : user_friends})
 
@@ -549,8 +499,7 @@ def friends(request):
                 user_friends = Friends.objects.filter(Q(userID1=user) | Q(userID2=user))
 
                 return render(request, "EcoWorld/friends.html",
-                              {"userinfo":userinfo[0],
-                               "friendreqs" : friendreqs,
+                              {"friendreqs" : friendreqs,
                                "friends" : user_friends})
 
             else:
@@ -561,8 +510,7 @@ def friends(request):
                 friendreqs = FriendRequests.objects.filter(receiverID=user)
 
                 return render(request, "EcoWorld/friends.html",
-                              {"userinfo":userinfo[0],
-                               "friendreqs" : friendreqs,
+                              {"friendreqs" : friendreqs,
                                "friends" : user_friends})
 
 
@@ -582,351 +530,253 @@ def friends(request):
 
 
             return render(request, "EcoWorld/friends.html",
-                          {"userinfo":userinfo[0],
-                           "friendreqs" : friendreqs,
+                          {"friendreqs" : friendreqs,
                            "friends" : user_friends})
 
 
 
-@login_required
-def mergecards(request):
-    """
-    Function to handle all the intricacies of merging cards together.
-    It allows users to add and remove cards from the slots in their individual merge area
-    It allows users to merge 5 cards of the same rarity together
-    It renders the page for each POST request to keep updating entries
-    This function uses the merge model in models.py to hold cards entered into the merge slots
-    
-    Author: 
-    Chris Lynch (cl1037@exeter.ac.uk)
+def merge_slot_json(slot, slot_card):
     """
-    user = request.user
-    userinfo = getUserInfo(request)
-
-    if request.method == "GET":
-
-        merge, created = Merge.objects.get_or_create(userID=request.user)
-
-        cardImages = []
-
-        #Go through the merge DB and get the mergeCardID and the image for the template
-        for i in range(1, 6):
-            cardField = getattr(merge, f'cardID{i}', None)
-            if cardField:
-                cardImages.append({'id': f'cardID{i}', 'image': cardField.image.url})
-            else:
-                cardImages.append({'id': None, 'image' : None})
-
-
-
-        return render(request, "EcoWorld/mergecards.html",
-                      {"userinfo" : userinfo[0],
-                       "merge":cardImages})
-
-    elif request.method == "POST":
-        #Gets rarity option chosen if so
-        rarity = request.POST.get("rarity")
-        addCard = request.POST.get("addCard")
-        removeCard = request.POST.get("removeCard")
-
-        mergeCardsFunc = request.POST.get("mergebutton")
-
-
-
-        if rarity:
-            #Gets the player inventory for the certain rarity
-            playerInventoryStorage = ownsCard.objects.filter(user=request.user, card__rarity_id=rarity).select_related('card').values('card__title', 'card__image', 'quantity', 'card__id')
-
-            #Puts the media tag onto the image for it to be used
-            for item in playerInventoryStorage:
-                item['card__image'] = "/media/" + item['card__image']
-
-
-            playerItems = playerInventoryStorage
-
-            merge, created = Merge.objects.get_or_create(userID=request.user)
-
-            cardImages = []
-
-            #Go through the merge DB and get the mergeCardID and the image for the template
-            for i in range(1, 6):
-                cardField = getattr(merge, f'cardID{i}', None)
-                if cardField:
-                    cardImages.append({'id': f'cardID{i}', 'image': cardField.image.url})
-                else:
-                    cardImages.append({'id': None, 'image' : None})
-
-
-            try:
-                if int(mergeCardsFunc) == 5:
-                    error = "This card rarity cannot be merged!"
-                    return render(request, "EcoWorld/mergecards.html",
-                                  {"userinfo": userinfo[0], "playerItems": playerItems, "rarity": rarity,
-                                   "merge": cardImages, "error": error})
-            except TypeError:
-                return render(request, "EcoWorld/mergecards.html", {"userinfo" : userinfo[0], "playerItems": playerItems, "rarity":rarity,"merge":cardImages},)
-
-        if addCard:
-            #Get rarity and card id
-            rarityforbutton = request.POST.get("rarityforbutton")
-            cardID = addCard
-
-            merge, created = Merge.objects.get_or_create(userID=request.user)
-
-            cardImages = []
-
-            #Go through the merge DB and get the mergeCardID and the image for the template
-            for i in range(1, 6):
-                cardField = getattr(merge, f'cardID{i}', None)
-                if cardField:
-                    cardImages.append({'id': f'cardID{i}', 'image': cardField.image.url})
-                else:
-                    cardImages.append({'id': None, 'image' : None})
-
-            #Gets the player inventory for the certain rarity
-            playerInventoryStorage = ownsCard.objects.filter(user=request.user, card__rarity_id=rarityforbutton).select_related('card').values('card__title', 'card__image', 'quantity', 'card__id')
-
-            #Puts the media tag onto the image for it to be used
-            for item in playerInventoryStorage:
-                item['card__image'] = "/media/" + item['card__image']
-
-
-            playerItems = playerInventoryStorage
-
-            error = None
-            merge, created = Merge.objects.get_or_create(userID=request.user)
-
-            if merge and (merge.cardID1 and merge.cardID2 and merge.cardID3 and merge.cardID4 and merge.cardID5):
-                error = "There are already 5 cards in the merge slots remove one first!"
-                return render(request, "EcoWorld/mergecards.html", {"userinfo" : userinfo[0], "playerItems": playerItems, "rarity": rarityforbutton, "error" : error,"merge":cardImages})
-
-            cardToAdd = card.objects.get(id=cardID)  # Get the card object by ID
-            cardRarityID = cardToAdd.rarity.id  # Access the rarity of the card
-            ownCard = ownsCard.objects.get(user=request.user, card_id=cardID) #Amount owned of the card to be used with quantity
-
-
-            if merge.cardID1:
-                firstCard = merge.cardID1
-                if firstCard.rarity_id != cardRarityID:
-                    error = "The card you tried to add was not of the same rarity as the first card in the merge."
-                    return render(request, "EcoWorld/mergecards.html", {"userinfo": userinfo[0], "playerItems": playerItems, "rarity": rarityforbutton, "error": error,"merge":cardImages})
-
-
-            if ownCard.quantity <= 0:
-                error = "You need to get more of this card to add it to the merge or take one out of the merge box"
-                return render(request, "EcoWorld/mergecards.html", {"userinfo" : userinfo[0], "playerItems": playerItems, "rarity": rarityforbutton, "error" : error,"merge":cardImages})
-
-
-            if merge:
-                # Check for available slot to add the card
-                if not merge.cardID1:
-                    merge.cardID1 = cardToAdd
-                elif not merge.cardID2:
-                    merge.cardID2 = cardToAdd
-                elif not merge.cardID3:
-                    merge.cardID3 = cardToAdd
-                elif not merge.cardID4:
-                    merge.cardID4 = cardToAdd
-                elif not merge.cardID5:
-                    merge.cardID5 = cardToAdd
-                merge.save()
-
-            ownCard.quantity -=1
-            ownCard.save()
-
-            #Gets the player inventory for the certain rarity
-            playerInventoryStorage = ownsCard.objects.filter(user=request.user, card__rarity_id=rarityforbutton).select_related('card').values('card__title', 'card__image', 'quantity', 'card__id')
-
-            #Puts the media tag onto the image for it to be used
-            for item in playerInventoryStorage:
-                item['card__image'] = "/media/" + item['card__image']
-
-            # Filter items where quantity is greater than 0
-            playerItems = playerInventoryStorage
-
-            merge, created = Merge.objects.get_or_create(userID=request.user)
-
-            cardImages = []
-
-            #Go through the merge DB and get the mergeCardID and the image for the template
-            for i in range(1, 6):
-                cardField = getattr(merge, f'cardID{i}', None)
-                if cardField:
-                    cardImages.append({'id': f'cardID{i}', 'image': cardField.image.url})
-                else:
-                    cardImages.append({'id': None, 'image' : None})
-
-            return render(request, "EcoWorld/mergecards.html", {"userinfo" : userinfo[0], "playerItems": playerItems, "rarity": rarityforbutton,"merge":cardImages})
-
-        if removeCard:
-            #Get rarity and card id
-            rarityforbutton = request.POST.get("rarityforbutton")
-            cardID = removeCard
-
-            #Gets the player inventory for the certain rarity
-            playerInventoryStorage = ownsCard.objects.filter(user=request.user, card__rarity_id=rarityforbutton).select_related('card').values('card__title', 'card__image', 'quantity', 'card__id')
-
-            #Puts the media tag onto the image for it to be used
-            for item in playerInventoryStorage:
-                item['card__image'] = "/media/" + item['card__image']
-
-
-            playerItems = playerInventoryStorage
-
-            error = None
-            merge, created = Merge.objects.get_or_create(userID=request.user)
-
-            cardToRemove = None
-            if merge.cardID1 and str(merge.cardID1.id) == str(cardID):
-                cardToRemove = merge.cardID1
-                merge.cardID1 = None
-            elif merge.cardID2 and str(merge.cardID2.id) == str(cardID):
-                cardToRemove = merge.cardID2
-                merge.cardID2 = None
-            elif merge.cardID3 and str(merge.cardID3.id) == str(cardID):
-                cardToRemove = merge.cardID3
-                merge.cardID3 = None
-            elif merge.cardID4 and str(merge.cardID4.id) == str(cardID):
-                cardToRemove = merge.cardID4
-                merge.cardID4 = None
-            elif merge.cardID5 and str(merge.cardID5.id) == str(cardID):
-                cardToRemove = merge.cardID5
-                merge.cardID5 = None
-
-            if cardToRemove:
-                # Update the user's inventory by adding 1 back
-                ownCard = ownsCard.objects.get(user=request.user, card_id=cardID)
-                ownCard.quantity += 1
-
-                #Save merge db and ownsCard db for user
-                ownCard.save()
-                merge.save()
-
-
-                #Gets the player inventory for the certain rarity
-                playerInventoryStorage = ownsCard.objects.filter(user=request.user, card__rarity_id=rarityforbutton).select_related('card').values('card__title', 'card__image', 'quantity', 'card__id')
-
-                #Puts the media tag onto the image for it to be used
-                for item in playerInventoryStorage:
-                    item['card__image'] = "/media/" + item['card__image']
-
-
-                playerItems = playerInventoryStorage
-
-                merge, created = Merge.objects.get_or_create(userID=request.user)
-
-                cardImages = []
-
-                #Go through the merge DB and get the mergeCardID and the image for the template
-                for i in range(1, 6):
-                    cardField = getattr(merge, f'cardID{i}', None)
-                    if cardField:
-                        cardImages.append({'id': f'cardID{i}', 'image': cardField.image.url})
-                    else:
-                        cardImages.append({'id': None, 'image' : None})
-
-
-                return render(request, "EcoWorld/mergecards.html", {"userinfo" : userinfo[0], "playerItems": playerItems, "rarity": rarityforbutton,"merge":cardImages})
-
-            else:
-                merge, created = Merge.objects.get_or_create(userID=request.user)
-
-                cardImages = []
-
-                #Go through the merge DB and get the mergeCardID and the image for the template
-                for i in range(1, 6):
-                    cardField = getattr(merge, f'cardID{i}', None)
-                    if cardField:
-                        cardImages.append({'id': f'cardID{i}', 'image': cardField.image.url})
-                    else:
-                        cardImages.append({'id': None, 'image' : None})
-                error = "This card is not in a merge slot"
-                return render(request, "EcoWorld/mergecards.html", {"userinfo" : userinfo[0], "playerItems": playerItems, "rarity": rarityforbutton, "error" : error,"merge":cardImages})
-
+    Describe one merge slot for the merge page's JavaScript
 
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    return {"slot": slot,
+            "card_id": slot_card.id if slot_card else None,
+            "image_url": slot_card.image.url if slot_card else None}
 
-        if mergeCardsFunc:
-            #Gets the player inventory for the certain rarity
-            playerInventoryStorage = ownsCard.objects.filter(user=request.user, card__rarity_id=rarity).select_related('card').values('card__title', 'card__image', 'quantity', 'card__id')
 
-            #Puts the media tag onto the image for it to be used
-            for item in playerInventoryStorage:
-                item['card__image'] = "/media/" + item['card__image']
+def merge_request_card_id(request):
+    """
+    Read the card id out of a merge API request body
 
+    Returns:
+        int: The card id, or None if the body does not hold a valid one
 
-            playerItems = playerInventoryStorage
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    try:
+        return int(json.loads(request.body).get("card_id"))
+    except (TypeError, ValueError, AttributeError):
+        return None
 
-            merge, created = Merge.objects.get_or_create(userID=request.user)
 
-            rarity = mergeCardsFunc
+@login_required
+def mergecards(request):
+    """
+    Renders the page for merging cards together. Users add 5 cards of the
+    same rarity to their merge slots to merge them into 1 random card of the
+    next rarity. Selecting a rarity with ?rarity= lists the user's cards of
+    that rarity to add. Adding, removing and merging are done through the
+    JSON views below, so the page is only rendered when it is loaded or the
+    rarity changes
+    This function uses the merge model in models.py to hold cards entered into the merge slots
 
-            cardImages = []
+    Author:
+    Chris Lynch (cl1037@exeter.ac.uk)
+    """
+    merge, _ = Merge.objects.select_related(*MERGE_SLOTS).get_or_create(userID=request.user)
+    cardImages = []
+    #Go through the merge slots and get the mergeCardID and the image for the template
+    for i, field in enumerate(MERGE_SLOTS, start=1):
+        cardField = getattr(merge, field)
+        if cardField:
+            cardImages.append({'id': f'cardID{i}', 'image': cardField.image.url})
+        else:
+            cardImages.append({'id': None, 'image' : None})
 
-            #Go through the merge DB and get the mergeCardID and the image for the template
-            for i in range(1, 6):
-                cardField = getattr(merge, f'cardID{i}', None)
-                if cardField:
-                    cardImages.append({'id': f'cardID{i}', 'image': cardField.image.url})
-                else:
-                    cardImages.append({'id': None, 'image' : None})
+    context = {"merge": cardImages}
 
-            if mergeCardsFunc == 5:
-                error = "This card rarity cannot be merged!"
-                return render(request, "EcoWorld/mergecards.html", {"userinfo" : userinfo[0], "playerItems": playerItems, "rarity":rarity,"merge":cardImages, "error":error})
+    rarity = request.GET.get("rarity", "")
+    if rarity.isdigit():
+        #Gets the player inventory for the certain rarity
+        playerItems = ownsCard.objects.filter(user=request.user, card__rarity_id=rarity)\
+            .values('card__title', 'card__image', 'quantity', 'card__id')
+        #Puts the media tag onto the image for it to be used
+        for item in playerItems:
+            item['card__image'] = settings.MEDIA_URL + item['card__image']
+        context.update({"playerItems": playerItems, "rarity": rarity})
 
+    return render(request, "EcoWorld/mergecards.html", context)
 
-            if merge.cardID1 and merge.cardID2 and merge.cardID3 and merge.cardID4 and merge.cardID5:
-                merge.cardID1 = None
-                merge.cardID2 = None
-                merge.cardID3 = None
-                merge.cardID4 = None
-                merge.cardID5 = None
 
+@login_required
+def merge_add_card(request):
+    """
+    Moves one of the user's cards from their inventory into the first empty
+    merge slot. The merge row and the inventory row are locked for the
+    transaction so two quick clicks cannot add the same copy twice
+    Expects a POST with a JSON body holding card_id
+    Returns:
+    Appropriate error if the slots are full, the card is of a different
+    rarity to those already in the slots or the user has no copies left
+    Success with the filled slot and the card's new quantity
 
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method"}, status=405)
+    card_id = merge_request_card_id(request)
+    if card_id is None:
+        return JsonResponse({"error": "Invalid card selected"}, status=400)
+
+    with transaction.atomic():
+        merge = get_locked_merge(request.user)
+        slots = [getattr(merge, field) for field in MERGE_SLOTS]
+        if None not in slots:
+            return JsonResponse(
+                {"error": "There are already 5 cards in the merge slots remove one first!"},
+                status=400)
+
+        cardToAdd = get_catalog().cards.get(card_id)
+        if cardToAdd is None:
+            return JsonResponse({"error": "Invalid card selected"}, status=400)
+
+        first = next((slot_card for slot_card in slots if slot_card), None)
+        if first and first.rarity_id != cardToAdd.rarity_id:
+            return JsonResponse({"error": "The card you tried to add was not of the same "
+                                          "rarity as the first card in the merge."}, status=400)
+        quantity = take_card(request.user, card_id)
+        if quantity is None:
+            return JsonResponse({"error": "You need to get more of this card to add it to the "
+                                          "merge or take one out of the merge box"}, status=400)
+
+        slot = slots.index(None)
+        setattr(merge, MERGE_SLOTS[slot], cardToAdd)
+        merge.save(update_fields=[MERGE_SLOTS[slot]])
+
+    return JsonResponse({"success": True,
+                         "slot": merge_slot_json(slot + 1, cardToAdd),
+                         "inventory": [{"card_id": card_id, "quantity": quantity}]})
 
-                mergeCardsFunc = int(mergeCardsFunc)
-                mergeCardsFunc += 1
 
-                cards = card.objects.filter(rarity=mergeCardsFunc)
-                cardToReturn = random.choice(cards)
+@login_required
+def merge_remove_card(request):
+    """
+    Takes a card out of the first merge slot holding it and puts it back in
+    the user's inventory
+    Expects a POST with a JSON body holding card_id
+    Returns:
+    Error if the card is not in a merge slot
+    Success with the emptied slot and the card's new quantity
 
-                cardImage = cardToReturn.image.url
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method"}, status=405)
+    card_id = merge_request_card_id(request)
+    if card_id is None:
+        return JsonResponse({"error": "Invalid card selected"}, status=400)
 
-                userCard, created = ownsCard.objects.get_or_create(user=request.user, card=cardToReturn)
+    with transaction.atomic():
+        merge = get_locked_merge(request.user)
+        slot = next((i for i, field in enumerate(MERGE_SLOTS)
+                     if getattr(merge, f"{field}_id") == card_id), None)
+        if slot is None:
+            return JsonResponse({"error": "This card is not in a merge slot"}, status=400)
 
-                # If the card already exists in the user's inventory, increment the quantity
-                if not created:
-                    userCard.quantity += 1
-                    userCard.save()
-                else:
-                    # If the card is newly added to the inventory, set quantity to 1
-                    userCard.quantity = 1
-                    userCard.save()
-                merge.save()
+        setattr(merge, MERGE_SLOTS[slot], None)
+        merge.save(update_fields=[MERGE_SLOTS[slot]])
+        quantity = give_card(request.user, card_id)
 
-                merge, created = Merge.objects.get_or_create(userID=request.user)
+    return JsonResponse({"success": True,
+                         "slot": merge_slot_json(slot + 1, None),
+                         "inventory": [{"card_id": card_id, "quantity": quantity}]})
 
 
+@login_required
+def merge_cards_api(request):
+    """
+    Merges the 5 cards in the user's merge slots into 1 random card of the
+    next rarity, emptying the slots
+    Returns:
+    Error if the slots are not full or there is no rarity above the cards'
+    Success with the card received, the emptied slots and the new card's
+    quantity
 
-                cardImages = []
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method"}, status=405)
+
+    with transaction.atomic():
+        merge = get_locked_merge(request.user)
+        slots = [getattr(merge, field) for field in MERGE_SLOTS]
+        if None in slots:
+            return JsonResponse({"error": "You need 5 cards in the merge slots to merge"},
+                                status=400)
+
+        #Cards merge into the rarity above the cards in the slots
+        cards = get_catalog().cards_by_rarity.get(slots[0].rarity_id + 1)
+        if not cards:
+            return JsonResponse({"error": "This card rarity cannot be merged!"}, status=400)
+        cardToReturn = random.choice(cards)
+
+        for field in MERGE_SLOTS:
+            setattr(merge, field, None)
+        merge.save(update_fields=MERGE_SLOTS)
+        quantity = give_card(request.user, cardToReturn.id)
+
+    return JsonResponse({"success": True,
+                         "card": {"id": cardToReturn.id, "title": cardToReturn.title,
+                                  "image_url": cardToReturn.image.url},
+                         "slots": [merge_slot_json(i, None) for i in range(1, 6)],
+                         "inventory": [{"card_id": cardToReturn.id, "quantity": quantity}]})
 
-                #Go through the merge DB and get the mergeCardID and the image for the template
-                for i in range(1, 6):
-                    cardField = getattr(merge, f'cardID{i}', None)
-                    if cardField:
-                        cardImages.append({'id': f'cardID{i}', 'image': cardField.image.url})
-                    else:
-                        cardImages.append({'id': f'cardID{i}', 'image' : None})
 
+@login_required
+def auto_merge_cards(request):
+    """
+    Merges every full set of 5 cards the user owns of a rarity at once, so a
+    large inventory can be cleared in one request
+    Expects a POST with a JSON body holding rarity
+    Returns:
+    Error if the rarity cannot be merged or the user does not have 5 cards of it
+    Success with the cards received and the new quantity of every card that
+    changed
 
-                return render(request, "EcoWorld/merge_opening_page.html", {"image": cardToReturn.image.url})
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method"}, status=405)
+    try:
+        rarity = int(json.loads(request.body).get("rarity"))
+    except (TypeError, ValueError, AttributeError):
+        return JsonResponse({"error": "Invalid rarity selected"}, status=400)
 
+    merged = auto_merge(request.user, rarity)
+    if merged is None:
+        return JsonResponse({"error": "This card rarity cannot be merged!"}, status=400)
+    cards, quantities = merged
+    if not cards:
+        return JsonResponse({"error": "You need at least 5 cards of this rarity to merge"},
+                            status=400)
 
-        return render(request, "EcoWorld/mergecards.html", {"userinfo" : userinfo[0]})
+    return JsonResponse({"success": True,
+                         "cards": [{"id": c.id, "title": c.title, "image_url": c.image.url}
+                                   for c in cards],
+                         "inventory": [{"card_id": card_id, "quantity": quantity}
+                                       for card_id, quantity in quantities.items()]})
 
 
 def merge_opening_page(request):
-    return render(request, "EcoWorld/merge_opening_page.html")
+    """
+    Webpage to render the merge animation, revealing the card given by
+    ?card= once it has played
+
+    Author:
+    Chris Lynch (cl1037@exeter.ac.uk)
+    """
+    card_id = request.GET.get("card", "")
+    merged = get_catalog().cards.get(int(card_id)) if card_id.isdigit() else None
+    return render(request, "EcoWorld/merge_opening_page.html",
+                  {"image": merged.image.url if merged else None})
 
 
 @csrf_exempt
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 19:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Garden', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='garden',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -13,6 +13,7 @@ author:
 
 from django.conf import settings
 from django.db import models
+from django.db.models import F
 
 from Accounts.models import User
 from EcoWorld.models import card
@@ -25,15 +26,28 @@ class garden(models.Model):
     Attributes:
         -size: IntegerField : The size of the garden.
         -userID: ForeignKey : The user who owns the garden.
+        -version: IntegerField : Incremented whenever a square changes, used
+            to key cached renders of the garden.
     Methods:
         -__str__(): Returns the user ID of the owner.
+        -bump_version(): Increments the version in the database.
     Author:
         - Lewis Farley (lf507@exeter.ac.uk)
     """
     size = models.IntegerField(default=settings.GARDEN_SIZE)
     userID = models.ForeignKey(User, on_delete=models.CASCADE)
+    version = models.IntegerField(default=0)
     def __str__(self):
         return "Garden for " + str(self.userID)
+
+    def bump_version(self):
+        """
+        Marks cached renders of this garden as stale by incrementing its
+        version with a single UPDATE, so concurrent changes are not lost.
+        Author:
+            - Lewis Farley (lf507@exeter.ac.uk)
+        """
+        garden.objects.filter(pk=self.pk).update(version=F("version") + 1)
 class gardenSquare(models.Model):
     """
     Model for storing information about each square in the garden
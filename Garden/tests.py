@@ -15,15 +15,21 @@ Chris Lynch (cl1037@exeter.ac.uk)
 
 """
 import json
+import os
+import shutil
+import tempfile
 from unittest.mock import patch
 
+from PIL import Image
+
 from django.conf import settings
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 
 from Accounts.models import Profile
 from EcoWorld.models import cardRarity, ownsCard, card
 from .models import garden, gardenSquare, User
+from .utils import get_garden_grid, get_garden_thumbnail
 
 
 class TestGarden(TestCase):
@@ -198,6 +204,10 @@ class TestGarden(TestCase):
         new_square = gardenSquare.objects.get(gardenID=self.garden1, squareID=4)
         self.assertEqual(new_square.cardID, self.card1)
 
+        #Placing a card marks cached renders of the garden as stale
+        self.garden1.refresh_from_db()
+        self.assertEqual(self.garden1.version, 1)
+
     #Tests that if the square is occupied the card cant be placed there
     def testAddCardToGardenFailIfOccupied(self):
         '''
@@ -246,6 +256,10 @@ class TestGarden(TestCase):
         updated_owns_card = ownsCard.objects.get(user=self.user1, card=self.card1)
         self.assertEqual(updated_owns_card.quantity, 3)
 
+        #Removing a card marks cached renders of the garden as stale
+        self.garden1.refresh_from_db()
+        self.assertEqual(self.garden1.version, 1)
+
 
     #Tests to check that if user clicks on empty square it doesnt crash
     def testRemoveCardEmptySquare(self):
@@ -310,6 +324,82 @@ class TestGarden(TestCase):
         self.assertFalse(data["success"])
         self.assertEqual(data["message"], "You don't own this card")
 
+    def testGardenGridSingleQuery(self):
+        """
+        Tests the garden grid and every card in it are loaded in one query
+        Author: Lewis Farley (lf507@exeter.ac.uk)
+        """
+        with self.assertNumQueries(1):
+            grid = get_garden_grid(self.garden1)
+            titles = [square.cardID.title for row in grid for square in row if square.cardID]
+        self.assertEqual(titles, ["Bush"])
+        self.assertEqual([square.squareID for square in grid[1]], [3, 4, 5])
+
+    def testGardenGridMissingSquares(self):
+        """
+        Tests squares missing from the database are shown as empty squares
+        Author: Lewis Farley (lf507@exeter.ac.uk)
+        """
+        gardenSquare.objects.filter(gardenID=self.garden1, squareID=4).delete()
+        grid = get_garden_grid(self.garden1)
+        self.assertEqual(len(grid), 3)
+        self.assertEqual(grid[1][1].squareID, 4)
+        self.assertIsNone(grid[1][1].cardID)
+
+    def testShowGardenQueryCount(self):
+        """
+        Tests the number of queries to show the garden does not grow with its size
+        Author: Lewis Farley (lf507@exeter.ac.uk)
+        """
+        self.client.login(username="testuser1", password="1234")
+        # session, user with profile, garden, squares with cards,
+        # inventory and the template's permission lookups (2)
+        with self.assertNumQueries(7):
+            self.client.get(reverse('home'))
+
+    def testGardenThumbnail(self):
+        """
+        Tests a thumbnail is rendered once per garden state and changes with the garden
+        Author: Lewis Farley (lf507@exeter.ac.uk)
+        """
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        os.makedirs(os.path.join(media_root, "cards"))
+        Image.new("RGBA", (10, 10), (0, 255, 0, 255)).save(
+            os.path.join(media_root, "cards", "bush.png"))
+
+        with override_settings(MEDIA_ROOT=media_root):
+            url = get_garden_thumbnail(get_garden_grid(self.garden1))
+            path = os.path.join(media_root, url[len(settings.MEDIA_URL):])
+            with Image.open(path) as image:
+                tile = settings.GARDEN_THUMBNAIL_TILE_SIZE
+                self.assertEqual(image.size, (3 * tile, 3 * tile))
+                #the first square holds the bush, allowing for lossy WebP
+                red, green, _ = image.convert("RGB").getpixel((1, 1))
+                self.assertLess(red, 20)
+                self.assertGreater(green, 235)
+
+            #The same state reuses the stored image rather than rendering again
+            with patch("Garden.utils._render_thumbnail") as mock_render:
+                self.assertEqual(get_garden_thumbnail(get_garden_grid(self.garden1)), url)
+                mock_render.assert_not_called()
+
+            self.garden_square1.cardID = None
+            self.garden_square1.save()
+            self.assertNotEqual(get_garden_thumbnail(get_garden_grid(self.garden1)), url)
+
+    def testGardenThumbnailMissingImages(self):
+        """
+        Tests a thumbnail is still rendered when card images are missing
+        Author: Lewis Farley (lf507@exeter.ac.uk)
+        """
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            url = get_garden_thumbnail(get_garden_grid(self.garden1))
+            self.assertTrue(os.path.exists(os.path.join(media_root,
+                                                        url[len(settings.MEDIA_URL):])))
+
     def testAddCardInvalidMethod(self):
         """
         Tests that if a non POST request is made to the addCard view it returns the proper message
@@ -355,14 +445,14 @@ class TestGarden(TestCase):
 
 
 
-    @patch('Garden.views.ownsCard.objects.get_or_create')
-    def testRemoveCardownsCardException(self, mock_get_or_create):
+    def testRemoveCardNoLongerOwned(self):
         """
-        Tests that if ownsCard.get_or_create raises a DoesNotExist exception
+        Tests that removing a card the user has no copies of left in their
+        inventory gives them a new inventory row for it
         Author: Chris Lynch (cl1037@exeter.ac.uk)
         """
         self.client.login(username="testuser1", password="1234")
-        mock_get_or_create.side_effect = ownsCard.DoesNotExist
+        self.owns_card1.delete()
 
         response = self.client.post(
             reverse('remove_card'),
@@ -370,9 +460,8 @@ class TestGarden(TestCase):
             content_type='application/json'
         )
         self.assertEqual(response.status_code, 200)
-        data = response.json()
-        self.assertFalse(data["success"])
-        self.assertEqual(data["message"], "You don't own this card")
+        self.assertTrue(response.json()["success"])
+        self.assertEqual(ownsCard.objects.get(user=self.user1, card=self.card1).quantity, 1)
 
 def test_sustainability_reward_card(self):
     """Test earning garden card through sustainability action
@@ -0,0 +1,126 @@
+"""
+This file contains utility functions for the Garden app.
+Functions:
+    - get_garden_grid(g): Loads a garden's squares as a 2D grid in one query.
+    - garden_state_hash(grid): Hashes which card is in each square of a grid.
+    - get_garden_thumbnail(grid): Returns the URL of a single image of the grid.
+author:
+    - Lewis Farley (lf507@exeter.ac.uk)
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from PIL import Image, ImageOps, features
+
+from .models import gardenSquare
+
+THUMBNAIL_DIR = "garden_thumbnails"
+EMPTY_TILE = "cards/dirt.jpeg"
+
+# pylint: disable=no-member
+
+
+def get_garden_grid(g):
+    """
+    Loads every square of a garden, with the card placed in it, as rows of
+    squares ready for the garden templates.
+    All squares and their cards are fetched in a single query. Any square
+    missing from the database is filled with an unsaved empty square so the
+    grid is always size x size.
+    Attributes:
+        g : garden : The garden to load.
+    Returns:
+        list : g.size rows, each a list of g.size gardenSquare objects.
+    author:
+        - Lewis Farley (lf507@exeter.ac.uk)
+    """
+    squares = {square.squareID: square for square in
+               gardenSquare.objects.filter(gardenID=g)
+               .select_related("cardID").order_by("squareID")}
+    return [[squares.get(i * g.size + j) or gardenSquare(gardenID=g, squareID=i * g.size + j)
+             for j in range(g.size)] for i in range(g.size)]
+
+
+def garden_state_hash(grid):
+    """
+    Hashes the contents of a garden grid, so two grids showing the same
+    cards in the same squares share a hash and any change gives a new one.
+    Attributes:
+        grid : list : Rows of gardenSquare objects, as from get_garden_grid.
+    Returns:
+        str : A hex digest of the grid's contents.
+    author:
+        - Lewis Farley (lf507@exeter.ac.uk)
+    """
+    state = [[square.cardID.image.name if square.cardID else None for square in row]
+             for row in grid]
+    return hashlib.sha256(json.dumps([settings.GARDEN_THUMBNAIL_TILE_SIZE, state])
+                          .encode()).hexdigest()[:32]
+
+
+def _load_tile(name, tiles):
+    """
+    Loads a media image scaled to one tile, remembering it in tiles so each
+    image is only decoded once per thumbnail. Missing or unreadable images
+    give None.
+    """
+    if name not in tiles:
+        size = settings.GARDEN_THUMBNAIL_TILE_SIZE
+        try:
+            with Image.open(os.path.join(settings.MEDIA_ROOT, name)) as image:
+                tiles[name] = ImageOps.fit(image.convert("RGBA"), (size, size))
+        except (OSError, ValueError):
+            tiles[name] = None
+    return tiles[name]
+
+
+def _render_thumbnail(grid):
+    """
+    Composites the card in each square of a grid onto a dirt background.
+    """
+    size = settings.GARDEN_THUMBNAIL_TILE_SIZE
+    thumbnail = Image.new("RGBA", (size * len(grid), size * len(grid)), (0, 74, 75, 255))
+    tiles = {}
+    for i, row in enumerate(grid):
+        for j, square in enumerate(row):
+            position = (j * size, i * size)
+            dirt = _load_tile(EMPTY_TILE, tiles)
+            if dirt is not None:
+                thumbnail.paste(dirt, position)
+            if square.cardID:
+                tile = _load_tile(square.cardID.image.name, tiles)
+                if tile is not None:
+                    thumbnail.alpha_composite(tile, position)
+    return thumbnail
+
+
+def get_garden_thumbnail(grid):
+    """
+    Gets a single image of a garden grid to show in place of one image per
+    square.
+    Thumbnails are stored in the media folder named by garden_state_hash, so
+    one is only rendered the first time a garden is shown in a new state and
+    is shared by every garden in the same state. WebP is used where Pillow
+    supports it, otherwise PNG.
+    Attributes:
+        grid : list : Rows of gardenSquare objects, as from get_garden_grid.
+    Returns:
+        str : The media URL of the thumbnail.
+    author:
+        - Lewis Farley (lf507@exeter.ac.uk)
+    """
+    image_format, extension = ("WEBP", "webp") if features.check("webp") else ("PNG", "png")
+    name = f"{THUMBNAIL_DIR}/{garden_state_hash(grid)}.{extension}"
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first so a half written image is never served
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as file:
+            _render_thumbnail(grid).save(file, image_format)
+        os.chmod(file.name, 0o644)
+        os.replace(file.name, path)
+    return settings.MEDIA_URL + name
@@ -15,11 +15,14 @@ import json
 from django.conf import settings
 # Create your views here.
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 from django.http import JsonResponse
 from django.shortcuts import render
 
-from EcoWorld.models import ownsCard, card, User
+from EcoWorld.models import ownsCard, card
+from EcoWorld.utils import give_card, take_card
 from .models import garden, gardenSquare
+from .utils import get_garden_grid
 
 
 @login_required
@@ -38,33 +41,21 @@ def show_garden(request):
     """
     # Upon loading the store page all necessary details are required to be retrieved
     # such as the users current garden, the squares,
-    # user profile info and the pfp. Once this has been
+    # the player's inventory (the navbar's user info is added by
+    # Accounts.context_processors.userinfo). Once this has been
     # taken in the page can load by rendering each of these things in the html file
     g = garden.objects.get(userID=request.user)
-    squares = g.gardensquare_set.all()
-    processedSquares = [[squares[i * g.size + j] for j in range(g.size)] for i in range(g.size)]
-
-    user = request.user
-    user = User.objects.get(id=user.id)
-    pfp_url = "/media/pfps/" + user.profile.profile_picture
-
-    userinfo = {"username": user.username,
-                "pfp_url": pfp_url,
-                "coins": user.profile.number_of_coins}
-
-    # Gets the full inventory db of the user
-    playerInventoryStorage = ownsCard.objects.filter(user=request.user).values('card__title',
-                                                                                'card__image',
-                                                                                'quantity',
-                                                                                'card__id')
-    # Gets all inventory items from the user inventory that are actually 
-    # owned by the user so it shows for them to place
-    playerItems = [item for item in playerInventoryStorage if item["quantity"] > 0]
+    processedSquares = get_garden_grid(g)
+
+    # Gets the user's inventory, which only holds the cards they own
+    playerItems = ownsCard.objects.filter(user=request.user).values('card__title',
+                                                                     'card__image',
+                                                                     'quantity',
+                                                                     'card__id')
 
     return render(request, 'Garden/garden.html', {'squares': processedSquares,
                                                   'MEDIA_URL': settings.MEDIA_URL,
                                                   'size': g.size,
-                                                  "userinfo": userinfo,
                                                   "playerInventory": playerItems})
 
 
@@ -109,15 +100,15 @@ def addCard(request):
                 return JsonResponse({"success": False,
                                     "message": "This square is already occupied."})
 
-            # Once all checks complete and the addition is valid it will save 
-            # the garden square and remove 1 of it from the user
-
-            #inventory
-            square.cardID = selected_card
-            square.save()
-
-            owned_card.quantity -= 1
-            owned_card.save()
+            # Once all checks complete and the addition is valid it will remove
+            # 1 of it from the user inventory and save the garden square
+            with transaction.atomic():
+                if take_card(user, selected_card.id) is None:
+                    return JsonResponse({"success": False,
+                                         "message": "You don't have enough of this card."})
+                square.cardID = selected_card
+                square.save()
+                g.bump_version()
 
             #Returns the necessary info
             return JsonResponse({"success": True,
@@ -170,12 +161,11 @@ def removeCard(request):
             selected_card = square.cardID
             card_id = selected_card.id  
 
-            owned_card, created = ownsCard.objects.get_or_create(user=user, card=selected_card)
-            owned_card.quantity += 1
-            owned_card.save()
-
-            square.cardID = None
-            square.save()
+            with transaction.atomic():
+                give_card(user, card_id)
+                square.cardID = None
+                square.save()
+                g.bump_version()
 
             return JsonResponse({"success": True,
                                 "message": "Card removed successfully!",
@@ -186,7 +176,5 @@ def removeCard(request):
             return JsonResponse({"success": False, "message": "Invalid garden square"})
         except card.DoesNotExist:
             return JsonResponse({"success": False, "message": "Invalid card"})
-        except ownsCard.DoesNotExist:
-            return JsonResponse({"success": False, "message": "You don't own this card"})
 
     return JsonResponse({"success": False, "message": "Invalid request"})
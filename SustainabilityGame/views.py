@@ -5,6 +5,9 @@ from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.shortcuts import render
 
+from Accounts.utils import award_coins
+from leaderboards.models import UserEarntCoins
+
 @login_required
 def play_game(request):
     """Render the sustainability game page
@@ -36,9 +39,7 @@ def save_score(request):
         coins_earned = calculate_coins(score)
 
         # Update user's coin balance
-        profile = request.user.profile
-        profile.number_of_coins += coins_earned
-        profile.save()
+        award_coins(request.user, coins_earned, UserEarntCoins.GAME)
 
         return JsonResponse({
             'status': 'success',
@@ -23,7 +23,6 @@ from django.shortcuts import render, get_object_or_404, redirect
 
 from Accounts.models import Friends
 from EcoWorld.models import ongoingChallenge, card
-from EcoWorld.views import getUserInfo
 from .models import Post, PostInteraction
 
 
@@ -1,6 +1,8 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, permission_required
 from django.conf import settings
+from Accounts.utils import award_coins
+from leaderboards.models import UserEarntCoins
 from .models import GlassDisposalEntry, RecyclingLocation
 from .forms import GlassDisposalForm
 import math
@@ -79,8 +81,8 @@ def submit_disposal(request):
             disposal_entry.coins_awarded = disposal_entry.bottle_count * settings.GLASS_DISPOSAL_REWARD_PER_BOTTLE
             disposal_entry.save()
 
-            request.user.profile.number_of_coins += disposal_entry.coins_awarded
-            request.user.profile.save()
+            award_coins(request.user, disposal_entry.coins_awarded,
+                        UserEarntCoins.GLASS_DISPOSAL)
 
             return redirect('thankyou', coins_earned=disposal_entry.coins_awarded)
 
@@ -18,9 +18,12 @@ from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.utils.safestring import mark_safe
 
+from Accounts.utils import award_coins
+from EcoWorld.catalog import get_catalog
 from forum.models import Post
+from leaderboards.models import UserEarntCoins
 from .forms import GuidesForm, DeleteForm
-from .models import ContentQuizPair, UserQuizResult, User
+from .models import ContentQuizPair, UserQuizResult
 
 
 @permission_required("Accounts.can_view_gamekeeper_button")
@@ -138,22 +141,10 @@ def menu_view(request):
     author:
         Johnny Say (js1687@exeter.ac.uk)
     """
-    pairs = ContentQuizPair.objects.all()
+    pairs = get_catalog().guides
     completed_pairs = UserQuizResult.objects.filter(user=request.user, is_completed=True).values_list(
         'content_quiz_pair_id', flat=True)
 
-    user = request.user
-    user = User.objects.get(id=user.id)
-    pfp_url = user.profile.profile_picture
-    pfp_url = "/media/pfps/" + pfp_url
-
-    userinfo = []
-    userinfo.append({
-        "username": user.username,
-        "pfp_url": pfp_url,
-        "coins": user.profile.number_of_coins
-    })
-
     pairs_with_status = []
     for pair in pairs:
         is_completed = pair.id in completed_pairs
@@ -163,8 +154,7 @@ def menu_view(request):
         })
 
     return render(request, 'guides/menu.html', {
-        'pairs_with_status': pairs_with_status,
-        'userinfo':userinfo[0]
+        'pairs_with_status': pairs_with_status
     })
 
 @login_required
@@ -188,20 +178,8 @@ def content_view(request, pair_id):
     # Convert markdown content to HTML and mark as safe
     pair.html_content = mark_safe(markdown.markdown(pair.content))
     
-    user = request.user
-    user = User.objects.get(id=user.id)
-    pfp_url = user.profile.profile_picture
-    pfp_url = "/media/pfps/" + pfp_url
-
-    userinfo = []
-    userinfo.append({
-        "username": user.username,
-        "pfp_url": pfp_url,
-        "coins": user.profile.number_of_coins
-    })
     return render(request, 'guides/content.html', {
-        'pair': pair,
-        'userinfo':userinfo[0]
+        'pair': pair
     })
 
 @login_required
@@ -224,24 +202,11 @@ def quiz_view(request, pair_id):
     """
     pair = get_object_or_404(ContentQuizPair, id=pair_id)
 
-    user = request.user
-    user = User.objects.get(id=user.id)
-    pfp_url = user.profile.profile_picture
-    pfp_url = "/media/pfps/" + pfp_url
-
-    userinfo = []
-    userinfo.append({
-        "username": user.username,
-        "pfp_url": pfp_url,
-        "coins": user.profile.number_of_coins
-    })
-
     quiz_questions_json = pair.quiz_questions
 
     return render(request, 'guides/quiz.html', {
         'pair': pair,
-        'quiz_questions_json': quiz_questions_json,
-        'userinfo': userinfo[0]
+        'quiz_questions_json': quiz_questions_json
     })
 
 @login_required
@@ -280,9 +245,7 @@ def registerScore_view(request, pair_id):
         result.best_result = score
 
     if result.previous_best < pair.quiz_max_marks and score == pair.quiz_max_marks:
-        user = User.objects.get(id=user.id)
-        user.profile.number_of_coins += coins_reward
-        user.save()
+        award_coins(user, coins_reward, UserEarntCoins.QUIZ)
 
     result.save()
     Post.create_from_guide(pair.title, pair.content, user, score/pair.quiz_max_marks *100)
@@ -309,23 +272,10 @@ def results_view(request, pair_id):
     pair = get_object_or_404(ContentQuizPair, id=pair_id)
     result = UserQuizResult.objects.filter(user=request.user, content_quiz_pair=pair).first()
 
-    user = request.user
-    user = User.objects.get(id=user.id)
-    pfp_url = user.profile.profile_picture
-    pfp_url = "/media/pfps/" + pfp_url
-
-    userinfo = []
-    userinfo.append({
-        "username": user.username,
-        "pfp_url": pfp_url,
-        "coins": user.profile.number_of_coins
-    })
-
     return render(request, 'guides/results.html', {
         'score': result.score,
         'previous': result.previous_best,
         'best': result.best_result,
         'max':pair.quiz_max_marks,
-        'userinfo': userinfo[0],
         'pair': pair
     })
\ No newline at end of file
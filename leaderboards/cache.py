@@ -0,0 +1,209 @@
+"""
+Caching for the leaderboard payloads.
+
+When many clients open the leaderboard at once they would each rebuild the
+same payload. This module keeps each payload in Django's cache and shares it
+between requests:
+    - Coin earning events bump a version token in the LeaderboardVersion row,
+      marking cached payloads stale in every process
+    - A stale payload keeps being served while one request rebuilds it
+    - Only the request holding the rebuild lock recomputes (single flight)
+    - The full ranking carries a hash of its contents for use as an ETag
+    - Pages and rank lookups are cached on their own, so serving one never
+      loads the full ranking
+    - Daily, weekly and monthly payloads are keyed by the bucket they rank,
+      so a new day, week or month is never served the previous one
+
+The cache is the default local memory cache, so each process keeps its own
+copy and rebuild lock, and rebuilds at most once per version. The version
+itself is read from the database on every request, so a change made through
+any process is seen by all of them straight away.
+
+Author:
+    Lewis Farley (lf507@exeter.ac.uk)
+"""
+
+import hashlib
+import json
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import LeaderboardVersion
+from .utils import bucket_start, get_ranked_scores, serialise_score
+
+def _bucket(period):
+    """Name the bucket a period is currently ranked from, 'all' for all time."""
+    if period is None:
+        return "all"
+    return f"{period}:{bucket_start(period, timezone.localdate()).isoformat()}"
+
+
+def _payload_key(period, name="ranking"):
+    return f"leaderboard:payload:{name}:{_bucket(period)}"
+
+
+def _lock_key(period, name="ranking"):
+    return f"leaderboard:lock:{name}:{_bucket(period)}"
+
+
+def _bump_version():
+    version = uuid.uuid4().hex
+    if not LeaderboardVersion.objects.filter(pk=1).update(version=version):
+        LeaderboardVersion.objects.get_or_create(pk=1, defaults={"version": version})
+
+
+def get_version():
+    """
+    Get the current leaderboard version token, creating one if there is none.
+
+    Returns:
+        str: The version token cached rankings are compared against.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    version = LeaderboardVersion.objects.filter(pk=1).values_list("version", flat=True).first()
+    if version is None:
+        version = LeaderboardVersion.objects.get_or_create(
+            pk=1, defaults={"version": uuid.uuid4().hex})[0].version
+    return version
+
+
+def invalidate_leaderboard():
+    """
+    Mark every cached ranking as stale.
+
+    The version is bumped straight away and again once the surrounding
+    transaction commits, so a ranking rebuilt from uncommitted data in the
+    meantime is not kept.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    _bump_version()
+    transaction.on_commit(_bump_version)
+
+
+def build_ranking(period=None):
+    """
+    Compute a ranking to be cached.
+
+    Args:
+        period (str): Optional UserScoreBucket period to rank within.
+
+    Returns:
+        dict: The serialised ranked users, a map of user id to (rank, score)
+            and a hash of the ranking for use in ETags.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    ranked_users = []
+    ranks = {}
+    for i, row in enumerate(get_ranked_scores(period)):
+        ranked_users.append(serialise_score(row))
+        ranks[row.user_id] = (i + 1, row.score)
+    # the bucket is part of the hash so the same users on the same scores on
+    # two different days do not share an ETag
+    contents = json.dumps([_bucket(period), ranked_users])
+    etag = hashlib.md5(contents.encode(), usedforsecurity=False).hexdigest()
+    return {"ranked_users": ranked_users, "ranks": ranks, "etag": etag}
+
+
+def get_cached(name, period, build, timeout=None, version=None):
+    """
+    Get a payload from the cache, rebuilding it if it is stale.
+
+    If the cached payload is current it is returned as is. Otherwise the
+    first request to take the rebuild lock recomputes it while every other
+    request carries on serving the stale copy. When nothing is cached yet the
+    other requests wait briefly for the rebuild rather than all recomputing.
+
+    Args:
+        name (str): Names the payload, unique within a period.
+        period (str): Optional UserScoreBucket period the payload ranks within.
+        build (callable): Computes the payload when it is stale.
+        timeout (float): Optional seconds to keep the payload, forever if None.
+        version (str): Optional version token already read with get_version
+            for this request, so it is not read again.
+
+    Returns:
+        The payload returned by build.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    version = version or get_version()
+    key = _payload_key(period, name)
+    entry = cache.get(key)
+    if entry is not None and entry["version"] == version:
+        return entry["payload"]
+
+    lock_key = _lock_key(period, name)
+    lock_timeout = settings.LEADERBOARD_CACHE_LOCK_TIMEOUT.total_seconds()
+    if cache.add(lock_key, True, lock_timeout):
+        try:
+            entry = {"payload": build(), "version": version}
+            cache.set(key, entry, timeout)
+        finally:
+            cache.delete(lock_key)
+        return entry["payload"]
+
+    if entry is not None:
+        # someone else is already rebuilding, serve the stale copy meanwhile
+        return entry["payload"]
+
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry["payload"]
+    # the rebuilding request never finished, so compute it here instead
+    return build()
+
+
+def get_ranking(period=None):
+    """
+    Get the full ranking from the cache, rebuilding it if it is stale, see
+    get_cached.
+
+    Args:
+        period (str): Optional UserScoreBucket period to rank within.
+
+    Returns:
+        dict: The ranking, as returned by build_ranking.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    return get_cached("ranking", period, lambda: build_ranking(period))
+
+
+def get_cached_page(name, period, build, version=None):
+    """
+    Get a page or rank lookup of the leaderboard from the cache, rebuilding
+    it if it is stale, see get_cached.
+
+    Pages are kept for LEADERBOARD_PAGE_CACHE_TIMEOUT, as there is one for
+    every cursor and user.
+
+    Args:
+        name (str): Names the page, from the mode and parameters it answers.
+        period (str): Optional UserScoreBucket period the page ranks within.
+        build (callable): Computes the page when it is stale.
+        version (str): Optional version token already read with get_version.
+
+    Returns:
+        The page returned by build.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    return get_cached(name, period, build,
+                      settings.LEADERBOARD_PAGE_CACHE_TIMEOUT.total_seconds(), version)
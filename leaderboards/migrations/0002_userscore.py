@@ -0,0 +1,43 @@
+# Generated by Django 5.1.5 on 2026-10-18 19:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_user_scores(apps, schema_editor):
+    """Create a UserScore row for every existing user from their coin history."""
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+    UserEarntCoins = apps.get_model("leaderboards", "UserEarntCoins")
+    UserScore = apps.get_model("leaderboards", "UserScore")
+    totals = dict(UserEarntCoins.objects.values_list("user_id").annotate(total=Sum("score")))
+    UserScore.objects.bulk_create(
+        [UserScore(user_id=user_id, score=totals.get(user_id, 0))
+         for user_id in User.objects.values_list("id", flat=True)],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboards', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.IntegerField(default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_score', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-score', 'user_id'],
+                'indexes': [models.Index(fields=['-score', 'user'], name='leaderboard_score_rank_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_user_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.5 on 2026-10-18 19:19
+
+import datetime
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_score_buckets(apps, schema_editor):
+    """Roll the existing coin history up into daily, weekly and monthly buckets."""
+    UserEarntCoins = apps.get_model("leaderboards", "UserEarntCoins")
+    UserScoreBucket = apps.get_model("leaderboards", "UserScoreBucket")
+    totals = {}
+    for user_id, score, earnt_on in UserEarntCoins.objects.values_list(
+            "user_id", "score", "date").iterator():
+        day = timezone.localdate(earnt_on)
+        for period, start in (("daily", day),
+                              ("weekly", day - datetime.timedelta(days=day.weekday())),
+                              ("monthly", day.replace(day=1))):
+            key = (user_id, period, start)
+            totals[key] = totals.get(key, 0) + score
+    UserScoreBucket.objects.bulk_create(
+        [UserScoreBucket(user_id=user_id, period=period, start=start, score=score)
+         for (user_id, period, start), score in totals.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboards', '0002_userscore'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserScoreBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly')], max_length=10)),
+                ('start', models.DateField()),
+                ('score', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period', 'start', '-score', 'user'], name='leaderboard_bucket_rank_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'period', 'start'), name='unique_user_score_bucket')],
+            },
+        ),
+        migrations.RunPython(backfill_score_buckets, migrations.RunPython.noop),
+    ]
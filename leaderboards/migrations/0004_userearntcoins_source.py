@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 19:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboards', '0003_userscorebucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userearntcoins',
+            name='source',
+            field=models.CharField(choices=[('drink', 'Water fountain'), ('game', 'Sustainability game'), ('glass_disposal', 'Glass disposal'), ('daily_objective', 'Daily objective'), ('challenge', 'Challenge'), ('quiz', 'Guide quiz'), ('other', 'Other')], default='other', max_length=20),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.5 on 2026-10-18 21:44
+
+import uuid
+
+from django.db import migrations, models
+
+
+def create_version_row(apps, schema_editor):
+    """Create the single row the leaderboard cache reads its version from."""
+    apps.get_model("leaderboards", "LeaderboardVersion").objects.get_or_create(
+        pk=1, defaults={"version": uuid.uuid4().hex})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboards', '0004_userearntcoins_source'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(default='', max_length=32)),
+            ],
+        ),
+        migrations.RunPython(create_version_row, migrations.RunPython.noop),
+    ]
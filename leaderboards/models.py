@@ -8,11 +8,124 @@ class UserEarntCoins(models.Model):
     """
     Model to store the user's earned coins
     Used to populate the leaderboard
+    Rows are written by Accounts.utils.award_coins alongside the update to
+    the user's balance, tagged with where the coins came from.
     Author: Lewis Farley (lf507@exeter.ac.uk)
     """
+    DRINK = "drink"
+    GAME = "game"
+    GLASS_DISPOSAL = "glass_disposal"
+    DAILY_OBJECTIVE = "daily_objective"
+    CHALLENGE = "challenge"
+    QUIZ = "quiz"
+    OTHER = "other"
+    SOURCES = [
+        (DRINK, "Water fountain"),
+        (GAME, "Sustainability game"),
+        (GLASS_DISPOSAL, "Glass disposal"),
+        (DAILY_OBJECTIVE, "Daily objective"),
+        (CHALLENGE, "Challenge"),
+        (QUIZ, "Guide quiz"),
+        (OTHER, "Other"),
+    ]
+
     user= models.ForeignKey(User, on_delete=models.CASCADE)
     score = models.IntegerField()
     date = models.DateTimeField(auto_now_add=True)
+    source = models.CharField(max_length=20, choices=SOURCES, default=OTHER)
+
+    def __str__(self):
+        return self.name
+
+
+class UserScore(models.Model):
+    """
+    Running total of the coins a user has earned, one row per user.
+    Kept in step with UserEarntCoins by the signals in leaderboards/signals.py
+    so the leaderboard can be ranked with a single indexed ORDER BY instead of
+    summing every user's coin history on each request.
+    Attributes:
+        -user: OneToOneField : The user the total belongs to.
+        -score: IntegerField : The total number of coins the user has earned.
+    Author: Lewis Farley (lf507@exeter.ac.uk)
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="leaderboard_score")
+    score = models.IntegerField(default=0)
+
+    class Meta:
+        """
+        Orders rankings by score, ties broken by the user id (the order the
+        users signed up in) and indexes the same columns so ranking is an
+        index scan.
+        """
+        ordering = ["-score", "user_id"]
+        indexes = [
+            models.Index(fields=["-score", "user"], name="leaderboard_score_rank_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.score}"
+
+
+class UserScoreBucket(models.Model):
+    """
+    Coins a user earned within one day, week or month.
+    Filled in by the signals in leaderboards/signals.py as coins are earned so
+    the time windowed leaderboards only ever read the rows for the current
+    bucket, however much history has built up.
+    Attributes:
+        -user: ForeignKey : The user who earned the coins.
+        -period: CharField : The length of the bucket (daily, weekly or monthly).
+        -start: DateField : The first day of the bucket.
+        -score: IntegerField : The coins earned within the bucket.
+    Author: Lewis Farley (lf507@exeter.ac.uk)
+    """
+    DAILY = "daily"
+    WEEKLY = "weekly"
+    MONTHLY = "monthly"
+    PERIODS = [
+        (DAILY, "Daily"),
+        (WEEKLY, "Weekly"),
+        (MONTHLY, "Monthly"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    period = models.CharField(max_length=10, choices=PERIODS)
+    start = models.DateField()
+    score = models.IntegerField(default=0)
+
+    class Meta:
+        """
+        Each user has at most one bucket per period and start date, and the
+        buckets are indexed so one period's ranking is a single index range.
+        """
+        constraints = [
+            models.UniqueConstraint(fields=["user", "period", "start"],
+                                    name="unique_user_score_bucket"),
+        ]
+        indexes = [
+            models.Index(fields=["period", "start", "-score", "user"],
+                         name="leaderboard_bucket_rank_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.score} ({self.period} from {self.start})"
+
+
+class LeaderboardVersion(models.Model):
+    """
+    A single row holding a token that changes whenever the leaderboard may
+    have changed. The rankings are cached in each process and are only
+    served while the token they were built under is still current, see
+    leaderboards/cache.py. It is kept in the database rather than the cache
+    so every process sees a change made by any other.
+    A random token is used rather than a counter, so a ranking built from a
+    transaction that was rolled back can never match a later version.
+    Attributes:
+        -version: CharField : The current token.
+    Author: Lewis Farley (lf507@exeter.ac.uk)
+    """
+    version = models.CharField(max_length=32, default="")
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return f"Leaderboard version {self.version}"
@@ -0,0 +1,94 @@
+"""
+This module provides the signals that keep the leaderboard totals up to date:
+    - `create_user_score` : Creates an empty UserScore row for every new user
+    - `track_earnt_coins` : Adds each new UserEarntCoins entry to the
+    user's running total and their daily, weekly and monthly buckets
+    - `track_shown_picture` : Records the profile picture shown on the
+    leaderboard when a profile is loaded
+    - `invalidate_on_user_change`, `invalidate_on_user_delete` and
+    `invalidate_on_profile_change` : Mark the cached leaderboard as stale
+    when the users or profile pictures in it change. Username changes are
+    caught by Accounts.signals.create_or_update_profile, which already
+    compares the names against those the user was loaded with
+usage:
+    - imported in LeaderboardsConfig.ready() so the receivers are connected.
+author:
+    - Lewis Farley (lf507@exeter.ac.uk)
+"""
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from Accounts.models import Profile
+from .cache import invalidate_leaderboard
+from .models import UserEarntCoins, UserScore
+from .utils import add_to_buckets, add_to_score
+
+# pylint: disable=no-member
+# pylint: disable=unused-argument
+
+@receiver(post_save, sender=User)
+def create_user_score(sender, instance, created, **kwargs):
+    """
+    Creates a UserScore row for a new user so they appear on the leaderboard
+    with a score of 0 before they have earned anything.
+    Author: Lewis Farley (lf507@exeter.ac.uk)
+    """
+    if created:
+        UserScore.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=UserEarntCoins)
+def track_earnt_coins(sender, instance, created, **kwargs):
+    """
+    Adds a newly written UserEarntCoins entry to the user's running total
+    and to the buckets for the day, week and month it was earned in.
+    Author: Lewis Farley (lf507@exeter.ac.uk)
+    """
+    if created:
+        add_to_score(instance.user_id, instance.score)
+        add_to_buckets(instance.user_id, instance.score, instance.date)
+        invalidate_leaderboard()
+
+
+@receiver(post_save, sender=User)
+def invalidate_on_user_change(sender, instance, created, **kwargs):
+    """
+    Marks the cached leaderboard as stale when a user joins. Other saves,
+    like the last_login update made on every login, leave it alone.
+    Author: Lewis Farley (lf507@exeter.ac.uk)
+    """
+    if created:
+        invalidate_leaderboard()
+
+
+@receiver(post_delete, sender=User)
+def invalidate_on_user_delete(sender, instance, **kwargs):
+    """
+    Marks the cached leaderboard as stale when a user is deleted.
+    Author: Lewis Farley (lf507@exeter.ac.uk)
+    """
+    invalidate_leaderboard()
+
+
+@receiver(post_init, sender=Profile)
+def track_shown_picture(sender, instance, **kwargs):
+    """
+    Records the profile picture shown on the leaderboard when a profile is
+    loaded, so a later save can tell whether it changed.
+    Author: Lewis Farley (lf507@exeter.ac.uk)
+    """
+    instance._shown_picture = instance.__dict__.get("profile_picture")
+
+
+@receiver(post_save, sender=Profile)
+def invalidate_on_profile_change(sender, instance, created, **kwargs):
+    """
+    Marks the cached leaderboard as stale when a profile picture shown on the
+    leaderboard changes.
+    Author: Lewis Farley (lf507@exeter.ac.uk)
+    """
+    picture = instance.__dict__.get("profile_picture")
+    if created or picture != getattr(instance, "_shown_picture", None):
+        invalidate_leaderboard()
+    instance._shown_picture = picture
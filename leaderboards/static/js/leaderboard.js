@@ -29,8 +29,41 @@ function onPageLoad() {
         }
     });
 
-    // Fetch leaderboard data from the server
-    fetch('getleaderboarddata').then(response => response.json()).then(data => {
+    // Switch between the all time, monthly, weekly and daily leaderboards
+    document.querySelectorAll('.period-tab').forEach(tab => {
+        tab.addEventListener('click', () => {
+            document.querySelectorAll('.period-tab').forEach(t => t.classList.remove('active'));
+            tab.classList.add('active');
+            loadLeaderboard(tab.dataset.period);
+        });
+    });
+
+    // Switch between everyone and just the user's friends
+    document.querySelectorAll('.scope-tab').forEach(tab => {
+        tab.addEventListener('click', () => {
+            document.querySelectorAll('.scope-tab').forEach(t => t.classList.remove('active'));
+            tab.classList.add('active');
+            currentScope = tab.dataset.scope;
+            loadLeaderboard(currentPeriod);
+        });
+    });
+
+    document.getElementById('load-more').addEventListener('click', loadMore);
+
+    loadLeaderboard('all');
+}
+
+let currentPeriod = 'all';
+let currentScope = 'global';
+let nextCursor = null;
+
+function loadLeaderboard(period) {
+    currentPeriod = period;
+    // Fetch the first page of the leaderboard, or every friend, from the server
+    const url = currentScope === 'friends'
+        ? `getfriendsleaderboarddata/?period=${period}`
+        : `page/?mode=top&period=${period}`;
+    fetch(url).then(response => response.json()).then(data => {
 
         // If there are fewer than 3 players, we just take whatever is available
         let top3 = data.rankedUsers.length < 3 ? data.rankedUsers : data.rankedUsers.slice(0, 3);
@@ -70,6 +103,7 @@ function onPageLoad() {
         }
 
         var table = document.getElementById("leaderboard-body");
+        table.innerHTML = '';
         var tooltip = document.getElementById("tooltip");
         
         // Only setup tooltip if not on mobile
@@ -90,51 +124,11 @@ function onPageLoad() {
             tooltip.style.visibility = "hidden";
         }
 
-        data.rankedUsers.forEach((user, i) => {
-            var row = table.insertRow(-1);
-            
-            // row.href = `/read_profile/?username=${user.username}`;
-            row.addEventListener("click", () => {
-                window.location.href = `/read_profile/?username=${user.username}`;
-            });
-        
-            // Add the link to the row
-            if (!isMobileDevice()) {
-                row.addEventListener("mouseenter", async (event) => {
-                    if (isMobileDevice()) return; // Double-check for mobile
-                    let username = row.cells[1].innerText;
-                    try {
-                        let response = await fetch(`get-tooltip-template/?username=${username}`);
-                        let html = await response.text();
-                        tooltip.innerHTML = html;
-                        tooltip.style.display = "block";
-                    } catch (error) {
-                        console.error("Error fetching tooltip template:", error);
-                    }
-                });
-        
-                row.addEventListener("mousemove", (event) => {
-                    if (isMobileDevice()) return; // Double-check for mobile
-                    tooltip.style.top = `${event.clientY -350}px`;
-                    tooltip.style.left = `${event.clientX + 10}px`;
-                });
-        
-                row.addEventListener("mouseleave", () => {
-                    tooltip.style.display = "none";
-                });
-            }
-
-            var rank = row.insertCell(0);
-            var username = row.insertCell(1);
-            var score = row.insertCell(2);
-            rank.innerHTML = i + 1;
-            username.innerHTML = user.username;
-            score.innerHTML = user.score;
-        });
+        appendRows(data);
         const logged_in_user_rank = data.current_user_data.rank
         const logged_in_user_score = data.current_user_data.score
         const logged_in_user_username = data.current_user_data.username
-        document.getElementById('current-rank').innerText = logged_in_user_rank;
+        document.getElementById('current-rank').innerText = logged_in_user_rank ?? '-';
         document.getElementById('current-coins').innerText = logged_in_user_score;
         document.getElementById('current-name').innerText = logged_in_user_username;
     }).catch((error) => {
@@ -142,6 +136,68 @@ function onPageLoad() {
     });
 }
 
+function loadMore() {
+    // Fetch the page after the last one shown
+    if (!nextCursor) return;
+    fetch(`page/?mode=top&period=${currentPeriod}&cursor=${encodeURIComponent(nextCursor)}`)
+        .then(response => response.json())
+        .then(data => appendRows(data))
+        .catch((error) => {
+            console.error('Error fetching leaderboard data:', error);
+        });
+}
+
+function appendRows(data) {
+    var table = document.getElementById("leaderboard-body");
+    var tooltip = document.getElementById("tooltip");
+
+    data.rankedUsers.forEach((user, i) => {
+        var row = table.insertRow(-1);
+        
+        // row.href = `/read_profile/?username=${user.username}`;
+        row.addEventListener("click", () => {
+            window.location.href = `/read_profile/?username=${user.username}`;
+        });
+    
+        // Add the link to the row
+        if (!isMobileDevice()) {
+            row.addEventListener("mouseenter", async (event) => {
+                if (isMobileDevice()) return; // Double-check for mobile
+                let username = row.cells[1].innerText;
+                try {
+                    let response = await fetch(`get-tooltip-template/?username=${username}`);
+                    let html = await response.text();
+                    tooltip.innerHTML = html;
+                    tooltip.style.display = "block";
+                } catch (error) {
+                    console.error("Error fetching tooltip template:", error);
+                }
+            });
+    
+            row.addEventListener("mousemove", (event) => {
+                if (isMobileDevice()) return; // Double-check for mobile
+                tooltip.style.top = `${event.clientY -350}px`;
+                tooltip.style.left = `${event.clientX + 10}px`;
+            });
+    
+            row.addEventListener("mouseleave", () => {
+                tooltip.style.display = "none";
+            });
+        }
+
+        var rank = row.insertCell(0);
+        var username = row.insertCell(1);
+        var score = row.insertCell(2);
+        rank.innerHTML = user.rank ?? i + 1;
+        username.innerHTML = user.username;
+        score.innerHTML = user.score;
+    });
+
+    // Only offer more rows while the server says there are some
+    nextCursor = data.next_cursor ?? null;
+    document.getElementById('load-more').style.display = nextCursor ? 'block' : 'none';
+}
+
 onPageLoad();
 
 
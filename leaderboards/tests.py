@@ -12,18 +12,32 @@ Author:
     Lewis Farley (lf507@exeter.ac.uk)
 """
 
-from django.test import TestCase, Client
+import shutil
+import tempfile
+from datetime import date, timedelta
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils import timezone
 from django.template.loader import render_to_string
-from .models import UserEarntCoins
-from Accounts.models import Profile
+from .cache import build_ranking, get_ranking, get_version, _lock_key, _payload_key
+from .models import LeaderboardVersion, UserEarntCoins, UserScore, UserScoreBucket
+from .utils import bucket_start, get_top_page
+from Accounts.models import Friends, Profile
 from Garden.models import garden, gardenSquare
 from Accounts.forms import SignUpForm
-from Accounts.utils import create_garden
+from Accounts.utils import award_coins, provision_users, spend_coins
 
 class LeaderboardTests(TestCase):
     def setUp(self):
+        # cached tooltips outlive each test's database, so start and finish empty
+        cache.clear()
+        self.addCleanup(cache.clear)
         # Create test users (profiles will be created automatically via signals)
         self.user1 = User.objects.create_user(username='user1', password='testpass123')
         self.user2 = User.objects.create_user(username='user2', password='testpass123')
@@ -35,22 +49,14 @@ class LeaderboardTests(TestCase):
         self.client.login(username='user1', password='testpass123')
 
     def test_negative_coins(self):
-        """Test whether UserEarntCoins can store negative values"""
-        # Create a negative coin entry
-        # negative_coins = UserEarntCoins.objects.create(
-        #     user=self.user1,
-        #     score=-100
-        # )
-        self.user1.profile.number_of_coins += 100
-        self.user1.profile.save()
-        self.user1.profile.number_of_coins-=100
-        self.user1.profile.save()
-        # Verify the negative value was stored correctly
- 
-        
-        # Verify it's included in the total sum
+        """Test spending coins does not take them off the leaderboard"""
+        award_coins(self.user1, 100, UserEarntCoins.GAME)
+        self.assertTrue(spend_coins(self.user1, 100))
+
+        # Only the award is recorded, so the total earnt is unchanged
         total_coins = sum([i.score for i in UserEarntCoins.objects.filter(user=self.user1)])
         self.assertEqual(total_coins, 100)
+        self.assertEqual(Profile.objects.get(user=self.user1).number_of_coins, 0)
 
     def test_user_ordering(self):
         """Test whether the leaderboard correctly orders users by their total coins"""
@@ -312,7 +318,6 @@ class LeaderboardTests(TestCase):
         """Test the garden tooltip template rendering"""
         # Create a new user using the signup form
         from Accounts.forms import SignUpForm
-        from Accounts.utils import create_garden
         
         # Create form data
         form_data = {
@@ -328,17 +333,17 @@ class LeaderboardTests(TestCase):
         form = SignUpForm(form_data)
         self.assertTrue(form.is_valid())
         
-        # Create the user
-        user = form.save()
+        # Create the user along with their garden, as the signup view does
+        provision_users([form.save(commit=False)])
         
-        # Create the garden using the utility function
-        user_garden = create_garden(user)
-        
-        # Get the tooltip template
-        response = self.client.get(
-            reverse('get_tooltip_template'),
-            {'username': 'testuser2'}
-        )
+        # Get the tooltip template, writing its thumbnail somewhere temporary
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            response = self.client.get(
+                reverse('get_tooltip_template'),
+                {'username': 'testuser2'}
+            )
         
         # Check response
         self.assertEqual(response.status_code, 200)
@@ -360,3 +365,471 @@ class LeaderboardTests(TestCase):
 
         
 
+
+
+class UserScoreTests(TestCase):
+    """
+    Tests for the UserScore running totals the leaderboard is ranked from.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+        self.client = Client()
+        self.client.login(username='user1', password='testpass123')
+
+    def test_score_row_created_for_new_user(self):
+        """Test every new user starts on the leaderboard with a score of 0"""
+        self.assertEqual(UserScore.objects.get(user=self.user1).score, 0)
+        self.assertEqual(UserScore.objects.get(user=self.user2).score, 0)
+
+    def test_score_tracks_earnt_coins(self):
+        """Test each UserEarntCoins entry is added to the running total"""
+        UserEarntCoins.objects.create(user=self.user1, score=30)
+        UserEarntCoins.objects.create(user=self.user1, score=12)
+        self.assertEqual(UserScore.objects.get(user=self.user1).score, 42)
+        self.assertEqual(UserScore.objects.get(user=self.user2).score, 0)
+
+    def test_missing_score_row_is_recreated(self):
+        """Test coins earned by a user without a UserScore row still count"""
+        UserScore.objects.filter(user=self.user2).delete()
+        UserEarntCoins.objects.create(user=self.user2, score=15)
+        self.assertEqual(UserScore.objects.get(user=self.user2).score, 15)
+
+    def test_query_count_independent_of_history(self):
+        """Test ranking costs the same however many coin entries exist"""
+        for _ in range(20):
+            UserEarntCoins.objects.create(user=self.user1, score=5)
+            UserEarntCoins.objects.create(user=self.user2, score=3)
+        # session, user, leaderboard version and the single ranking query
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('get_ranked_users'))
+        data = response.json()
+        self.assertEqual(data['rankedUsers'][0]['username'], 'user1')
+        self.assertEqual(data['rankedUsers'][0]['score'], 100)
+        self.assertEqual(data['current_user_data']['rank'], 1)
+
+
+class TimeWindowLeaderboardTests(TestCase):
+    """
+    Tests for the daily, weekly and monthly leaderboards served from the
+    UserScoreBucket rollups.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+        self.client = Client()
+        self.client.login(username='user1', password='testpass123')
+
+    def test_coins_rolled_up_into_buckets(self):
+        """Test earned coins are added to a bucket for each period"""
+        UserEarntCoins.objects.create(user=self.user1, score=10)
+        UserEarntCoins.objects.create(user=self.user1, score=5)
+        today = timezone.localdate()
+        for period, _ in UserScoreBucket.PERIODS:
+            bucket = UserScoreBucket.objects.get(user=self.user1, period=period)
+            self.assertEqual(bucket.score, 15)
+            self.assertEqual(bucket.start, bucket_start(period, today))
+
+    def test_bucket_starts(self):
+        """Test weeks start on a Monday and months on the 1st"""
+        day = date(2025, 3, 20)  # a Thursday
+        self.assertEqual(bucket_start(UserScoreBucket.DAILY, day), day)
+        self.assertEqual(bucket_start(UserScoreBucket.WEEKLY, day), date(2025, 3, 17))
+        self.assertEqual(bucket_start(UserScoreBucket.MONTHLY, day), date(2025, 3, 1))
+
+    def test_weekly_leaderboard_ignores_older_buckets(self):
+        """Test a period leaderboard only ranks coins from the current bucket"""
+        last_week = bucket_start(UserScoreBucket.WEEKLY, timezone.localdate()) - timedelta(days=7)
+        UserScoreBucket.objects.create(user=self.user2, period=UserScoreBucket.WEEKLY,
+                                       start=last_week, score=500)
+        UserEarntCoins.objects.create(user=self.user1, score=20)
+
+        response = self.client.get(reverse('get_ranked_users'), {'period': 'weekly'})
+        data = response.json()
+        self.assertEqual([u['username'] for u in data['rankedUsers']], ['user1'])
+        self.assertEqual(data['current_user_data']['score'], 20)
+        self.assertEqual(data['current_user_data']['rank'], 1)
+
+    def test_user_without_coins_in_period_is_unranked(self):
+        """Test the current user has no rank if they earned nothing in the period"""
+        UserEarntCoins.objects.create(user=self.user2, score=20)
+        data = self.client.get(reverse('get_ranked_users'), {'period': 'daily'}).json()
+        self.assertEqual(data['current_user_data']['score'], 0)
+        self.assertIsNone(data['current_user_data']['rank'])
+
+    def test_invalid_period(self):
+        """Test an unknown period is rejected"""
+        response = self.client.get(reverse('get_ranked_users'), {'period': 'yearly'})
+        self.assertEqual(response.status_code, 400)
+
+
+class LeaderboardPageTests(TestCase):
+    """
+    Tests for the paginated top, around-me and rank lookup endpoint.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    def setUp(self):
+        # the cache outlives each test's database, so start and finish empty
+        cache.clear()
+        self.addCleanup(cache.clear)
+        # user1 has the most coins, user5 the fewest
+        self.users = []
+        for i in range(1, 6):
+            user = User.objects.create_user(username=f'user{i}', password='testpass123')
+            UserEarntCoins.objects.create(user=user, score=(6 - i) * 10)
+            self.users.append(user)
+        self.client = Client()
+        self.client.login(username='user3', password='testpass123')
+
+    def get_page(self, **params):
+        return self.client.get(reverse('get_leaderboard_page'), params)
+
+    def test_top_pages_follow_cursor(self):
+        """Test walking the leaderboard page by page returns every user once, in order"""
+        data = self.get_page(mode='top', limit=2).json()
+        self.assertEqual([u['username'] for u in data['rankedUsers']], ['user1', 'user2'])
+        self.assertEqual([u['rank'] for u in data['rankedUsers']], [1, 2])
+        self.assertEqual(data['current_user_data']['rank'], 3)
+
+        data = self.get_page(mode='top', limit=2, cursor=data['next_cursor']).json()
+        self.assertEqual([u['username'] for u in data['rankedUsers']], ['user3', 'user4'])
+        self.assertEqual([u['rank'] for u in data['rankedUsers']], [3, 4])
+
+        data = self.get_page(mode='top', limit=2, cursor=data['next_cursor']).json()
+        self.assertEqual([u['username'] for u in data['rankedUsers']], ['user5'])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_ties_are_not_skipped_between_pages(self):
+        """Test users on the same score either side of a page break are all returned"""
+        UserEarntCoins.objects.create(user=self.users[1], score=10)  # user2 ties with user1
+        first = self.get_page(mode='top', limit=1).json()
+        second = self.get_page(mode='top', limit=1, cursor=first['next_cursor']).json()
+        self.assertEqual(first['rankedUsers'][0]['username'], 'user1')
+        self.assertEqual(second['rankedUsers'][0]['username'], 'user2')
+
+    def test_around_current_user(self):
+        """Test the around mode returns the window either side of the current user"""
+        data = self.get_page(mode='around', window=1).json()
+        self.assertEqual([u['username'] for u in data['rankedUsers']], ['user2', 'user3', 'user4'])
+        self.assertEqual([u['rank'] for u in data['rankedUsers']], [2, 3, 4])
+        self.assertEqual(data['current_user_data']['rank'], 3)
+
+    def test_rank_lookup(self):
+        """Test the rank of any user can be looked up"""
+        data = self.get_page(mode='rank', username='user4').json()
+        self.assertEqual(data['user_data'], {'username': 'user4', 'score': 20, 'rank': 4})
+        self.assertEqual(self.get_page(mode='rank', username='nobody').status_code, 404)
+
+    def test_page_query_count_is_flat(self):
+        """Test a page costs the same however many users are ranked"""
+        for i in range(6, 30):
+            User.objects.create_user(username=f'user{i}', password='testpass123')
+        # session, user, leaderboard version, the page, current user's row and rank
+        with self.assertNumQueries(6):
+            response = self.get_page(mode='top', limit=2)
+        self.assertEqual(len(response.json()['rankedUsers']), 2)
+        # the page and rank are then served from the cache
+        with self.assertNumQueries(3):
+            self.assertEqual(self.get_page(mode='top', limit=2).json(), response.json())
+
+    def test_ranks_counted_without_loading_rows(self):
+        """Test rank lookups count the users above rather than loading them"""
+        for i in range(6, 30):
+            User.objects.create_user(username=f'user{i}', password='testpass123')
+        with CaptureQueriesContext(connection) as queries:
+            data = self.get_page(mode='rank', username='user29').json()
+        self.assertEqual(data['user_data'], {'username': 'user29', 'score': 0, 'rank': 29})
+        # session, user, leaderboard version, the looked up user's row and the count
+        self.assertEqual(len(queries), 5)
+        self.assertIn('COUNT(', queries[-1]['sql'])
+        # the current user's row, the rows either side and the count for the
+        # first rank, then the current user's row and rank
+        with self.assertNumQueries(9):
+            data = self.get_page(mode='around', window=2).json()
+        self.assertEqual([u['rank'] for u in data['rankedUsers']], [1, 2, 3, 4, 5])
+
+    def test_cursor_survives_ranking_change(self):
+        """Test a cursor made before the ranking changed carries on from its row"""
+        first = self.get_page(mode='top', limit=2).json()
+        UserEarntCoins.objects.create(user=self.users[4], score=100)  # user5 goes top
+        data = self.get_page(mode='top', limit=2, cursor=first['next_cursor']).json()
+        self.assertEqual([u['username'] for u in data['rankedUsers']], ['user3', 'user4'])
+
+    def test_invalid_parameters(self):
+        """Test malformed cursors, limits and modes are rejected"""
+        self.assertEqual(self.get_page(mode='top', cursor='not-a-cursor').status_code, 400)
+        self.assertEqual(self.get_page(mode='top', limit='0').status_code, 400)
+        self.assertEqual(self.get_page(mode='sideways').status_code, 400)
+
+
+class FriendsLeaderboardTests(TestCase):
+    """
+    Tests for the leaderboard restricted to the current user and their friends.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+        self.user3 = User.objects.create_user(username='user3', password='testpass123')
+        self.stranger = User.objects.create_user(username='stranger', password='testpass123')
+        # friendships are stored in either direction
+        # the cache outlives each test's database, so start and finish empty
+        cache.clear()
+        self.addCleanup(cache.clear)
+        Friends.objects.create(userID1=self.user1, userID2=self.user2)
+        Friends.objects.create(userID1=self.user3, userID2=self.user1)
+        UserEarntCoins.objects.create(user=self.user1, score=50)
+        UserEarntCoins.objects.create(user=self.user2, score=80)
+        UserEarntCoins.objects.create(user=self.user3, score=20)
+        UserEarntCoins.objects.create(user=self.stranger, score=500)
+        self.client = Client()
+        self.client.login(username='user1', password='testpass123')
+
+    def test_only_friends_are_ranked(self):
+        """Test friends from both directions are ranked and other users are not"""
+        data = self.client.get(reverse('get_friends_ranked_users')).json()
+        self.assertEqual([u['username'] for u in data['rankedUsers']], ['user2', 'user1', 'user3'])
+        self.assertEqual(data['current_user_data'], {'username': 'user1', 'score': 50, 'rank': 2})
+
+    def test_matches_global_response_shape(self):
+        """Test the friends response has the same fields as get_ranked_users"""
+        friends = self.client.get(reverse('get_friends_ranked_users')).json()
+        everyone = self.client.get(reverse('get_ranked_users')).json()
+        self.assertEqual(friends.keys(), everyone.keys())
+        self.assertEqual(friends['rankedUsers'][0].keys(), everyone['rankedUsers'][0].keys())
+
+    def test_only_friends_scores_loaded(self):
+        """Test the friend set is fetched in one query and only their scores are loaded"""
+        with patch('leaderboards.cache.build_ranking') as build:
+            # session, user, the friend ids and their scores
+            with self.assertNumQueries(4):
+                self.client.get(reverse('get_friends_ranked_users'))
+        build.assert_not_called()
+
+    def test_user_without_friends(self):
+        """Test a user with no friends is ranked on their own"""
+        self.client.login(username='stranger', password='testpass123')
+        data = self.client.get(reverse('get_friends_ranked_users')).json()
+        self.assertEqual([u['username'] for u in data['rankedUsers']], ['stranger'])
+
+
+class CachedLeaderboardTests(TestCase):
+    """
+    Tests for the cached leaderboard payload served by get_ranked_users.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    def setUp(self):
+        # the cache outlives each test's database, so start and finish empty
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user1 = User.objects.create_user(username='user1', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='testpass123')
+        UserEarntCoins.objects.create(user=self.user1, score=40)
+        UserEarntCoins.objects.create(user=self.user2, score=60)
+        self.client = Client()
+        self.client.login(username='user1', password='testpass123')
+
+    def test_ranking_computed_once(self):
+        """Test repeated requests reuse the cached ranking"""
+        self.client.get(reverse('get_ranked_users'))
+        # session, user and leaderboard version only, no ranking query
+        for _ in range(5):
+            with self.assertNumQueries(3):
+                response = self.client.get(reverse('get_ranked_users'))
+        data = response.json()
+        self.assertEqual([u['username'] for u in data['rankedUsers']], ['user2', 'user1'])
+        self.assertEqual(data['current_user_data'], {'username': 'user1', 'score': 40, 'rank': 2})
+
+    def test_earning_coins_invalidates(self):
+        """Test a coin earning event is visible on the next request"""
+        self.client.get(reverse('get_ranked_users'))
+        UserEarntCoins.objects.create(user=self.user1, score=50)
+        data = self.client.get(reverse('get_ranked_users')).json()
+        self.assertEqual(data['rankedUsers'][0]['username'], 'user1')
+        self.assertEqual(data['current_user_data']['rank'], 1)
+
+    def test_not_modified(self):
+        """Test a matching If-None-Match gets a 304 until the ranking changes"""
+        response = self.client.get(reverse('get_ranked_users'))
+        etag = response.headers['ETag']
+        self.assertIn('no-cache', response.headers['Cache-Control'])
+        response = self.client.get(reverse('get_ranked_users'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        UserEarntCoins.objects.create(user=self.user1, score=5)
+        response = self.client.get(reverse('get_ranked_users'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_etag_differs_per_user(self):
+        """Test users do not share ETags as current_user_data differs"""
+        etag = self.client.get(reverse('get_ranked_users')).headers['ETag']
+        self.client.login(username='user2', password='testpass123')
+        response = self.client.get(reverse('get_ranked_users'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_stale_served_while_rebuilding(self):
+        """Test a stale ranking is served while another request holds the lock"""
+        stale = get_ranking()
+        UserEarntCoins.objects.create(user=self.user1, score=50)
+        cache.add(_lock_key(None), True)
+        # only the version is read
+        with self.assertNumQueries(1):
+            self.assertEqual(get_ranking(), stale)
+        cache.delete(_lock_key(None))
+        self.assertEqual(get_ranking()['ranked_users'][0]['username'], 'user1')
+
+    def test_leaderboard_page_requests_share_pages(self):
+        """Test a burst of page loads computes each page once and then gets 304s"""
+        urls = [(reverse('get_leaderboard_page'), {'mode': 'top', 'period': 'all'}),
+                (reverse('get_friends_ranked_users'), {'period': 'all'})]
+        etags = {}
+        with patch('leaderboards.views.get_top_page', wraps=get_top_page) as top, \
+                patch('leaderboards.cache.build_ranking') as build:
+            for _ in range(5):
+                for url, params in urls:
+                    response = self.client.get(url, params)
+                    self.assertEqual(response.status_code, 200)
+                    etags[url] = response.headers['ETag']
+        top.assert_called_once()
+        build.assert_not_called()
+        self.assertEqual(response.json()['current_user_data']['rank'], 1)
+
+        for url, params in urls:
+            response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code, 304)
+        UserEarntCoins.objects.create(user=self.user1, score=5)
+        for url, params in urls:
+            response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code, 200)
+
+    def test_version_bumped_by_another_process(self):
+        """Test a change recorded by another process is seen without its cache"""
+        get_ranking()
+        # another process changes the scores and the version, but cannot reach
+        # this process's cache
+        UserScore.objects.filter(user=self.user1).update(score=500)
+        LeaderboardVersion.objects.filter(pk=1).update(version="bumped-elsewhere")
+        self.assertEqual(get_ranking()['ranked_users'][0]['username'], 'user1')
+
+    def test_only_shown_changes_invalidate(self):
+        """Test saves that do not change what the leaderboard shows keep it cached"""
+        version = get_version()
+        user = User.objects.get(pk=self.user1.pk)
+        user.save()
+        user.profile.bio = "hello"
+        user.profile.save()
+        self.assertEqual(get_version(), version)
+
+        user.profile.profile_picture = "new.png"
+        user.profile.save()
+        self.assertNotEqual(get_version(), version)
+        version = get_version()
+        user.username = "renamed"
+        user.save()
+        self.assertNotEqual(get_version(), version)
+
+    def test_periods_cached_separately(self):
+        """Test each period has its own cached ranking"""
+        get_ranking()
+        self.assertIsNotNone(cache.get(_payload_key(None)))
+        self.assertIsNone(cache.get(_payload_key(UserScoreBucket.DAILY)))
+        self.assertEqual(get_ranking(UserScoreBucket.DAILY)['ranked_users'],
+                         build_ranking(UserScoreBucket.DAILY)['ranked_users'])
+
+
+    def test_period_rolls_over_without_coin_events(self):
+        """Test a new day is ranked from its own bucket without a version bump"""
+        today = date(2025, 3, 20)
+        tomorrow = today + timedelta(days=1)
+        UserScoreBucket.objects.create(user=self.user1, period=UserScoreBucket.DAILY,
+                                       start=today, score=10)
+        UserScoreBucket.objects.create(user=self.user2, period=UserScoreBucket.DAILY,
+                                       start=tomorrow, score=20)
+
+        with patch('django.utils.timezone.localdate', return_value=today):
+            before = get_ranking(UserScoreBucket.DAILY)
+            self.assertEqual([u['username'] for u in before['ranked_users']], ['user1'])
+        with patch('django.utils.timezone.localdate', return_value=tomorrow):
+            after = get_ranking(UserScoreBucket.DAILY)
+            self.assertEqual([u['username'] for u in after['ranked_users']], ['user2'])
+            response = self.client.get(reverse('get_ranked_users'), {'period': 'daily'},
+                                       HTTP_IF_NONE_MATCH=f'"{before["etag"]}-{self.user1.id}"')
+        self.assertNotEqual(before['etag'], after['etag'])
+        self.assertEqual(response.status_code, 200)
+
+
+class GardenTooltipCacheTests(TestCase):
+    """
+    Tests for the cached, versioned garden tooltip.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        # thumbnails are written under MEDIA_ROOT, so keep them out of the real one
+        self.media_root = tempfile.mkdtemp()
+        self.media = override_settings(MEDIA_ROOT=self.media_root)
+        self.media.enable()
+        self.user = provision_users([User(username='gardener')])[0]
+        self.garden = garden.objects.get(userID=self.user)
+        self.url = reverse('get_tooltip_template')
+
+    def tearDown(self):
+        self.media.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_repeat_hover_served_from_cache(self):
+        """Test a second hover renders nothing and only looks up the garden"""
+        first = self.client.get(self.url, {'username': 'gardener'})
+        with self.assertNumQueries(1):
+            second = self.client.get(self.url, {'username': 'gardener'})
+        self.assertIsNone(second.context)
+        self.assertEqual(first.content, second.content)
+
+    def test_not_modified(self):
+        """Test a matching If-None-Match gets a 304"""
+        etag = self.client.get(self.url, {'username': 'gardener'}).headers['ETag']
+        response = self.client.get(self.url, {'username': 'gardener'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_version_bump_rerenders(self):
+        """Test changing the garden gives a new ETag and a fresh render"""
+        etag = self.client.get(self.url, {'username': 'gardener'}).headers['ETag']
+        self.garden.bump_version()
+        response = self.client.get(self.url, {'username': 'gardener'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertTemplateUsed(response, 'leaderboard/garden_tool_tip.html')
+
+    def test_owner_change_rerenders(self):
+        """Test renaming the owner or changing their picture gives a new ETag and render"""
+        etag = self.client.get(self.url, {'username': 'gardener'}).headers['ETag']
+        self.user.profile.profile_picture = 'new.png'
+        self.user.profile.save()
+        response = self.client.get(self.url, {'username': 'gardener'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+        self.user.username = 'renamed'
+        self.user.save()
+        response = self.client.get(self.url, {'username': 'renamed'})
+        self.assertContains(response, "renamed's Garden")
+
+    def test_unknown_user(self):
+        """Test a username without a garden returns 404"""
+        response = self.client.get(self.url, {'username': 'nobody'})
+        self.assertEqual(response.status_code, 404)
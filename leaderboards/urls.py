@@ -7,6 +7,8 @@ including the main leaderboard view, data retrieval endpoints, and tooltip templ
 URL Patterns:
     - /: Main leaderboard page
     - /getleaderboarddata/: API endpoint for ranked user data
+    - /page/: Paginated top, around-me and rank lookup endpoint
+    - /getfriendsleaderboarddata/: Ranked data for the user and their friends
     - /get-tooltip-template/: Endpoint for garden tooltip templates
 
 Author:
@@ -20,5 +22,8 @@ from . import views
 urlpatterns = [
     path('', views.leaderboard, name='leaderboard'),
     path('getleaderboarddata/', views.get_ranked_users, name='get_ranked_users'),
+    path('getfriendsleaderboarddata/', views.get_friends_ranked_users,
+         name='get_friends_ranked_users'),
+    path('page/', views.get_leaderboard_page, name='get_leaderboard_page'),
     path('get-tooltip-template/', views.get_tooltip_template, name='get_tooltip_template'),
 ]
@@ -0,0 +1,347 @@
+"""
+Utility functions for the leaderboard.
+
+This module keeps the denormalised UserScore totals and UserScoreBucket
+rollups up to date and provides the ranked querysets the leaderboard views
+are built from. Features:
+    - Incrementing a user's running total when coins are earned
+    - Rolling earned coins up into daily, weekly and monthly buckets
+    - Ranking users with a single indexed query, all time or per period
+    - Keyset pagination, rank lookups and windows around a user
+    - Rankings restricted to a user and their friends
+    - Serialising ranked rows into the JSON shape used by leaderboard.js
+
+Author:
+    Lewis Farley (lf507@exeter.ac.uk)
+"""
+
+import base64
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from Accounts.models import Friends
+from .models import UserScore, UserScoreBucket
+
+
+def _increment(model, amount, **lookup):
+    """
+    Add to the score of the row matching lookup, creating it if it is missing.
+
+    The increment is done with an F() expression so concurrent awards cannot
+    overwrite each other.
+    """
+    if model.objects.filter(**lookup).update(score=F("score") + amount):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(score=amount, **lookup)
+    except IntegrityError:
+        # another request created the row first, so just add to it
+        model.objects.filter(**lookup).update(score=F("score") + amount)
+
+
+def add_to_score(user_id, amount):
+    """
+    Add coins to a user's running total, creating the row if it is missing.
+
+    Args:
+        user_id (int): The id of the user who earned the coins.
+        amount (int): The number of coins earned.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    _increment(UserScore, amount, user_id=user_id)
+
+
+def bucket_start(period, day):
+    """
+    Get the first day of the bucket that a date falls into.
+
+    Weeks start on a Monday and months on the 1st.
+
+    Args:
+        period (str): One of the UserScoreBucket periods.
+        day (date): The date to find the bucket for.
+
+    Returns:
+        date: The start date of the bucket.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    if period == UserScoreBucket.WEEKLY:
+        return day - timedelta(days=day.weekday())
+    if period == UserScoreBucket.MONTHLY:
+        return day.replace(day=1)
+    return day
+
+
+def add_to_buckets(user_id, amount, earnt_on):
+    """
+    Add coins to the daily, weekly and monthly buckets they were earned in.
+
+    Args:
+        user_id (int): The id of the user who earned the coins.
+        amount (int): The number of coins earned.
+        earnt_on (datetime): When the coins were earned.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    day = timezone.localdate(earnt_on)
+    for period, _ in UserScoreBucket.PERIODS:
+        _increment(UserScoreBucket, amount, user_id=user_id,
+                   period=period, start=bucket_start(period, day))
+
+
+def get_ranked_scores(period=None):
+    """
+    Get users' scores ordered from highest to lowest.
+
+    With no period this ranks everyone on their all time total. With a period
+    only the users who earned coins in the current day, week or month are
+    ranked, read from that bucket alone.
+
+    Admin accounts are excluded, ties are broken by user id and the user and
+    profile are joined in so serialising the rows needs no further queries.
+
+    Args:
+        period (str): Optional UserScoreBucket period to rank within.
+
+    Returns:
+        QuerySet: Ordered UserScore or UserScoreBucket instances.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    if period is None:
+        scores = UserScore.objects.all()
+    else:
+        scores = UserScoreBucket.objects.filter(
+            period=period, start=bucket_start(period, timezone.localdate()))
+    return (scores.exclude(user__username="admin")
+            .select_related("user__profile")
+            .order_by("-score", "user_id"))
+
+
+def get_friend_ids(user):
+    """
+    Get the ids of a user and everyone they are friends with.
+
+    Friendships are stored once in either direction, so both columns of
+    Friends are matched, in a single query.
+
+    Args:
+        user (User): The user whose friends are wanted.
+
+    Returns:
+        set: The user's id and their friends' ids.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    pairs = Friends.objects.filter(Q(userID1=user) | Q(userID2=user))\
+        .values_list("userID1_id", "userID2_id")
+    return {user.id, *(user_id for pair in pairs for user_id in pair)}
+
+
+def get_friends_scores(user, period=None):
+    """
+    Get the ranked scores of a user and everyone they are friends with.
+
+    The friend ids are read with get_friend_ids and the ranking is filtered
+    to them, so only the friends' rows are loaded.
+
+    Args:
+        user (User): The user whose friends are ranked.
+        period (str): Optional UserScoreBucket period to rank within.
+
+    Returns:
+        QuerySet: Ordered UserScore or UserScoreBucket instances.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    return get_ranked_scores(period).filter(user_id__in=get_friend_ids(user))
+
+
+def serialise_score(row, rank=None):
+    """
+    Convert a ranked row into the dictionary sent to leaderboard.js.
+
+    Args:
+        row (UserScore): The ranked row, with user and profile joined in.
+        rank (int): Optional rank of the row, included when given.
+
+    Returns:
+        dict: The username, profile picture url and score of the row.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    data = {
+        'username': row.user.username,
+        'pfp_url': "/media/pfps/" + row.user.profile.profile_picture,
+        'score': row.score
+    }
+    if rank is not None:
+        data['rank'] = rank
+    return data
+
+
+def _ahead_of(score, user_id):
+    """Filter for the rows ranked above a score and user id."""
+    return Q(score__gt=score) | Q(score=score, user_id__lt=user_id)
+
+
+def _behind(score, user_id):
+    """Filter for the rows ranked below a score and user id."""
+    return Q(score__lt=score) | Q(score=score, user_id__gt=user_id)
+
+
+def get_rank(row, period=None):
+    """
+    Get the rank of a row without loading the rows above it.
+
+    The rank is one more than the number of rows ahead of it, counted in the
+    database over the (score, user) index. The count still walks the index
+    entries ahead of the row, but it reads no rows and sends nothing back
+    but the number.
+
+    Args:
+        row (UserScore): The row to rank.
+        period (str): Optional UserScoreBucket period the row belongs to.
+
+    Returns:
+        int: The 1-based rank of the row.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    return get_ranked_scores(period).filter(_ahead_of(row.score, row.user_id)).count() + 1
+
+
+def get_score_row(user, period=None):
+    """
+    Get a user's ranked row, or None if they are not on the leaderboard.
+
+    Args:
+        user (User): The user to look up.
+        period (str): Optional UserScoreBucket period to look in.
+
+    Returns:
+        UserScore: The user's row with user and profile joined in, or None.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    return get_ranked_scores(period).filter(user=user).first()
+
+
+def encode_cursor(score, user_id, rank):
+    """
+    Encode the position after a row as an opaque pagination cursor.
+
+    Args:
+        score (int): The score of the last row of a page.
+        user_id (int): The user id of that row.
+        rank (int): The rank of that row.
+
+    Returns:
+        str: The cursor to request the next page with.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    raw = f"{score}:{user_id}:{rank}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor made by encode_cursor.
+
+    Args:
+        cursor (str): The cursor sent by the client.
+
+    Returns:
+        tuple: The score, user id and rank of the last row of the previous page.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    try:
+        score, user_id, rank = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return int(score), int(user_id), int(rank)
+    except (TypeError, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def get_top_page(limit, cursor=None, period=None):
+    """
+    Get one page of the leaderboard using keyset pagination.
+
+    Each page continues from the score and user id of the last row of the
+    previous page, so the cost of a page does not grow with how far down the
+    leaderboard it is.
+
+    Args:
+        limit (int): The number of rows in the page.
+        cursor (str): Optional cursor returned with the previous page.
+        period (str): Optional UserScoreBucket period to rank within.
+
+    Returns:
+        tuple: A list of (rank, row) pairs and the cursor for the next page,
+            which is None on the last page.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    scores = get_ranked_scores(period)
+    rank = 0
+    if cursor:
+        score, user_id, rank = decode_cursor(cursor)
+        scores = scores.filter(_behind(score, user_id))
+    rows = list(scores[:limit + 1])
+    page = [(rank + i + 1, row) for i, row in enumerate(rows[:limit])]
+    next_cursor = None
+    if len(rows) > limit:
+        last_rank, last = page[-1]
+        next_cursor = encode_cursor(last.score, last.user_id, last_rank)
+    return page, next_cursor
+
+
+def get_page_around(row, window, period=None):
+    """
+    Get the rows ranked just above and below a row, including the row itself.
+
+    Both sides are read with keyset queries from the row's score and user
+    id, and the first rank is counted with get_rank.
+
+    Args:
+        row (UserScore): The row to centre the page on.
+        window (int): How many rows to include either side.
+        period (str): Optional UserScoreBucket period to rank within.
+
+    Returns:
+        list: (rank, row) pairs ordered from highest rank to lowest.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    scores = get_ranked_scores(period)
+    above = list(scores.filter(_ahead_of(row.score, row.user_id))
+                 .order_by("score", "-user_id")[:window])[::-1]
+    below = list(scores.filter(_behind(row.score, row.user_id))[:window])
+    first_rank = get_rank(row, period) - len(above)
+    return [(first_rank + i, r) for i, r in enumerate(above + [row] + below)]
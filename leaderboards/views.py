@@ -6,6 +6,9 @@ including displaying the leaderboard page, retrieving ranked user data, and
 generating garden tooltips for user profiles. It provides functionality for:
     - Rendering the main leaderboard page
     - Calculating and returning user rankings based on earned coins
+    - Paginated top, around-me and rank lookups of the rankings, each
+      cached on its own
+    - Rankings of a user against their friends
     - Displaying garden information in tooltips
 
 All views in this module require user authentication except where noted.
@@ -14,14 +17,89 @@ Author:
     Lewis Farley (lf507@exeter.ac.uk)
 """
 
+import hashlib
+
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.models import User
-from django.http import JsonResponse
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 
 from Garden.models import garden
-from .models import UserEarntCoins
+from Garden.utils import get_garden_grid, get_garden_thumbnail
+from .cache import get_cached_page, get_ranking, get_version
+from .models import UserScoreBucket
+from .utils import (decode_cursor, encode_cursor, get_friends_scores, get_page_around,
+                    get_rank, get_ranked_scores, get_score_row, get_top_page,
+                    serialise_score)
+
+
+def _parse_period(request):
+    """
+    Read the optional 'period' GET parameter shared by the leaderboard endpoints.
+
+    Returns:
+        str: The UserScoreBucket period, or None for the all time leaderboard.
+
+    Raises:
+        ValueError: If the period is not recognised.
+    """
+    period = request.GET.get('period', 'all')
+    if period == 'all':
+        return None
+    if period not in dict(UserScoreBucket.PERIODS):
+        raise ValueError('Invalid period')
+    return period
+
+
+def _parse_count(request, name, default):
+    """
+    Read a positive integer GET parameter, capped at LEADERBOARD_MAX_PAGE_SIZE.
+
+    Raises:
+        ValueError: If the parameter is not a positive integer.
+    """
+    try:
+        value = int(request.GET.get(name, default))
+    except ValueError as e:
+        raise ValueError(f'Invalid {name}') from e
+    if value < 1:
+        raise ValueError(f'Invalid {name}')
+    return min(value, settings.LEADERBOARD_MAX_PAGE_SIZE)
+
+
+def _conditional_json(request, data):
+    """
+    Build a JSON response with an ETag hashed from its content, answering a
+    matching If-None-Match with a 304 Not Modified.
+
+    Returns:
+        HttpResponse: The JSON response, or a 304 without a body.
+    """
+    response = JsonResponse(data)
+    etag = quote_etag(hashlib.md5(response.content, usedforsecurity=False).hexdigest())
+    response = get_conditional_response(request, etag=etag) or response
+    response.headers['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _current_user_data(ranking, user):
+    """
+    Get the username, score and rank of a user from a cached ranking.
+
+    Returns:
+        dict: The user's details, with no rank if they are not ranked.
+    """
+    rank, score = ranking['ranks'].get(user.id, (None, 0))
+    return {
+        'username': user.username,
+        'score': score,
+        'rank': rank
+    }
 
 
 # Create your views here.
@@ -46,8 +124,15 @@ def get_ranked_users(request):
     """
     Get the ranked users for the leaderboard.
 
-    Calculates and returns user rankings based on their earned coins,
-    excluding admin users. Also includes the current user's rank and score.
+    Returns user rankings based on their earned coins, read from the
+    UserScore running totals, excluding admin users. Also includes the
+    current user's rank and score. An optional 'period' GET parameter of
+    daily, weekly or monthly ranks on the coins earned in the current day,
+    week or month instead, read from the UserScoreBucket rollups.
+
+    The ranking is shared between requests through leaderboards.cache, so a
+    burst of requests costs one computation. Responses carry an ETag and a
+    matching If-None-Match gets a 304 Not Modified.
 
     Args:
         request: The HTTP request object.
@@ -63,37 +148,158 @@ def get_ranked_users(request):
         Lewis Farley (lf507@exeter.ac.uk)
     """
     current_user = request.user
-    users = User.objects.all()
-    coin_map = {}
+    try:
+        period = _parse_period(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    ranking = get_ranking(period)
+    etag = quote_etag(f"{ranking['etag']}-{current_user.id}")
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse({'rankedUsers': ranking['ranked_users'],
+                                 'MEDIA_URL': settings.MEDIA_URL,
+                                 'current_user_data': _current_user_data(ranking, current_user)})
+    response.headers['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required
+def get_friends_ranked_users(request):
+    """
+    Get the current user ranked against their friends.
 
-    # Loop through all users and sum their earned coins
-    for user in users:
-        if not user.username == "admin":
-                coins_earnt = sum([i.score for i in UserEarntCoins.objects.filter(user=user)])
-                coin_map[user] = coins_earnt  # Map user to their total score
+    The friend ids are read in one query, matching both directions of the
+    Friends table, and only their scores are loaded from the ranking for the
+    period. Accepts the same 'period' parameter as get_ranked_users and
+    answers a matching If-None-Match with a 304.
 
-    # Sort the users based on their earned coins in descending order
-    sorted_users = sorted(coin_map.items(), key=lambda x: x[1], reverse=True)
+    Args:
+        request: The HTTP request object.
+
+    Returns:
+        JsonResponse: The same fields as get_ranked_users, restricted to the
+            current user and their friends.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    try:
+        period = _parse_period(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
 
-    # Prepare data for the top 3 users
     ranked_users = []
-    for i,(user,score) in enumerate(sorted_users):
-        ranked_users.append({
-            'username': user.username,
-            'pfp_url': "/media/pfps/" +user.profile.profile_picture,
-            'score': score
-        })
-    for i,u in enumerate(ranked_users):
-        if u['username'] == current_user.username:
-            current_user_rank = i+1
-            break
     current_user_data = {
-        'username': current_user.username,
-        'score': coin_map[current_user],
-        'rank': current_user_rank
+        'username': request.user.username,
+        'score': 0,
+        'rank': None
     }
-    # Return the data as a JSON response
-    return JsonResponse({'rankedUsers': ranked_users,'MEDIA_URL': settings.MEDIA_URL,'current_user_data':current_user_data})
+    for i, row in enumerate(get_friends_scores(request.user, period)):
+        ranked_users.append(serialise_score(row))
+        if row.user_id == request.user.id:
+            current_user_data['score'] = row.score
+            current_user_data['rank'] = i + 1
+    return _conditional_json(request, {'rankedUsers': ranked_users,
+                                       'MEDIA_URL': settings.MEDIA_URL,
+                                       'current_user_data': current_user_data})
+
+
+def _user_rank(username, period, version):
+    """
+    Get the score and rank of a user, cached until the leaderboard changes.
+
+    Returns:
+        dict: The username, score and rank, or None if the user is not ranked.
+    """
+    def build():
+        row = get_ranked_scores(period).filter(user__username=username).first()
+        if row is None:
+            return None
+        return {'username': username, 'score': row.score, 'rank': get_rank(row, period)}
+    # usernames are hashed as they come from the query string
+    name = hashlib.md5(username.encode(), usedforsecurity=False).hexdigest()
+    return get_cached_page(f"rank:{name}", period, build, version)
+
+
+@login_required
+def get_leaderboard_page(request):
+    """
+    Get one page of the leaderboard instead of every ranked user.
+
+    The 'mode' GET parameter selects what is returned:
+        - top: the first 'limit' users, or the page after 'cursor'
+        - around: the 'window' users either side of the current user
+        - rank: the score and rank of 'username' (default the current user)
+
+    Pages are read with keyset pagination from the score index, so a page
+    only loads the rows it returns, however far down the leaderboard it is.
+    Ranks are counted in the database from the same index rather than by
+    loading the users above. Each page and rank is cached on its own through
+    leaderboards.cache until the leaderboard next changes, so a burst of
+    requests for the same page costs one computation. Every mode accepts the
+    same 'period' parameter as get_ranked_users, and a matching
+    If-None-Match gets a 304.
+
+    Args:
+        request: The HTTP request object.
+
+    Returns:
+        JsonResponse: For top and around, the same fields as get_ranked_users
+            with a rank on each user and a 'next_cursor' for the following page
+            (None when there are no more). For rank, a 'user_data' dictionary
+            with the username, score and rank.
+
+    Author:
+        Lewis Farley (lf507@exeter.ac.uk)
+    """
+    mode = request.GET.get('mode', 'top')
+    try:
+        period = _parse_period(request)
+        version = get_version()
+        if mode == 'rank':
+            user_data = _user_rank(request.GET.get('username', request.user.username),
+                                   period, version)
+            if user_data is None:
+                return JsonResponse({'error': 'User not ranked'}, status=404)
+            return _conditional_json(request, {'user_data': user_data})
+
+        if mode == 'top':
+            limit = _parse_count(request, 'limit', settings.LEADERBOARD_PAGE_SIZE)
+            cursor = request.GET.get('cursor')
+            # the cursor is decoded and encoded again so the key is always clean
+            key = encode_cursor(*decode_cursor(cursor)) if cursor else 'first'
+
+            def build():
+                page, next_cursor = get_top_page(limit, cursor, period)
+                return [serialise_score(row, rank) for rank, row in page], next_cursor
+            ranked_users, next_cursor = get_cached_page(f"top:{limit}:{key}", period,
+                                                        build, version)
+        elif mode == 'around':
+            window = _parse_count(request, 'window', settings.LEADERBOARD_AROUND_WINDOW)
+
+            def build():
+                row = get_score_row(request.user, period)
+                page = get_page_around(row, window, period) if row else []
+                return [serialise_score(row, rank) for rank, row in page]
+            ranked_users = get_cached_page(f"around:{request.user.id}:{window}", period,
+                                           build, version)
+            next_cursor = None
+        else:
+            return JsonResponse({'error': 'Invalid mode'}, status=400)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    current_user_data = _user_rank(request.user.username, period, version) or {
+        'username': request.user.username,
+        'score': 0,
+        'rank': None
+    }
+    return _conditional_json(request, {'rankedUsers': ranked_users,
+                                       'MEDIA_URL': settings.MEDIA_URL,
+                                       'current_user_data': current_user_data,
+                                       'next_cursor': next_cursor})
 
 
 def get_tooltip_template(request):
@@ -101,7 +307,12 @@ def get_tooltip_template(request):
     Get the garden tooltip template for a specific user.
 
     Retrieves and processes garden data for the specified user to display
-    in a tooltip overlay.
+    in a tooltip overlay. The rendered HTML is cached under the garden's
+    version, which changes whenever a card is placed or removed, and under
+    the owner's username and profile picture, so renaming the owner or
+    changing their picture is not hidden behind an old render. The same
+    parts are sent as an ETag so repeated hovers can be answered with a
+    304 Not Modified.
 
     Args:
         request: The HTTP request object containing a 'username' GET parameter.
@@ -110,17 +321,38 @@ def get_tooltip_template(request):
         HttpResponse: The rendered garden tooltip template with context including:
             - username: The requested user's username
             - squares: 2D list of processed garden squares
+            - thumbnail_url: URL of a single image of the garden
             - MEDIA_URL: The media URL from settings
+        JsonResponse: Error message with status 404 if the user has no garden.
 
     Author:
         Lewis Farley (lf507@exeter.ac.uk)
     """
     username = request.GET.get("username", None)  # Default if no username is provided
-    g = garden.objects.get(userID__username=username)
-    squares = g.gardensquare_set.all()
-    processed_squares = [[squares[i * g.size + j] for j in range(g.size)] for i in range(g.size)]
-    user = request.user
-    user = User.objects.get(id=user.id)
-    return render(request, "leaderboard/garden_tool_tip.html", {"username": username,
-                                                      "squares": processed_squares,
-                                                      "MEDIA_URL": settings.MEDIA_URL,})
+    try:
+        g = garden.objects.select_related("userID__profile")\
+            .only("id", "size", "version", "userID__username",
+                  "userID__profile__profile_picture")\
+            .get(userID__username=username)
+    except garden.DoesNotExist:
+        return JsonResponse({'error': 'Garden not found'}, status=404)
+
+    owner = hashlib.md5(f"{g.userID.username}:{g.userID.profile.profile_picture}".encode(),
+                        usedforsecurity=False).hexdigest()
+    etag = quote_etag(f"{g.id}-{g.version}-{owner}")
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        key = f"garden_tooltip:{g.id}:{g.version}:{owner}"
+        html = cache.get(key)
+        if html is None:
+            squares = get_garden_grid(g)
+            html = render_to_string("leaderboard/garden_tool_tip.html",
+                                    {"username": username,
+                                     "squares": squares,
+                                     "thumbnail_url": get_garden_thumbnail(squares),
+                                     "MEDIA_URL": settings.MEDIA_URL,})
+            cache.set(key, html, settings.GARDEN_TOOLTIP_CACHE_TIMEOUT.total_seconds())
+        response = HttpResponse(html)
+    response.headers['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
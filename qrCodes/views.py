@@ -15,6 +15,9 @@ from django.contrib.auth.decorators import login_required, permission_required
 from django.shortcuts import render, redirect
 from django.utils import timezone
 
+from Accounts.utils import award_coins
+from leaderboards.models import UserEarntCoins
+
 from .forms import WaterFountainForm
 from .models import waterFountain, drinkEvent
 
@@ -40,8 +43,7 @@ def scan_code(request):
             return redirect( "EcoWorld:challenge")
     # More than 20 minutes have passed
     drinkEvent.objects.create(user=user,fountain=waterFountain.objects.get(id=fountain_id))
-    user.profile.number_of_coins += settings.VALUE_OF_DRINK
-    user.profile.save()
+    award_coins(user, settings.VALUE_OF_DRINK, UserEarntCoins.DRINK)
     
     return render(request, 'drink_registered.html')
 